@@ -0,0 +1,92 @@
+"""
+Compare the ElementTree path of GazeboBlenderModel (load the whole model.sdf, iterate over all its
+elements, write the whole tree back) with sdf_stream (iterparse of the meshes, text edition of the
+uris and scales) on a generated world-like .sdf file with many links.
+Prints the time and the peak memory of each method as json.
+"""
+# IMPORTS
+import os
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from blender_gazebo.gazebo_blender_model import load_xml_file
+from blender_gazebo.sdf_stream import iter_sdf_meshes, SdfTextEditor
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_links", type=int, default=20000)
+    parser.add_argument("--repetitions", type=int, default=3)
+    return parser.parse_args()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_sdf(path, n_links):
+    """An .sdf with n_links links, each one with a visual and a collision with a mesh and some other elements"""
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0"?>\n<sdf version="1.6">\n  <!-- generated for the benchmark -->\n  <model name="world">\n')
+        for n in range(n_links):
+            f.write(f'    <link name="link_{n}">\n      <pose>{n} 0 0 0 0 0</pose>\n')
+            for kind in ("visual", "collision"):
+                f.write(f'      <{kind} name="{kind}_{n}">\n        <geometry>\n          <mesh>\n'
+                        f'            <uri>model://world/meshes/tile_{n % 100}.obj</uri>\n'
+                        f'            <scale>1 1 1</scale>\n          </mesh>\n        </geometry>\n      </{kind}>\n')
+            f.write('    </link>\n')
+        f.write('  </model>\n</sdf>\n')
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def measure(function, repetitions):
+    """Best time of the repetitions, and the peak memory of one of them"""
+    times = list()
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(times), "peak_mb": peak / 2**20}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def extract_with_tree(path):
+    return [(mesh.find("uri").text, mesh.find("scale").text) for mesh in load_xml_file(path).iter() if mesh.tag == "mesh"]
+
+def extract_with_stream(path):
+    return [(reference.uri, reference.scale) for reference in iter_sdf_meshes(path)]
+
+def edit_with_tree(path, output_path):
+    tree = load_xml_file(path)
+    for mesh in tree.iter("mesh"):
+        if mesh.find("uri").text.endswith("tile_0.obj"):
+            mesh.find("scale").text = "2 2 2"
+    tree.write(output_path)
+
+def edit_with_text(path, output_path):
+    editor = SdfTextEditor(path)
+    editor.replace_scale("model://world/meshes/tile_0.obj", "2 2 2")
+    editor.save(output_path)
+
+
+def main():
+    args = get_args()
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "model.sdf")
+        output_path = os.path.join(folder, "edited.sdf")
+        write_sdf(path, args.n_links)
+        assert len(extract_with_tree(path)) == len(extract_with_stream(path))
+        results = {
+            "n_links": args.n_links,
+            "file_mb": os.path.getsize(path) / 2**20,
+            "extract_tree": measure(lambda: extract_with_tree(path), args.repetitions),
+            "extract_stream": measure(lambda: extract_with_stream(path), args.repetitions),
+            "edit_tree": measure(lambda: edit_with_tree(path, output_path), args.repetitions),
+            "edit_text": measure(lambda: edit_with_text(path, output_path), args.repetitions),
+        }
+    print(json.dumps(results, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark suite of the package. A synthetic library is generated (see synthetic_library.py) and the
+main operations are timed on it: loading the models, copying them, backing them up and restoring
+them, reading and writing the recorded points and the selection helpers.
+The results are printed (or saved with --output) as json, so that they can be compared between versions.
+The selection helpers of blender_functions are timed with the backend of mesh_backends.get_backend,
+bpy inside Blender and numpy otherwise (see the BLENDER_GAZEBO_BACKEND environment variable).
+"""
+# IMPORTS
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+from blender_gazebo.gazebo_blender_model import models_from_folder, copy_model_with_different_name, BlenderMeshInfo
+from blender_gazebo.backup_store import BackupStore
+from blender_gazebo.library_backup import backup_models, restore_models
+from blender_gazebo.point_sets import PointSet, combine_selections
+from blender_gazebo.mesh_backends import get_backend
+import blender_gazebo.blender_functions as blender
+from synthetic_library import generate_library, malform_library
+# GLOBAL VARIABLES
+SCHEMA_VERSION = 1
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", type=int, default=50, help="Number of models of the library")
+    parser.add_argument("--meshes", type=int, default=2, help="Meshes per model")
+    parser.add_argument("--vertices", type=int, default=10000, help="Vertices per mesh")
+    parser.add_argument("--format", default=".obj", choices=[".obj", ".dae"])
+    parser.add_argument("--duplicates", type=int, default=2, help="Visuals and collisions that reference each mesh")
+    parser.add_argument("--malformed", type=float, default=0.2, help="Fraction of model.sdf files with an empty first line")
+    parser.add_argument("--repetitions", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--folder", default=None, help="Folder for the library, a temporary one if not given")
+    parser.add_argument("--output", "-o", default=None, help="Json file for the results, printed if not given")
+    return parser.parse_known_args()[0]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def measure(function, repetitions, setup=None):
+    """Time the function, calling setup (not timed) before each repetition"""
+    times = list()
+    for _ in range(repetitions):
+        if not setup is None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"min_seconds": min(times), "mean_seconds": sum(times) / len(times), "repetitions": repetitions}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def environment():
+    try:
+        from importlib.metadata import version
+        package_version = version("blender_gazebo")
+    except Exception:
+        package_version = None
+    return {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "package_version": package_version}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def bench_loading(folder, args):
+    results = dict()
+    results["models_from_folder_with_fixes"] = measure(
+        lambda: models_from_folder(folder), args.repetitions, setup=lambda: malform_library(folder, args.malformed))
+    results["models_from_folder"] = measure(lambda: models_from_folder(folder), args.repetitions)
+    results["models_from_folder_lazy"] = measure(lambda: models_from_folder(folder, lazy=True), args.repetitions)
+    results["models_from_folder_threads"] = measure(
+        lambda: models_from_folder(folder, workers=args.workers), args.repetitions)
+    results["models_from_folder_processes"] = measure(
+        lambda: models_from_folder(folder, workers=args.workers, executor="process"), args.repetitions)
+    return results
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def bench_copies(model, work_folder, args):
+    destination = os.path.join(work_folder, "copies")
+    return {
+        "copy_model_with_different_name": measure(
+            lambda: copy_model_with_different_name(model, model.name + "_copy", destination), args.repetitions),
+        "copy_model_with_different_name_linked": measure(
+            lambda: copy_model_with_different_name(model, model.name + "_link", destination, link_meshes=True),
+            args.repetitions),
+    }
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def bench_backups(models, work_folder, args):
+    store = BackupStore(os.path.join(work_folder, "store"))
+    results = {
+        "create_backup": measure(lambda: [model.create_backup() for model in models], args.repetitions),
+        "restore_from_backup": measure(lambda: [model.restore_from_backup() for model in models], args.repetitions),
+        "create_backup_store": measure(lambda: [model.create_backup(store=store) for model in models], args.repetitions),
+        "restore_from_backup_store": measure(
+            lambda: [model.restore_from_backup(store=store) for model in models], args.repetitions),
+        "backup_models": measure(lambda: backup_models(models, workers=args.workers), args.repetitions),
+        "restore_models": measure(lambda: restore_models(models, workers=args.workers), args.repetitions),
+        "backup_models_store": measure(lambda: backup_models(models, store=store, workers=args.workers), args.repetitions),
+    }
+    store.close()
+    return results
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def bench_mesh_info(mesh, args):
+    rng = np.random.default_rng(0)
+    n_vertices = mesh.load_geometry().n_vertices
+    points = {"Tile": rng.choice(n_vertices, n_vertices // 2, replace=False)}
+    results = dict()
+    for file_format in ("npz", "json"):
+        info = BlenderMeshInfo(mesh, file_format=file_format)
+        info.set_new_ground_points(points)
+        info.set_new_upper_points(points)
+        results[f"mesh_info_write_{file_format}"] = measure(info.write_data_to_file, args.repetitions)
+
+        def read():
+            data = BlenderMeshInfo(mesh, file_format=file_format).data
+            return [len(data[points_type]["Tile"]) for points_type in data]
+        results[f"mesh_info_read_{file_format}"] = measure(read, args.repetitions)
+    return results
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def bench_selections(mesh, args):
+    geometry = mesh.load_geometry()
+    rng = np.random.default_rng(1)
+    selection_a = {"Tile": rng.choice(geometry.n_vertices, geometry.n_vertices // 2, replace=False)}
+    selection_b = {"Tile": rng.choice(geometry.n_vertices, geometry.n_vertices // 2, replace=False)}
+    set_a, set_b = PointSet(selection_a["Tile"]), PointSet(selection_b["Tile"])
+    results = {
+        "mask_from_selection": measure(lambda: geometry.mask_from_selection(selection_a), args.repetitions),
+        "combine_selections": measure(lambda: combine_selections(selection_a, selection_b), args.repetitions),
+        "point_set_operations": measure(lambda: (set_a | set_b, set_a & set_b, set_a - set_b), args.repetitions),
+    }
+    blender.clear_workspace()
+    blender.load_gazebo_mesh(mesh)
+    results["backend"] = get_backend().name
+    results["select_points"] = measure(lambda: blender.select_points(selection_a), args.repetitions)
+    results["get_selected_points"] = measure(blender.get_selected_points, args.repetitions)
+    results["toogle_selected_points"] = measure(blender.toogle_selected_points, args.repetitions)
+    results["transform"] = measure(lambda: blender.resize((1.0, 1.0, 1.0)), args.repetitions)
+    return results
+
+
+def main():
+    args = get_args()
+    with tempfile.TemporaryDirectory() as work_folder:
+        folder = args.folder if not args.folder is None else os.path.join(work_folder, "library")
+        start = time.perf_counter()
+        generate_library(folder, args.models, args.meshes, args.vertices, args.format, args.duplicates, args.malformed)
+        results = {"schema_version": SCHEMA_VERSION, "timestamp": time.time(), "environment": environment(),
+                   "parameters": vars(args), "generation_seconds": time.perf_counter() - start}
+        results.update(bench_loading(folder, args))
+        models = models_from_folder(folder)
+        results.update(bench_copies(models[0], work_folder, args))
+        results.update(bench_backups(models, work_folder, args))
+        results.update(bench_mesh_info(models[0].meshes[0], args))
+        results.update(bench_selections(models[0].meshes[0], args))
+    text = json.dumps(results, indent=1)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
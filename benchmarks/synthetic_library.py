@@ -0,0 +1,116 @@
+"""
+Generator of synthetic libraries of gazebo models, to benchmark the package on libraries of
+any size without needing the real models. Every model has a model.config, a model.sdf and
+its meshes (grids of the given number of vertices, in .obj or .dae format).
+"""
+# IMPORTS
+import os
+import shutil
+import numpy as np
+from blender_gazebo.mesh_geometry import MeshGeometry
+from blender_gazebo.obj_io import write_obj
+from blender_gazebo.dae_io import write_dae
+# GLOBAL VARIABLES
+CONFIG_TEMPLATE = """<?xml version="1.0"?>
+<model>
+  <name>{name}</name>
+  <version>1.0</version>
+  <sdf version="1.6">model.sdf</sdf>
+  <description>Synthetic model for benchmarks</description>
+</model>
+"""
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def grid_geometry(n_vertices, seed=0, object_name="Tile"):
+    """
+    A square grid of quads with approximately n_vertices vertices (at least 4), with some
+    random height, normals and uvs
+    """
+    side = max(2, int(round(np.sqrt(n_vertices))))
+    rng = np.random.default_rng(seed)
+    x, y = np.meshgrid(np.linspace(-1, 1, side), np.linspace(-1, 1, side), indexing="ij")
+    positions = np.stack([x.ravel(), y.ravel(), rng.uniform(0, 0.1, side * side)], axis=1)
+    uvs = np.stack([(x.ravel() + 1) / 2, (y.ravel() + 1) / 2], axis=1)
+    i, j = np.meshgrid(np.arange(side - 1), np.arange(side - 1), indexing="ij")
+    first = (i * side + j).ravel()
+    face_vertices = np.stack([first, first + side, first + side + 1, first + 1], axis=1).ravel()
+    return MeshGeometry(
+        positions, normals=np.array([[0.0, 0.0, 1.0]]), uvs=uvs,
+        face_vertices=face_vertices, face_uvs=face_vertices, face_normals=np.zeros(len(face_vertices), dtype=np.int64),
+        face_offsets=np.arange(0, len(face_vertices) + 1, 4), statements=[(0, "o " + object_name)])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def model_sdf(name, mesh_files, duplicate_references=1, scale="1 1 1"):
+    """
+    Text of a model.sdf with a link per mesh, each with duplicate_references visuals and
+    collisions referencing the mesh
+    """
+    links = list()
+    for n_mesh, mesh_file in enumerate(mesh_files):
+        elements = list()
+        for n_reference in range(duplicate_references):
+            for kind in ("visual", "collision"):
+                elements.append(
+                    f"      <{kind} name='{kind}_{n_reference}'>\n"
+                    f"        <geometry><mesh><uri>model://{name}/meshes/{mesh_file}</uri><scale>{scale}</scale></mesh></geometry>\n"
+                    f"      </{kind}>\n")
+        links.append(f"    <link name='link_{n_mesh}'>\n{''.join(elements)}    </link>\n")
+    return f"<?xml version='1.0'?>\n<sdf version='1.6'>\n  <model name='{name}'>\n    <static>true</static>\n" \
+           f"{''.join(links)}  </model>\n</sdf>\n"
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_model(folder, name, meshes_per_model=1, n_vertices=1000, mesh_format=".obj",
+                duplicate_references=1, malformed=False, seed=0):
+    """Write a synthetic model into folder/name. Returns the path of the model"""
+    model_path = os.path.join(folder, name)
+    meshes_folder = os.path.join(model_path, "meshes")
+    os.makedirs(meshes_folder, exist_ok=True)
+    mesh_files = list()
+    for n_mesh in range(meshes_per_model):
+        mesh_file = f"mesh_{n_mesh}{mesh_format}"
+        geometry = grid_geometry(n_vertices, seed=[seed, n_mesh])
+        if mesh_format == ".obj":
+            write_obj(geometry, os.path.join(meshes_folder, mesh_file))
+        else:
+            write_dae(geometry, os.path.join(meshes_folder, mesh_file))
+        mesh_files.append(mesh_file)
+    sdf_text = model_sdf(name, mesh_files, duplicate_references)
+    with open(os.path.join(model_path, "model.sdf"), "w") as f:
+        # An empty first line, which try_fix_xml_for_first_line has to remove
+        f.write(("\n" if malformed else "") + sdf_text)
+    with open(os.path.join(model_path, "model.config"), "w") as f:
+        f.write(CONFIG_TEMPLATE.format(name=name))
+    return model_path
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def generate_library(folder, n_models=10, meshes_per_model=1, n_vertices=1000, mesh_format=".obj",
+                     duplicate_references=1, malformed_fraction=0.0, seed=0):
+    """
+    Write a library of n_models synthetic models into folder (which is emptied first):
+    - meshes_per_model: number of mesh files of each model
+    - n_vertices: approximate number of vertices of each mesh
+    - mesh_format: ".obj" or ".dae"
+    - duplicate_references: number of visuals and of collisions that reference each mesh
+    - malformed_fraction: fraction of the models whose model.sdf starts with an empty line
+    Returns the list of the paths of the models
+    """
+    assert mesh_format in (".obj", ".dae"), f"unknown format {mesh_format}"
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    n_malformed = int(round(n_models * malformed_fraction))
+    return [write_model(folder, f"model_{n:05d}", meshes_per_model, n_vertices, mesh_format,
+                        duplicate_references, n < n_malformed, seed=seed * n_models + n) for n in range(n_models)]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def malform_library(folder, malformed_fraction):
+    """Add an empty first line to the model.sdf of the first models of a library generated by generate_library"""
+    names = sorted(name for name in os.listdir(folder) if not name.startswith("."))
+    for name in names[:int(round(len(names) * malformed_fraction))]:
+        sdf_path = os.path.join(folder, name, "model.sdf")
+        with open(sdf_path, "r") as f:
+            text = f.read()
+        if not text.startswith("\n"):
+            with open(sdf_path, "w") as f:
+                f.write("\n" + text)
@@ -6,14 +6,18 @@
 
 import blender_gazebo.blender_functions
 import blender_gazebo.gazebo_blender_model
+import blender_gazebo.browsing_session
 from importlib import reload
 reload(blender_gazebo.blender_functions)
 reload(blender_gazebo.gazebo_blender_model)
 reload(blender_gazebo.blender_functions)
+reload(blender_gazebo.browsing_session)
 import os
 import bpy
 
 FOLDER = "/home/lorenzo/git/subt_gazebo/models/cave_tiles"
+# Set to "next", "previous" or the name of a model
+MOVE = "next"
 blender_gazebo.blender_functions.clear_workspace()
 # Check if the models folder has been changed
 try:
@@ -21,23 +25,18 @@ try:
 except:
     os.environ["models_folder"] = FOLDER
 
-
-# Check if it is the first time that this script has been run in a determined session
-# If it is, set the model number to 0
-
-try:
-    model_number = int(os.environ["model_number"])
-except:
-    model_number = 0
-
-# Load the models from the folder
-models = blender_gazebo.gazebo_blender_model.models_from_folder(FOLDER)
-if model_number >= len(models):
-    model_number = 0
-print(f"Loading model number {model_number}")
-model = models[model_number]
+# The session is kept while Blender is open, with the position in the folder, and
+# it reads the next models in the background while the current one is being edited
+session = blender_gazebo.browsing_session.get_session(os.environ["models_folder"])
+if MOVE == "next":
+    model = session.next()
+elif MOVE == "previous":
+    model = session.previous()
+else:
+    model = session.jump(MOVE)
+print(f"Loading model number {session.cursor}")
 assert isinstance(model, blender_gazebo.gazebo_blender_model.GazeboBlenderModel)
 os.environ["path_to_model"] = model.base_folder
 blender_gazebo.blender_functions.load_gazebo_model(model)
-os.environ["model_number"] = str(model_number + 1)
-bpy.ops.object.mode_set(mode="EDIT")
\ No newline at end of file
+os.environ["model_number"] = str(session.cursor + 1)
+bpy.ops.object.mode_set(mode="EDIT")
@@ -0,0 +1,55 @@
+"""
+This script does not need Blender, it can be run from any python interpreter.
+It will read a folder containing gazebo models, and for every mesh used in a <collision> of a model:
+-   It will simplify the mesh to --ratio times its faces (without moving the vertices of its open borders,
+    so that the tiles still join), and save it next to it as <name>_collision
+-   It will change the <collision> references of the model.sdf to the simplified mesh, the <visual> ones
+    keep the original mesh
+With --lods, a <name>_lod<n> mesh is also saved for each of the ratios given.
+The faces and the error (Hausdorff distance to the original mesh) of every simplified mesh are printed,
+and saved in --report as json.
+The models are processed in parallel, in a pool of processes. With --changed_only, only the models that
+changed since they were last decimated are processed (they are recorded in the .changes.sqlite of the folder).
+"""
+
+import json
+from argparse import ArgumentParser
+from blender_gazebo.decimation import decimate_models
+
+SUBT_MODELS_DIRECTORY = "/home/lorenzo/catkin_ws/src/danilo/subt_gazebo/models_"
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--folder', '-f', default=SUBT_MODELS_DIRECTORY)
+    parser.add_argument('--ratio', '-r', type=float, default=0.1, help="Fraction of the faces kept in the collision meshes")
+    parser.add_argument('--lods', type=float, nargs="*", default=[], help="Fractions of the faces of each level of detail")
+    parser.add_argument('--max_error', type=float, default=None, help="Maximum distance that the surfaces can move, in meters")
+    parser.add_argument('--move_borders', action='store_true', help="Allow the vertices of the open borders of the meshes to move")
+    parser.add_argument('--workers', '-w', type=int, default=None, help="Number of processes, one per cpu if not given")
+    parser.add_argument('--changed_only', action='store_true', help="Only decimate the models changed since they were last decimated")
+    parser.add_argument('--report', default=None, help="Json file where the reports of all the models are saved")
+    args = parser.parse_known_args()[0]
+
+    reports = decimate_models(args.folder, collision_ratio=args.ratio, lod_ratios=args.lods, max_error=args.max_error,
+                              preserve_borders=not args.move_borders, workers=args.workers,
+                              changes=True if args.changed_only else None)
+    faces_before = faces_after = 0
+    for report in reports:
+        for error in report["errors"]:
+            print(f"{report['model']}: {error}")
+        for mesh in report["meshes"]:
+            for stats in [mesh["collision"]] + mesh["lods"]:
+                print(f"{stats['path']}: {stats['faces_before']} -> {stats['faces_after']} faces "
+                      f"({100 * stats['face_reduction']:.1f}% less), hausdorff {stats['hausdorff']:.4g}")
+            faces_before += mesh["collision"]["faces_before"]
+            faces_after += mesh["collision"]["faces_after"]
+    n_meshes = sum(len(report["meshes"]) for report in reports)
+    print(f"Decimated {n_meshes} collision meshes of {len(reports)} models, {faces_before} -> {faces_after} faces")
+    if not args.report is None:
+        with open(args.report, "w") as f:
+            json.dump(reports, f, indent=1, default=str)
+
+
+if __name__ == "__main__":
+    main()
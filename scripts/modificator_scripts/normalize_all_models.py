@@ -1,50 +1,59 @@
 """
-This script should be run from the Blender interpreter.
-It will read a folder containing gazebo models and load them as GazeboModel instances, and make the following changes:
--   If the meshes of the model are saved locally, and are in the .obj format, it will save them as .dae, with the corresponding rotation needed
--   If the meshes of the model are imported into gazebo with a scale, it will scale the meshes and save them already scaled, so that they no longer 
+This script does not need Blender, it can be run from any python interpreter.
+It will read a folder containing gazebo models, and make the following changes to all the meshes of every model:
+-   If the meshes of the model are saved locally, and are in the .obj format, it will save them as .dae, with their materials and
+    the same rotation that the Blender version of this script gave them (the coordinates of the .obj are kept), or rotated
+    from Y up to Z up with --y_up
+-   If the meshes of the model are imported into gazebo with a scale, it will scale the meshes and save them already scaled, so that they no longer
     need to be imported with the scale
+The models are processed in parallel, in a pool of processes.
+The normalized models are recorded in the .manifest.jsonl file of the folder, and the ones that
+have not changed since are skipped when the script is run again (unless --no_resume is given).
+With --watch, the script keeps running after normalizing the folder, and normalizes again the
+models whose files are saved (only the ones that really changed since they were normalized).
 """
 
-from  blender_gazebo.gazebo_blender_model import models_from_folder, GazeboBlenderModel, GazeboModelMesh
-import blender_gazebo.blender_functions as blender
-import bpy
 import os
-import math
+from blender_gazebo.normalization import normalize_models, OBJ_TO_DAE_ROTATION, Y_UP_TO_Z_UP
+from blender_gazebo.change_tracking import ChangeManifest, watch
+from argparse import ArgumentParser
 
 SUBT_MODELS_DIRECTORY = "/home/lorenzo/catkin_ws/src/danilo/subt_gazebo/models_"
-models = models_from_folder(SUBT_MODELS_DIRECTORY)
-
-
-for n, model in enumerate(models):
-    assert isinstance(model, GazeboBlenderModel)
-    try:
-        model_mesh = model.meshes[0]
-        assert isinstance(model_mesh, GazeboModelMesh)
-        blender.clear_workspace()
-        blender.load_gazebo_mesh(model_mesh)
-
-        # If the mesh is scaled when imported to gazebo, set it to a scale of 1.
-        if model_mesh.scale != (1.0, 1.0, 1.0):
-            # Change the scale in blender
-            bpy.ops.transform.resize(value=model_mesh.scale)
-            # Change the scale in the model.sdf document
-            model_mesh.update_scale_in_xml_references("1.0 1.0 1.0")
-            # Save the model.sdf document
-            model.write_sdf_file()
-            # Save the mesh file with the change in scale 
-            blender.save_mesh(model_mesh.path)
-
-        # If the scene is loaded from an .obj, rotate it, export it as a .dae, and modify the reference
-        if str.lower(model_mesh.file_type) == ".obj":
-            new_path = os.path.splitext(model_mesh.path)[0] + ".dae"
-            new_uri = os.path.splitext(model_mesh.uri)[0] + ".dae"
-            # Rotate the mesh
-            bpy.ops.transform.rotate(value=math.pi/2,orient_axis="X",center_override=(0,0,0))
-            # Save the new mesh as dae
-            blender.save_mesh(new_path)
-            # Save the new model.sdf file with the updated reference to the .dae file
-            model_mesh.update_uri_in_xml_references(new_uri)
-            model.write_sdf_file()
-    except Exception as e:
-        print(e)
\ No newline at end of file
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--folder', '-f', default=SUBT_MODELS_DIRECTORY)
+    parser.add_argument('--format', default=".dae", choices=[".dae", ".obj"], help="Format in which the meshes are saved")
+    parser.add_argument('--workers', '-w', type=int, default=None, help="Number of processes, one per cpu if not given")
+    parser.add_argument('--y_up', action='store_true', help="Rotate the .obj meshes from Y up to Z up when converting them to .dae")
+    parser.add_argument('--no_resume', action='store_true', help="Normalize all the models, even the ones in the manifest")
+    parser.add_argument('--watch', action='store_true', help="Keep normalizing the models as their files change")
+    parser.add_argument('--polling', action='store_true', help="Watch the folder by polling instead of with inotify")
+    args = parser.parse_known_args()[0]
+
+    changes = ChangeManifest(args.folder) if args.watch else None
+
+    def normalize(model_names=None):
+        reports = normalize_models(args.folder, target_format=args.format, obj_rotation=Y_UP_TO_Z_UP if args.y_up else OBJ_TO_DAE_ROTATION,
+                                   workers=args.workers, manifest=not args.no_resume, model_names=model_names,
+                                   changes=changes)
+        n_meshes = 0
+        for report in reports:
+            n_meshes += len(report["meshes"])
+            for error in report["errors"]:
+                print(f"{report['model']}: {error}")
+        n_skipped = sum(1 for report in reports if report.get("skipped"))
+        print(f"Normalized {n_meshes} meshes of {len(reports)} models, {n_skipped} skipped as already normalized")
+
+    normalize()
+    if args.watch:
+        print(f"Watching {args.folder}, press Ctrl+C to stop")
+        # The models written by the normalization itself are recorded in changes, so they are skipped
+        watch(args.folder, lambda model_names: normalize([name for name in sorted(model_names)
+                                                          if os.path.isdir(os.path.join(args.folder, name))]),
+              use_inotify=False if args.polling else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,5 +13,15 @@ except:
     raise Exception("The 'path_to_model' environmental variable has not been set")
 
 model = GazeboBlenderModel(path_to_model)
-
-blender.save_mesh(model.meshes[0].path)
\ No newline at end of file
+mesh = model.meshes[0]
+# If the export changed the vertices or their order, the recorded points are moved to the vertices
+# of the saved file that are in the same positions. If only the positions changed they are kept
+old_geometry = mesh.load_geometry()
+blender.save_mesh(mesh.path)
+n_points = mesh.mesh_info.n_points()
+mesh.remap_points(old_geometry)
+if mesh.mesh_info.n_points() < n_points:
+    raise Exception(f"The saved mesh {mesh.path} has its vertices in a different order, and {n_points - mesh.mesh_info.n_points()} "
+                    "of the recorded points were moved so they can not be found by position. The recorded points were not "
+                    "changed, record them again")
+model.flush()
\ No newline at end of file
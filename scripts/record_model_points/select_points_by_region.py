@@ -0,0 +1,59 @@
+"""
+Record the ground or upper points of the meshes of all the models of a folder automatically,
+selecting the vertices by region instead of by hand in Blender. The regions are given in the
+coordinates that the meshes have in Blender (Z up):
+    --below 0.2: the vertices less than 0.2 above the lowest vertex of the mesh
+    --box x0 y0 z0 x1 y1 z1: the vertices inside the box
+With --complement, the points are the vertices outside the region.
+"""
+import os
+import numpy as np
+from argparse import ArgumentParser
+from blender_gazebo.gazebo_blender_model import models_from_folder
+from blender_gazebo.mesh_backends import OBJ_IMPORT_ROTATION
+from blender_gazebo.vertex_index import VertexGrid
+
+SUBT_MODELS_DIRECTORY = "/home/lorenzo/catkin_ws/src/danilo/subt_gazebo/models_"
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--folder', '-f', default=SUBT_MODELS_DIRECTORY)
+    parser.add_argument('--points', choices=["ground", "upper"], default="ground")
+    parser.add_argument('--below', type=float, default=None, help="Height above the lowest vertex of each mesh")
+    parser.add_argument('--box', type=float, nargs=6, default=None, help="Corners of the box, x0 y0 z0 x1 y1 z1")
+    parser.add_argument('--complement', action='store_true', help="Select the vertices outside the region")
+    args = parser.parse_known_args()[0]
+    if (args.below is None) == (args.box is None):
+        raise Exception("One of --below or --box has to be given")
+
+    for model in models_from_folder(args.folder):
+        for mesh in model.meshes:
+            if mesh.path is None:
+                continue
+            try:
+                geometry = mesh.load_geometry()
+            except Exception as e:
+                print(f"{mesh.path}: {e}")
+                continue
+            positions = geometry.positions @ OBJ_IMPORT_ROTATION.T if mesh.file_type.lower() == ".obj" else geometry.positions
+            grid = VertexGrid(positions)
+            if not args.below is None:
+                selected = grid.below(positions[:, 2].min() + args.below) if len(positions) > 0 else []
+            else:
+                selected = grid.in_box(args.box[:3], args.box[3:])
+            mask = np.zeros(geometry.n_vertices, dtype=bool)
+            mask[selected] = True
+            if args.complement:
+                mask = ~mask
+            selection = geometry.selection_from_mask(mask, os.path.splitext(mesh.file_name)[0])
+            if args.points == "ground":
+                mesh.mesh_info.set_new_ground_points(selection)
+            else:
+                mesh.mesh_info.set_new_upper_points(selection)
+            print(f"{mesh.path}: {np.count_nonzero(mask)} of {geometry.n_vertices} vertices selected")
+        model.flush()
+
+
+if __name__ == "__main__":
+    main()
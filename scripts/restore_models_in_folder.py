@@ -2,23 +2,48 @@
 For all the models in a folder this script 
 restores all the files in the models to their 
 corresponding backups
+As in save_backups_of_models.py, the backups are read from the backup store in the .backups folder
+of the models directory (the newest snapshot of each model, or --snapshot), or from the __bkp__ files
+with --bkp_files. If the folder has no backup store, the __bkp__ files are used.
+The models are restored concurrently, the number of workers can be raised for network filesystems.
 """
-from  blender_gazebo.gazebo_blender_model import models_from_folder, GazeboBlenderModel
+from blender_gazebo.backup_store import BackupStore
+from blender_gazebo.library_backup import restore_models, model_paths, print_progress, summarize_reports
 from argparse import ArgumentParser
+import os
+import json
 
 def main():
     parser = ArgumentParser()
     parser.add_argument('--folder', '-f')
+    parser.add_argument('--bkp_files', action='store_true', help="Restore from the __bkp__ files instead of from the backup store")
+    parser.add_argument('--use_store', '-s', action='store_true', help="Restore from the backup store (the default, kept for compatibility)")
+    parser.add_argument('--snapshot', default=None, help="Snapshot of the backup store to restore, the newest one if not given")
+    parser.add_argument('--workers', '-w', type=int, default=16, help="Number of models restored at the same time")
+    parser.add_argument('--dry_run', action='store_true', help="Only list the files that would be restored")
+    parser.add_argument('--report', default=None, help="Json file where the report of every model is saved")
     args = parser.parse_known_args()[0]
 
-    models = models_from_folder(args.folder)
-
-    for n, model in enumerate(models):
-        assert isinstance(model, GazeboBlenderModel)
-        try:
-            model.restore_from_backup()
-        except Exception as e:
-            print(e)
+    store_folder = os.path.join(args.folder, ".backups")
+    store = None
+    if not args.bkp_files:
+        if os.path.isdir(store_folder):
+            store = BackupStore(store_folder, read_only=args.dry_run)
+        elif args.use_store:
+            raise Exception(f"There is no backup store in {store_folder}")
+        else:
+            print(f"There is no backup store in {store_folder}, restoring from the __bkp__ files")
+    reports = restore_models(model_paths(args.folder), store=store, snapshot_id=args.snapshot, workers=args.workers,
+                             dry_run=args.dry_run, progress=print_progress)
+    summary = summarize_reports(reports)
+    for path, error in summary["errors"].items():
+        print(f"{path}: {error}")
+    print(f"{summary['succeeded']} of {summary['models']} models restored, {summary['files']} files, {summary['bytes']} bytes")
+    if not args.report is None:
+        with open(args.report, "w") as f:
+            json.dump({"summary": summary, "models": reports}, f, indent=1)
+    if not store is None:
+        store.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
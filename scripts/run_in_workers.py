@@ -0,0 +1,63 @@
+"""
+Run a function of the package on every model of a folder, in parallel, in a pool of worker processes.
+The function is called with the path of each model as its first argument, for example:
+    python run_in_workers.py -f models_folder -t blender_gazebo.normalization:normalize_model
+With --blender, the workers are headless Blender instances, so the function can use bpy.
+The models that fail are retried, and reported at the end (and in --report, as json).
+With --stage, only the models that changed since the last time they were processed successfully
+by that stage are processed (the stages are recorded in the .changes.sqlite file of the folder),
+and with --watch the models are processed again whenever their files are saved.
+"""
+import os
+import json
+from argparse import ArgumentParser
+from blender_gazebo.worker_pool import WorkerPool, python_worker_command, blender_worker_command, summarize_results
+from blender_gazebo.change_tracking import ChangeManifest, model_names, watch
+
+SUBT_MODELS_DIRECTORY = "/home/lorenzo/catkin_ws/src/danilo/subt_gazebo/models_"
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--folder', '-f', default=SUBT_MODELS_DIRECTORY)
+    parser.add_argument('--task', '-t', required=True, help="Function to run on each model, as module:function")
+    parser.add_argument('--workers', '-w', type=int, default=None, help="Number of processes, one per cpu if not given")
+    parser.add_argument('--retries', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=None, help="Seconds after which a model is considered failed")
+    parser.add_argument('--blender', default=None, help="Path of the Blender executable, to run the tasks in Blender")
+    parser.add_argument('--report', default=None, help="Json file where the results of all the models are saved")
+    parser.add_argument('--stage', '-s', default=None, help="Name of the stage, to only process the models changed since it last ran")
+    parser.add_argument('--watch', action='store_true', help="Keep processing the models as their files change (needs --stage)")
+    args = parser.parse_known_args()[0]
+    assert not args.stage is None or not args.watch, "--watch needs a --stage"
+
+    changes = None if args.stage is None else ChangeManifest(args.folder)
+    command = python_worker_command() if args.blender is None else blender_worker_command(args.blender)
+    with WorkerPool(command, workers=args.workers, retries=args.retries, task_timeout=args.timeout) as pool:
+
+        def process(names):
+            if not changes is None:
+                names = changes.changed_models(args.stage, names)
+            model_paths = [os.path.join(args.folder, name) for name in names]
+            results = pool.run(args.task, [[path] for path in model_paths])
+            if not changes is None:
+                for result in results:
+                    if result.ok:
+                        changes.record(args.stage, os.path.basename(result.args[0]))
+            summary = summarize_results(results)
+            for failure in summary["failed"]:
+                print(f"{failure['args'][0]}: {failure['error']}")
+            print(f"{summary['succeeded']} of {summary['tasks']} models done, {summary['retried']} retried")
+            if not args.report is None:
+                with open(args.report, "w") as f:
+                    json.dump({"summary": summary, "results": [result.to_dict() for result in results]}, f, indent=1, default=str)
+
+        process(model_names(args.folder))
+        if args.watch:
+            print(f"Watching {args.folder}, press Ctrl+C to stop")
+            watch(args.folder, lambda names: process([name for name in sorted(names)
+                                                      if os.path.isdir(os.path.join(args.folder, name))]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,43 @@
-from  blender_gazebo.gazebo_blender_model import models_from_folder, GazeboBlenderModel, GazeboModelMesh
+"""
+For all the models in a folder this script saves a backup of their files, as a new snapshot
+of the backup store in the .backups folder of the models directory, or as __bkp__ files.
+The models are backed up concurrently, the number of workers can be raised for network filesystems.
+"""
+from blender_gazebo.backup_store import BackupStore, new_snapshot_id
+from blender_gazebo.library_backup import backup_models, model_paths, print_progress, summarize_reports
+from argparse import ArgumentParser
+import os
+import json
 
 SUBT_MODELS_DIRECTORY = "/home/lorenzo/catkin_ws/src/danilo/subt_gazebo/models_"
-models = models_from_folder(SUBT_MODELS_DIRECTORY)
 
 
-for n, model in enumerate(models):
-    assert isinstance(model, GazeboBlenderModel)
-    try:
-        model.create_backup()
-    except Exception as e:
-        print(e)
\ No newline at end of file
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--folder', '-f', default=SUBT_MODELS_DIRECTORY)
+    parser.add_argument('--bkp_files', action='store_true', help="Save the backups as __bkp__ files instead of in the backup store")
+    parser.add_argument('--workers', '-w', type=int, default=16, help="Number of models backed up at the same time")
+    parser.add_argument('--dry_run', action='store_true', help="Only list the files that would be backed up")
+    parser.add_argument('--report', default=None, help="Json file where the report of every model is saved")
+    args = parser.parse_known_args()[0]
+
+    # With --dry_run the store is only read, so that nothing is created in it
+    store = None if args.bkp_files else BackupStore(os.path.join(args.folder, ".backups"), read_only=args.dry_run)
+    snapshot_id = new_snapshot_id()
+    reports = backup_models(model_paths(args.folder), store=store, snapshot_id=snapshot_id, workers=args.workers,
+                            dry_run=args.dry_run, progress=print_progress)
+    summary = summarize_reports(reports)
+    for path, error in summary["errors"].items():
+        print(f"{path}: {error}")
+    print(f"{summary['succeeded']} of {summary['models']} models backed up, {summary['files']} files, {summary['bytes']} bytes")
+    if not args.report is None:
+        with open(args.report, "w") as f:
+            json.dump({"summary": summary, "models": reports}, f, indent=1)
+    if not store is None:
+        if not args.dry_run:
+            print(f"Backups saved in snapshot {snapshot_id}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,24 @@
 """
 The purpose of this script is:
     1) To copy a tile model with a different name
-    2) Load the mesh of that model into blender
-    3) Randomize the points of the mesh
-    4) Save the modified mesh
+    2) Randomize the points of the mesh
+    3) Save the modified mesh
+The mesh of each model is loaded only once, and all the variations are computed
+with numpy, so this script does not need to be run from Blender.
+The models are processed in parallel, each one in a worker of a worker_pool.WorkerPool,
+and the models that fail are reported at the end without stopping the rest.
+The variations are recorded in a manifest in the folder of each model, so if the script is
+stopped, running it again only generates the variations that are missing, with the same seeds.
 """
 ####################################################################################################################################
 #	IMPORTS
 ####################################################################################################################################
 import os
-import blender_gazebo.blender_functions
-import blender_gazebo.gazebo_blender_model
-from importlib import reload
-reload(blender_gazebo.blender_functions)
-reload(blender_gazebo.gazebo_blender_model)
-reload(blender_gazebo.blender_functions)
-import blender_gazebo.blender_functions as blender
-from blender_gazebo.gazebo_blender_model import GazeboBlenderModel, copy_model_with_different_name, GazeboModelMesh
-import bpy
-import random
+from blender_gazebo.tile_variation import MODIFICATION_TYPES
+from blender_gazebo.worker_pool import WorkerPool, summarize_results
 ####################################################################################################################################
 #	PARAMETERS
 ####################################################################################################################################
-MODIFICATION_TYPES = {0:"only_upper", 1:"only_ground", 3:"all_points"}
 TYPE_OF_MODIFICATION = MODIFICATION_TYPES[0]
 DO_ONLY_ONE_MODEL = False
 MODEL_NAME = "cave_tile_1"
@@ -31,21 +27,20 @@ MODIFIED_MODELS_FOLDER = "/home/lorenzo/git/subt_gazebo/models/modified"
 NUMBER_OF_MODIFICATIONS = 50
 MAGNITUDE_OF_MODIFICATION = 0.5
 SEQUENTIAL_MODIFICATIONS = 4
+SEED = None
+# If None, the points are moved as with bpy.ops.transform.vertex_random, if not, with smooth noise
+# that keeps the borders of the tiles in place, given as the arguments of a NoiseDeformation, for example:
+# {"amplitude": (0.2, 0.2, 0.5), "frequency": 0.5, "border_falloff": 1.0}
+DEFORMATION = None
+# Number of worker processes (one per cpu if None) and times that a failed model is retried
+WORKERS = None
+RETRIES = 1
+# If False, all the variations are generated again, even the ones already in the manifests
+RESUME = True
 
 ####################################################################################################################################
 #	FUNCTIONS
 ####################################################################################################################################
-def modify_model(model, type_of_modification):
-    assert isinstance(model, GazeboBlenderModel)
-    if type_of_modification == MODIFICATION_TYPES[0]:
-        for mesh in model.meshes:
-            assert isinstance(mesh, GazeboModelMesh)
-            mesh.select_ground_points()
-            bpy.ops.object.mode_set(mode='EDIT')
-            for _ in range(SEQUENTIAL_MODIFICATIONS):
-                bpy.ops.transform.vertex_random(offset=MAGNITUDE_OF_MODIFICATION, seed=random.randint(0,10000))
-
-#-----------------------------------------------------------------------------------------------------------------------------------
 def main():
     save_folder = os.path.join(MODIFIED_MODELS_FOLDER, TYPE_OF_MODIFICATION)
     if DO_ONLY_ONE_MODEL:
@@ -54,18 +49,20 @@ def main():
         else:
             model_names = [MODEL_NAME]
     else:
-        model_names = os.listdir(MODELS_FOLDER)
-    models = [GazeboBlenderModel(os.path.join(MODELS_FOLDER, name)) for name in model_names] 
+        model_names = sorted(os.listdir(MODELS_FOLDER))
+    tasks = [{"model_path": os.path.join(MODELS_FOLDER, name), "destination_folder": os.path.join(save_folder, name),
+              "n_variations": NUMBER_OF_MODIFICATIONS, "modification_type": TYPE_OF_MODIFICATION,
+              "magnitude": MAGNITUDE_OF_MODIFICATION, "sequential_modifications": SEQUENTIAL_MODIFICATIONS,
+              "seed": SEED, "deformation": DEFORMATION, "resume": RESUME} for name in model_names]
+    with WorkerPool(workers=WORKERS, retries=RETRIES) as pool:
+        results = pool.run("blender_gazebo.tile_variation:generate_model_variations", tasks)
+    for result in results:
+        if result.ok:
+            print(f"{result.result['model']}: {len(result.result['variations'])} variations generated with seed {result.result['seed']}")
+        else:
+            print(f"{result.args['model_path']} failed: {result.error}")
+    summary = summarize_results(results)
+    print(f"{summary['succeeded']} of {summary['tasks']} models done")
 
-    for model in models:
-        for n in range(NUMBER_OF_MODIFICATIONS):
-            model_type_save_folder = os.path.join(save_folder, model.name)
-            new_name = model.name + f"_mod_{n}"
-            copied_model = copy_model_with_different_name(model,new_name,destination_folder=model_type_save_folder )
-            blender.clear_workspace()
-            blender.load_gazebo_model(copied_model)
-            modify_model(copied_model,TYPE_OF_MODIFICATION)
-            blender.save_mesh(copied_model.meshes[0].path) 
-    
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
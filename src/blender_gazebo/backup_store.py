@@ -0,0 +1,245 @@
+"""
+Content addressed store for the backups of gazebo models.
+Every backed up file is stored once under the hash of its contents, and each backup of a
+model (a snapshot) only records the hash of each of its files. Backing up files that did
+not change costs no copies and no space, and a model can be restored to any earlier snapshot.
+"""
+# IMPORTS
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from blender_gazebo.gazebo_blender_model import GazeboBlenderModel
+from blender_gazebo.file_operations import clone_file, temporal_path_for
+from blender_gazebo.instrumentation import count, traced
+# GLOBAL VARIABLES
+HASH_BLOCK_SIZE = 1 << 20
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def file_hash(path):
+    """sha256 of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def new_snapshot_id():
+    """Id for a new snapshot, sortable by creation time"""
+    return time.strftime("%Y%m%dT%H%M%S") + f"_{time.time_ns() % 10**9:09d}"
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def model_files(model: GazeboBlenderModel):
+    """Paths of the files of a model that are backed up: the model.sdf, the model.config and the meshes"""
+    paths = [model.sdf_file_path, model.config_file_path]
+    for mesh in model.meshes:
+        if not mesh.path is None and not mesh.path in paths:
+            paths.append(mesh.path)
+    return paths
+
+
+# CLASSES
+class BackupStore:
+    """
+    Backups of models, stored in a folder with the following structure:
+    - objects/ab/cdef...: the contents of every backed up file, named by their hash
+    - snapshots/MODEL_NAME/SNAPSHOT_ID.json: the files of a model in a snapshot, and their hashes
+    - hashes.sqlite: cache of the hashes of the files of the models, by path, size and mtime,
+      so that unchanged files do not have to be read again
+    The store should be in the same filesystem as the models so that reflinks and hardlinks can be used.
+    With read_only=True nothing is created nor written in the store (not even the cache of hashes),
+    it can only be used to find what a backup or a restore would do
+    """
+
+    def __init__(self, root, read_only=False):
+        self.root = root
+        self.read_only = read_only
+        self.objects_folder = os.path.join(root, "objects")
+        self.snapshots_folder = os.path.join(root, "snapshots")
+        hashes_path = os.path.join(root, "hashes.sqlite")
+        if read_only:
+            self.connection = None
+            if os.path.exists(hashes_path):
+                self.connection = sqlite3.connect(f"file:{hashes_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(self.objects_folder, exist_ok=True)
+            os.makedirs(self.snapshots_folder, exist_ok=True)
+            self.connection = sqlite3.connect(hashes_path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)")
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} at {self.root}"
+
+    def close(self):
+        if not self.connection is None:
+            self.connection.close()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise Exception(f"{self} was opened as read only")
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def object_path(self, content_hash):
+        return os.path.join(self.objects_folder, content_hash[:2], content_hash[2:])
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def hash_of(self, path):
+        """Hash of a file, only read if it changed since the last time it was hashed"""
+        st = os.stat(path)
+        path = os.path.abspath(path)
+        row = None
+        if not self.connection is None:
+            with self._lock:
+                row = self.connection.execute("SELECT size, mtime_ns, hash FROM hashes WHERE path = ?", (path,)).fetchone()
+        if not row is None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        content_hash = file_hash(path)
+        if self.read_only:
+            return content_hash
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+                                    (path, st.st_size, st.st_mtime_ns, content_hash))
+        return content_hash
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def add_file(self, path):
+        """
+        Store the contents of a file, if they are not already in the store. Returns
+        the hash of the file and the number of bytes that had to be stored.
+        Several threads can add the same contents at once, each one writes its own temporary
+        file, and the ones that find the object already stored do not count its bytes
+        """
+        self._check_writable()
+        content_hash = self.hash_of(path)
+        object_path = self.object_path(content_hash)
+        if os.path.exists(object_path):
+            return content_hash, 0
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        temporary_path = temporal_path_for(object_path)
+        try:
+            clone_file(path, temporary_path)
+            # The objects are never modified, they are shared by all the snapshots that use them
+            os.chmod(temporary_path, 0o444)
+            if os.path.exists(object_path):
+                return content_hash, 0
+            os.replace(temporary_path, object_path)
+        except OSError:
+            if os.path.exists(object_path):
+                return content_hash, 0
+            raise
+        finally:
+            if os.path.lexists(temporary_path):
+                os.remove(temporary_path)
+        return content_hash, os.path.getsize(object_path)
+
+    def pending_files(self, model: GazeboBlenderModel):
+        """Files of a model whose contents are not in the store yet"""
+        return [path for path in model_files(model) if not os.path.exists(self.object_path(self.hash_of(path)))]
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @traced()
+    def snapshot(self, model: GazeboBlenderModel, snapshot_id=None, label=None):
+        """
+        Back up the files of a model. All the models backed up in the same run can share
+        the snapshot_id. Returns the snapshot_id
+        """
+        assert isinstance(model, GazeboBlenderModel)
+        self._check_writable()
+        if snapshot_id is None:
+            snapshot_id = new_snapshot_id()
+        files, stored_bytes = dict(), 0
+        for path in model_files(model):
+            content_hash, n_bytes = self.add_file(path)
+            stored_bytes += n_bytes
+            files[os.path.relpath(path, model.base_folder)] = {
+                "hash": content_hash, "size": os.path.getsize(path), "mode": os.stat(path).st_mode & 0o777}
+        snapshot = {"id": snapshot_id, "model": model.name, "created": time.time(), "label": label,
+                    "stored_bytes": stored_bytes, "files": files}
+        model_snapshots_folder = os.path.join(self.snapshots_folder, model.name)
+        os.makedirs(model_snapshots_folder, exist_ok=True)
+        snapshot_path = os.path.join(model_snapshots_folder, snapshot_id + ".json")
+        temporary_path = temporal_path_for(snapshot_path)
+        with open(temporary_path, "w") as f:
+            f.write(json.dumps(snapshot, indent=1))
+        os.replace(temporary_path, snapshot_path)
+        count("bytes_stored", stored_bytes)
+        return snapshot_id
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def snapshots(self, model_name):
+        """Ids of the snapshots of a model, from the oldest to the newest"""
+        model_snapshots_folder = os.path.join(self.snapshots_folder, model_name)
+        if not os.path.isdir(model_snapshots_folder):
+            return list()
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(model_snapshots_folder) if f.endswith(".json"))
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def load_snapshot(self, model_name, snapshot_id=None):
+        """Contents of a snapshot of a model, the newest one if snapshot_id is None"""
+        if snapshot_id is None:
+            snapshots = self.snapshots(model_name)
+            if len(snapshots) == 0:
+                raise Exception(f"There are no backups of {model_name} in {self.root}")
+            snapshot_id = snapshots[-1]
+        snapshot_path = os.path.join(self.snapshots_folder, model_name, snapshot_id + ".json")
+        if not os.path.exists(snapshot_path):
+            raise Exception(f"{snapshot_path} does not exist")
+        with open(snapshot_path, "r") as f:
+            return json.load(f)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @traced()
+    def restore(self, model: GazeboBlenderModel, snapshot_id=None, hardlink=False, dry_run=False):
+        """
+        Restore the files of a model to a snapshot (the newest if snapshot_id is None). Only the files
+        that differ from the snapshot are written, with a reflink if the filesystem allows it.
+        hardlink=True links the files to the store instead, which is only safe if the files are
+        replaced (and not modified in place) when they are written. Returns the restored paths
+        (with dry_run=True, the paths that would be restored, without writing them)
+        """
+        assert isinstance(model, GazeboBlenderModel)
+        snapshot = self.load_snapshot(model.name, snapshot_id)
+        restored = list()
+        for relative_path, file_info in snapshot["files"].items():
+            path = os.path.join(model.base_folder, relative_path)
+            if os.path.exists(path) and self.hash_of(path) == file_info["hash"]:
+                continue
+            object_path = self.object_path(file_info["hash"])
+            if not os.path.exists(object_path):
+                raise Exception(f"The contents of {relative_path} of {model.name} are missing from {self.root}")
+            if dry_run:
+                restored.append(path)
+                continue
+            self._check_writable()
+            temporary_path = temporal_path_for(path)
+            method = clone_file(object_path, temporary_path, hardlink=hardlink)
+            if method != "hardlink":
+                os.chmod(temporary_path, file_info["mode"])
+            os.replace(temporary_path, path)
+            restored.append(path)
+            count("files_written")
+        return restored
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def collect_garbage(self):
+        """Delete the stored objects that are not used by any snapshot. Returns the number of bytes freed"""
+        self._check_writable()
+        used = set()
+        for model_name in os.listdir(self.snapshots_folder):
+            for snapshot_id in self.snapshots(model_name):
+                for file_info in self.load_snapshot(model_name, snapshot_id)["files"].values():
+                    used.add(file_info["hash"])
+        freed = 0
+        for prefix in os.listdir(self.objects_folder):
+            for name in os.listdir(os.path.join(self.objects_folder, prefix)):
+                if not prefix + name in used:
+                    object_path = os.path.join(self.objects_folder, prefix, name)
+                    freed += os.path.getsize(object_path)
+                    os.remove(object_path)
+        return freed
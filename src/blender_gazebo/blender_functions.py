@@ -1,6 +1,14 @@
-import os
-import bpy
+"""
+Functions to work with the meshes of gazebo models in Blender. They act on the backend
+returned by mesh_backends.get_backend: the running Blender instance, or the numpy
+backend, which has the same behaviour and can be used without Blender.
+"""
+import numpy as np
 from blender_gazebo.gazebo_blender_model import GazeboBlenderModel, GazeboModelMesh
+from blender_gazebo.mesh_backends import get_backend, set_backend
+from blender_gazebo.mesh_cache import MeshCache, get_default_cache
+from blender_gazebo.file_operations import write_file_atomically
+from blender_gazebo.instrumentation import count, traced
 
 
 
@@ -9,97 +17,95 @@ def clear_workspace():
     """
     Delete all the objects in the current blender instance
     """
-    objs = bpy.data.objects
-    for k in objs.keys():
-        objs.remove(objs[k], do_unlink=True)
+    get_backend().clear()
 
 #-----------------------------------------------------------------------------------------------------------------------------------
-def load_gazebo_model(model: GazeboBlenderModel):
+def load_gazebo_model(model: GazeboBlenderModel, cache=True):
     """
     Load all the mesh files of a gazebo model into blender
     """
     assert isinstance(model, GazeboBlenderModel)
     for mesh in model.meshes:
         assert isinstance(mesh, GazeboModelMesh)
-        load_gazebo_mesh(mesh)
+        load_gazebo_mesh(mesh, cache=cache)
 
 #-----------------------------------------------------------------------------------------------------------------------------------
-def load_gazebo_mesh(mesh: GazeboModelMesh):
+@traced()
+def load_gazebo_mesh(mesh: GazeboModelMesh, cache=True):
     """
-    Load the file pointed by the mesh object into blender
+    Load the file pointed by the mesh object into blender, returns the names of the new objects.
+    cache is a mesh_cache.MeshCache, True to use the default one or False to always import the file
     """
-    if mesh.file_type in (".obj"):
-        return bpy.ops.import_scene.obj(filepath=mesh.path)
-    elif mesh.file_type in (".dae", ".DAE"):
-        return bpy.ops.wm.collada_import(filepath=mesh.path)
+    if cache is True:
+        cache = get_default_cache()
+    if isinstance(cache, MeshCache):
+        return cache.load(mesh.path, get_backend())
+    return get_backend().load_mesh(mesh.path)
 
 #-----------------------------------------------------------------------------------------------------------------------------------
 def get_selected_points():
-    """Returns a list with the indices of the selected points for a certain mesh"""
-    mode = bpy.context.active_object.mode
-    # we need to switch from Edit mode to Object mode so the selection gets updated
-    bpy.ops.object.mode_set(mode='OBJECT')
-    selected_vertices = {}
-    for obj_key in bpy.data.objects.keys():
-        selected_vertices[obj_key] =  []
-        for i in range(bpy.data.objects.get(obj_key).data.vertices.__len__()):
-            if bpy.data.objects.get(obj_key).data.vertices[i].select:
-                selected_vertices[obj_key].append(i)
-
-    # back to whatever mode we were in
-    bpy.ops.object.mode_set(mode=mode)
-    return selected_vertices
+    """
+    Returns a dictionary with an array of the indices of the selected points of each mesh,
+    the arrays can be turned into lists with .tolist() to save them as .json
+    """
+    return {name: np.flatnonzero(selection) for name, selection in get_backend().get_selections().items()}
 
 #-----------------------------------------------------------------------------------------------------------------------------------
 def toogle_selected_points():
-    mode = bpy.context.active_object.mode
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for obj_key in bpy.data.objects.keys():
-        obj = bpy.data.objects.get(obj_key)
+    backend = get_backend()
+    backend.set_selections({name: ~selection for name, selection in backend.get_selections().items()})
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def transform(matrix, center=(0.0, 0.0, 0.0)):
+    """Apply a 3x3 transformation (rotation, scale...) around center to all the meshes"""
+    get_backend().transform(matrix, center)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def resize(scale, center=(0.0, 0.0, 0.0)):
+    """Scale all the meshes, like bpy.ops.transform.resize"""
+    transform(np.diag(np.asarray(scale, dtype=np.float64)), center)
 
-        to_select = []
-        for i in range(obj.data.vertices.__len__()):
-            if not bpy.data.objects.get(obj_key).data.vertices[i].select:
-                to_select.append(i) 
-        for polygon in obj.data.polygons:
-            polygon.select = False
-        for edge in obj.data.edges:
-            edge.select = False
-        for vertex in obj.data.vertices:
-            vertex.select = False
-        for i in to_select:
-            obj.data.vertices[i].select = True
-    bpy.ops.object.mode_set(mode=mode)
+#-----------------------------------------------------------------------------------------------------------------------------------
+def rotate(angle, axis="X", center=(0.0, 0.0, 0.0)):
+    """Rotate all the meshes angle radians around one of the axes"""
+    c, s = np.cos(angle), np.sin(angle)
+    i, j = [(1, 2), (2, 0), (0, 1)]["XYZ".index(axis)]
+    matrix = np.eye(3)
+    matrix[i, i], matrix[i, j], matrix[j, i], matrix[j, j] = c, -s, s, c
+    transform(matrix, center)
 
 #-----------------------------------------------------------------------------------------------------------------------------------
+@traced()
 def save_mesh(file_path):
     """
     Save the current selected mesh in blender to the specified file,
     if no file is specified, it is saved to the original file of the mesh.
+    The file is replaced atomically, and kept as it was if the export gives the same contents
     """
-    base, extension = os.path.splitext(file_path)
-    if str.lower(extension) == ".obj":
-        bpy.ops.export_scene.obj(filepath=file_path)
-    elif str.lower(extension) == ".dae":
-        bpy.ops.wm.collada_export(filepath=file_path)
+    backend = get_backend()
+    if write_file_atomically(file_path, backend.save):
+        count("files_written")
     print("MODEL SAVED")
 
 def deselect_everything():
     """Deselect every vertex, edge and polygon"""
-    for key in bpy.data.objects.keys():
-        obj = bpy.data.objects[key]
-        for polygon in obj.data.polygons:
-            polygon.select = False
-        for edge in obj.data.edges:
-            edge.select = False
-        for vertex in obj.data.vertices:
-            vertex.select = False
+    backend = get_backend()
+    backend.set_selections({name: False for name in backend.object_names()})
 
+@traced()
 def select_points(points_to_select, deselect_previous = True):
+    backend = get_backend()
+    selections = backend.get_selections()
+    new_selections = dict()
     for key in points_to_select.keys():
-        obj = bpy.data.objects.get(key)
-        p_indices = points_to_select[key]
-        if deselect_previous:
-            deselect_everything()
-        for i in p_indices:
-            obj.data.vertices[i].select = True
\ No newline at end of file
+        if not key in selections:
+            raise Exception(f"There is no object {key}")
+        selection = np.zeros_like(selections[key]) if deselect_previous else selections[key]
+        indices = np.asarray(points_to_select[key], dtype=np.int64)
+        selection[indices] = True
+        count("vertices_touched", len(indices))
+        new_selections[key] = selection
+    if deselect_previous:
+        # The objects that are not in points_to_select are deselected too
+        new_selections = {**{name: False for name in selections}, **new_selections}
+    backend.set_selections(new_selections)
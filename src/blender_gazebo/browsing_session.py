@@ -0,0 +1,199 @@
+"""
+Browsing of the models of a folder one by one (as load_next_model_in_folder.py does), keeping
+the state between invocations. The session keeps a cursor over the models of the folder, and
+while the current model is being edited, a background thread parses the next models, so that
+moving to them does not have to wait for the parsing.
+The session outlives reloads of gazebo_blender_model (the scripts run in Blender reload it), so
+the class of the models is looked up in the module every time, and the models parsed with a
+class that has been reloaded since are built again from their parsed files.
+"""
+# IMPORTS
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import blender_gazebo.gazebo_blender_model as gazebo_blender_model
+from blender_gazebo.instrumentation import span
+# GLOBAL VARIABLES
+SESSIONS_KEY = "blender_gazebo_sessions"
+# Used to keep the sessions when not running inside Blender
+_SESSIONS = dict()
+
+# CLASSES
+class _PrefetchedModel:
+    """A parsed model and the modification time of its model.sdf"""
+    __slots__ = ("model", "sdf_mtime_ns")
+
+    def __init__(self, model, sdf_mtime_ns):
+        self.model = model
+        self.sdf_mtime_ns = sdf_mtime_ns
+
+
+class BrowsingSession:
+    """
+    Cursor over the models of a folder:
+    - next, previous: move the cursor (going around at the ends) and return the model
+    - jump: move the cursor to a model by name
+    - prefetch: number of models after the cursor that are parsed in the background
+    If a model_catalog.ModelCatalog is given, the models are listed from it, and only
+    the models without errors are browsed
+    """
+
+    def __init__(self, folder, prefetch=2, catalog=None):
+        self.folder = folder
+        self.prefetch = prefetch
+        self.catalog = catalog
+        self.cursor = -1
+        self._cache = dict()
+        self._futures = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blender_gazebo_prefetch")
+        self.refresh()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.folder} at {self.current_name}"
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def refresh(self):
+        """List the models of the folder again, keeping the cursor on the same model if it still exists"""
+        current_name = self.current_name if hasattr(self, "names") else None
+        if self.catalog is None:
+            self.names = sorted(name for name in os.listdir(self.folder)
+                                if not name.startswith(".") and os.path.isdir(os.path.join(self.folder, name)))
+        else:
+            self.catalog.refresh()
+            errors = self.catalog.errors()
+            self.names = [entry.name for entry in self.catalog.entries() if not entry.name in errors]
+        self.cursor = self.names.index(current_name) if current_name in self.names else -1
+
+    @property
+    def current_name(self):
+        if self.cursor < 0 or self.cursor >= len(self.names):
+            return None
+        return self.names[self.cursor]
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _read(self, name):
+        """Parse a model"""
+        with span("BrowsingSession.prefetch", model=name):
+            path = os.path.join(self.folder, name)
+            model = gazebo_blender_model.GazeboBlenderModel(path)
+            return _PrefetchedModel(model, os.stat(model.sdf_file_path).st_mtime_ns)
+
+    def _is_valid(self, prefetched):
+        """A prefetched model is valid while its model.sdf has not been modified"""
+        try:
+            return os.stat(prefetched.model.sdf_file_path).st_mtime_ns == prefetched.sdf_mtime_ns
+        except OSError:
+            return False
+
+    def _get(self, name):
+        """The prefetched model, waiting for it if it is being read, or reading it now"""
+        with self._lock:
+            prefetched = self._cache.get(name)
+            future = self._futures.pop(name, None)
+        if prefetched is None and not future is None:
+            try:
+                prefetched = future.result()
+            except Exception:
+                prefetched = None
+        if prefetched is None or not self._is_valid(prefetched):
+            prefetched = self._read(name)
+        model_class = gazebo_blender_model.GazeboBlenderModel
+        if not type(prefetched.model) is model_class:
+            # The module was reloaded after the model was parsed, its files are not parsed again
+            model = prefetched.model
+            prefetched.model = model_class.from_trees(model.base_folder, model.config_tree, model.sdf_tree)
+        with self._lock:
+            self._cache[name] = prefetched
+        return prefetched
+
+    def _store(self, name, future):
+        try:
+            prefetched = future.result()
+        except Exception:
+            return
+        with self._lock:
+            if self._futures.get(name) is future:
+                del self._futures[name]
+                self._cache[name] = prefetched
+
+    def _schedule_prefetch(self):
+        """Read the models after the cursor in the background, and forget the ones far from it"""
+        n = len(self.names)
+        window = [self.names[(self.cursor + offset) % n] for offset in range(-1, self.prefetch + 1)] if n > 0 else []
+        with self._lock:
+            for name in list(self._cache.keys()):
+                if not name in window:
+                    del self._cache[name]
+            for name in window[2:]:
+                if not name in self._cache and not name in self._futures:
+                    future = self._executor.submit(self._read, name)
+                    self._futures[name] = future
+                    future.add_done_callback(lambda future, name=name: self._store(name, future))
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _move_to(self, cursor, step=1):
+        """
+        Move the cursor and return its model. The models that can not be loaded are
+        reported and skipped, moving in the direction of step
+        """
+        for _ in range(len(self.names)):
+            self.cursor = cursor % len(self.names)
+            try:
+                prefetched = self._get(self.names[self.cursor])
+            except Exception as e:
+                print(e)
+                cursor += step
+                continue
+            self._schedule_prefetch()
+            return prefetched.model
+        raise Exception(f"There are no models that can be loaded in {self.folder}")
+
+    def current(self):
+        """The model at the cursor (the first one if the cursor has not been moved)"""
+        return self._move_to(max(self.cursor, 0))
+
+    def next(self):
+        return self._move_to(self.cursor + 1)
+
+    def previous(self):
+        return self._move_to(self.cursor - 1, step=-1)
+
+    def jump(self, name):
+        if not name in self.names:
+            self.refresh()
+        if not name in self.names:
+            raise Exception(f"There is no model {name} in {self.folder}")
+        return self._move_to(self.names.index(name))
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _sessions():
+    """
+    Dictionary where the sessions are kept. Inside Blender, bpy.app.driver_namespace is
+    used, as it is kept while Blender is open even when the modules are reloaded
+    """
+    try:
+        import bpy
+    except ImportError:
+        return _SESSIONS
+    return bpy.app.driver_namespace.setdefault(SESSIONS_KEY, dict())
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_session(folder, prefetch=2, catalog=None):
+    """The browsing session of a folder, created the first time that it is requested"""
+    sessions = _sessions()
+    key = os.path.abspath(folder)
+    if not key in sessions:
+        sessions[key] = BrowsingSession(folder, prefetch=prefetch, catalog=catalog)
+    return sessions[key]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def close_session(folder):
+    session = _sessions().pop(os.path.abspath(folder), None)
+    if not session is None:
+        session.close()
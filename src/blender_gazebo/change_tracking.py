@@ -0,0 +1,326 @@
+"""
+Detection of the models of a folder that changed since they were last processed by a stage of a
+pipeline (normalization, variations, ...). After a stage processes a model successfully, the
+fingerprint of the files of the model (size and modification time of each one, and optionally the
+hash of its contents) is recorded for that stage in the change manifest of the folder. The next
+run of the stage only has to process the models that are new or whose fingerprint changed.
+The folder can also be watched (with inotify on linux, or by polling the files otherwise) to
+process the models as soon as their files are saved.
+"""
+# IMPORTS
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import sqlite3
+import threading
+from blender_gazebo.run_manifest import hash_file
+# GLOBAL VARIABLES
+CHANGE_MANIFEST_FILE_NAME = ".changes.sqlite"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    time REAL,
+    PRIMARY KEY (stage, model)
+);
+"""
+# inotify constants, from sys/inotify.h
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ATTRIB
+EVENT_HEADER = struct.Struct("iIII")
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def is_tracked_file(name):
+    """The hidden files and the __bkp__ backups are not part of the models"""
+    return not name.startswith(".") and not name.startswith("__bkp__")
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def model_names(folder):
+    return sorted(name for name in os.listdir(folder)
+                  if not name.startswith(".") and os.path.isdir(os.path.join(folder, name)))
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def stat_model(model_path):
+    """{path relative to the model: [size, mtime_ns]} of the files of a model"""
+    files = dict()
+    for folder, subfolders, file_names in os.walk(model_path):
+        subfolders[:] = [name for name in subfolders if is_tracked_file(name)]
+        for name in file_names:
+            if is_tracked_file(name):
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.relpath(path, model_path)] = [st.st_size, st.st_mtime_ns]
+    return files
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def model_of_path(folder, path):
+    """Name of the model of the folder that contains path, None if it is not inside a model"""
+    relative_path = os.path.relpath(path, folder)
+    if relative_path.startswith(os.pardir) or relative_path == os.curdir:
+        return None
+    name = relative_path.split(os.sep, 1)[0]
+    return None if name.startswith(".") else name
+
+
+# CLASSES
+class ChangeManifest:
+    """
+    Fingerprints of the models of a folder, as they were when each stage last processed them,
+    kept in a sqlite file (.changes.sqlite in the folder by default):
+    - changed_models(stage): models that are new or changed since they were recorded for the stage
+    - record(stage, model_name): record the current state of a model, once the stage processed it
+    - use_hashes: also record the hash of the files, so that the files that were touched (or
+      written again with the same contents) but did not change are not reported as changed
+    """
+
+    def __init__(self, folder, manifest_path=None, use_hashes=False):
+        assert os.path.isdir(folder), f"{folder} is not a folder"
+        self.folder = folder
+        self.use_hashes = use_hashes
+        self.manifest_path = os.path.join(folder, CHANGE_MANIFEST_FILE_NAME) if manifest_path is None else manifest_path
+        self.connection = sqlite3.connect(self.manifest_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.folder}"
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def fingerprint(self, model_name):
+        """{relative path: [size, mtime_ns(, sha1)]} of the files of the model"""
+        model_path = os.path.join(self.folder, model_name)
+        files = stat_model(model_path)
+        if self.use_hashes:
+            for relative_path, stat in files.items():
+                stat.append(hash_file(os.path.join(model_path, relative_path)))
+        return files
+
+    def recorded(self, stage):
+        """{model name: recorded fingerprint} of a stage"""
+        with self._lock:
+            rows = self.connection.execute("SELECT model, fingerprint FROM fingerprints WHERE stage = ?", (stage,)).fetchall()
+        return {model: json.loads(fingerprint) for model, fingerprint in rows}
+
+    def _is_unchanged(self, model_name, recorded):
+        model_path = os.path.join(self.folder, model_name)
+        current = stat_model(model_path)
+        if current.keys() != recorded.keys():
+            return False
+        for relative_path, (size, mtime_ns) in current.items():
+            recorded_stat = recorded[relative_path]
+            if recorded_stat[0] != size:
+                return False
+            if recorded_stat[1] != mtime_ns:
+                # Touched, it only counts as changed if the contents are different (when they are known)
+                if len(recorded_stat) < 3 or hash_file(os.path.join(model_path, relative_path)) != recorded_stat[2]:
+                    return False
+        return True
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def changed_models(self, stage, names=None):
+        """
+        Sorted names of the models (of the folder, or of names) that are new or have changed
+        since they were recorded for the stage. Only a stat of each file is needed for the
+        models that did not change
+        """
+        recorded = self.recorded(stage)
+        names = model_names(self.folder) if names is None else names
+        return sorted(name for name in names
+                      if not name in recorded or not self._is_unchanged(name, recorded[name]))
+
+    def removed_models(self, stage):
+        """Models recorded for the stage that are not in the folder anymore"""
+        return sorted(set(self.recorded(stage).keys()) - set(model_names(self.folder)))
+
+    def record(self, stage, model_name):
+        """Record the current state of a model for the stage, call it once the stage processed it successfully"""
+        fingerprint = json.dumps(self.fingerprint(model_name))
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                                    (stage, model_name, fingerprint, time.time()))
+
+    def forget(self, stage, model_name=None):
+        """Forget a model (or all of them) for the stage, so that it is processed again"""
+        with self._lock, self.connection:
+            if model_name is None:
+                self.connection.execute("DELETE FROM fingerprints WHERE stage = ?", (stage,))
+            else:
+                self.connection.execute("DELETE FROM fingerprints WHERE stage = ? AND model = ?", (stage, model_name))
+
+    def stages(self):
+        with self._lock:
+            return [row[0] for row in self.connection.execute("SELECT DISTINCT stage FROM fingerprints")]
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class InotifyWatcher:
+    """
+    Watches all the folders inside a folder with inotify (through ctypes, linux only).
+    wait returns the names of the models whose files were written, created, moved or deleted
+    """
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = dict()
+        self._add_tree(self.folder)
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.folder} ({len(self.watches)} folders)"
+
+    def close(self):
+        os.close(self.fd)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _add_tree(self, root):
+        for folder, subfolders, _ in os.walk(root):
+            subfolders[:] = [name for name in subfolders if not name.startswith(".")]
+            watch = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+            if watch >= 0:
+                self.watches[watch] = folder
+
+    def wait(self, timeout=None):
+        """Set of the names of the models that changed, empty if nothing happened before timeout seconds"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+        data = os.read(self.fd, 1 << 16)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            folder = self.watches.get(watch)
+            if folder is None:
+                continue
+            path = os.path.join(folder, os.fsdecode(name)) if name else folder
+            if mask & IN_DELETE_SELF:
+                del self.watches[watch]
+            elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New folders (a model copied into the folder) are watched too
+                self._add_tree(path)
+            if name and not is_tracked_file(os.fsdecode(name)):
+                continue
+            model_name = model_of_path(self.folder, path)
+            if not model_name is None:
+                changed.add(model_name)
+        return changed
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class PollingWatcher:
+    """Watches a folder by comparing the size and modification time of the files of every model periodically"""
+
+    def __init__(self, folder, interval=2.0):
+        self.folder = os.path.abspath(folder)
+        self.interval = interval
+        self.state = self._scan()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.folder} every {self.interval} s"
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        return {name: stat_model(os.path.join(self.folder, name)) for name in model_names(self.folder)}
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(self.interval if deadline is None else max(0.0, min(self.interval, deadline - time.monotonic())))
+            state = self._scan()
+            changed = set(name for name in state.keys() | self.state.keys() if state.get(name) != self.state.get(name))
+            self.state = state
+            if len(changed) > 0 or (not deadline is None and time.monotonic() >= deadline):
+                return changed
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def create_watcher(folder, use_inotify=None, interval=2.0):
+    """An InotifyWatcher if it is available (or use_inotify is True), a PollingWatcher if not"""
+    if use_inotify is False:
+        return PollingWatcher(folder, interval)
+    try:
+        return InotifyWatcher(folder)
+    except (OSError, AttributeError):
+        if use_inotify:
+            raise
+        return PollingWatcher(folder, interval)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def watch(folder, callback, debounce=1.0, stop=None, use_inotify=None, interval=2.0):
+    """
+    Call callback(model_names) with the set of models whose files changed, once their files
+    have not changed for debounce seconds (so that a model being saved is processed once).
+    Runs until the threading.Event stop is set (checked every second) or until interrupted
+    """
+    watcher = create_watcher(folder, use_inotify, interval)
+    pending = set()
+    try:
+        while stop is None or not stop.is_set():
+            changed = watcher.wait(timeout=debounce if len(pending) > 0 else 1.0)
+            if len(changed) > 0:
+                pending |= changed
+            elif len(pending) > 0:
+                callback(pending)
+                pending = set()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def process_changed_models(manifest: ChangeManifest, stage, process, names=None):
+    """
+    Call process(model_path) for each model that changed since the stage last processed it, and
+    record the models for which it does not raise. Returns {model name: error} of the failed ones
+    """
+    errors = dict()
+    for name in manifest.changed_models(stage, names):
+        model_path = os.path.join(manifest.folder, name)
+        if not os.path.isdir(model_path):
+            continue
+        try:
+            process(model_path)
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+            continue
+        manifest.record(stage, name)
+    return errors
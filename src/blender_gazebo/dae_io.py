@@ -0,0 +1,455 @@
+"""
+Reader and writer of the geometry of COLLADA (.dae) files, without Blender.
+The files are read with iterparse, converting the <float_array> and <p> elements into
+numpy arrays as they are found and freeing them afterwards, so the whole DOM is never
+built. The modified positions are written back by replacing only the text of the
+position <float_array> elements, so everything else in the document (materials, node
+transforms, effects...) is kept byte by byte. The positions are always the ones of the file,
+relative to their nodes, read_dae_with_transforms also returns the matrices of the nodes. write_dae writes a new document from any
+MeshGeometry, to convert meshes of other formats.
+"""
+# IMPORTS
+import os
+import re
+import numpy as np
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import quoteattr, escape
+from blender_gazebo.mesh_geometry import MeshGeometry
+# GLOBAL VARIABLES
+PRIMITIVE_TAGS = ("triangles", "polylist", "polygons")
+TRANSFORM_TAGS = ("matrix", "translate", "rotate", "scale")
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _tag(element):
+    """Tag of an element without the COLLADA namespace"""
+    return element.tag.rsplit("}", 1)[-1]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _inputs(element):
+    """Returns a list of (semantic, source_id, offset, set) for the <input> children of an element"""
+    inputs = list()
+    for child in element:
+        if _tag(child) == "input":
+            inputs.append((child.get("semantic"), child.get("source", "").lstrip("#"),
+                           int(child.get("offset", 0)), int(child.get("set", 0))))
+    return inputs
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _parse_primitive(element):
+    """
+    Returns a dictionary with the material, the inputs, the size of each face and the
+    indices (as a (corners, n_offsets) array) of a <triangles>, <polylist> or <polygons> element
+    """
+    inputs = _inputs(element)
+    stride = max([offset for _, _, offset, _ in inputs], default=0) + 1
+    p_texts, vcount = list(), None
+    for child in element:
+        if _tag(child) == "p":
+            p_texts.append(child.text or "")
+        elif _tag(child) == "vcount":
+            vcount = np.array((child.text or "").split(), dtype=np.int64)
+    indices = np.array(" ".join(p_texts).split(), dtype=np.int64).reshape(-1, stride)
+    tag = _tag(element)
+    if tag == "triangles":
+        sizes = np.full(len(indices) // 3, 3, dtype=np.int64)
+    elif tag == "polylist":
+        sizes = vcount
+    else:
+        sizes = np.array([len(text.split()) // stride for text in p_texts], dtype=np.int64)
+    return {"material": element.get("material"), "inputs": inputs, "sizes": sizes, "indices": indices}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _transform_matrix(element):
+    """4x4 matrix of a <matrix>, <translate>, <rotate> (axis and angle in degrees) or <scale> element of a node"""
+    values = np.array((element.text or "").split(), dtype=np.float64)
+    tag = _tag(element)
+    matrix = np.eye(4)
+    if tag == "matrix":
+        matrix = values.reshape(4, 4)
+    elif tag == "translate":
+        matrix[:3, 3] = values
+    elif tag == "scale":
+        matrix[:3, :3] = np.diag(values)
+    else:
+        axis, angle = values[:3] / np.linalg.norm(values[:3]), np.radians(values[3])
+        cross = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+        matrix[:3, :3] = np.cos(angle) * np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * np.outer(axis, axis)
+    return matrix
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _parse_document(path, convert_arrays=True):
+    """
+    Go through a .dae file with iterparse and return:
+    - float_arrays: {id: values} (the values are None if convert_arrays is False)
+    - sources: {source_id: (float_array_id, stride)}
+    - geometries: list of (geometry_id, geometry_name, {semantic: source_id} of <vertices>, primitives)
+    - geometry_nodes: {geometry_id: (name, 4x4 matrix) of the first node that instances it}, the
+      matrix is the composition of the transforms of the node and all its parents
+    """
+    float_arrays, sources, geometries, geometry_nodes = dict(), dict(), list(), dict()
+    vertices, primitives, nodes, open_tags = dict(), list(), list(), list()
+    accessor = None
+    for event, element in iterparse(path, events=("start", "end")):
+        tag = _tag(element)
+        if event == "start":
+            open_tags.append(tag)
+            if tag == "node":
+                nodes.append([element.get("name", element.get("id")), np.eye(4) if len(nodes) == 0 else nodes[-1][1]])
+            elif tag == "instance_geometry" and len(nodes) > 0:
+                geometry_nodes.setdefault(element.get("url", "").lstrip("#"), tuple(nodes[-1]))
+            continue
+        open_tags.pop()
+        if tag == "node":
+            nodes.pop()
+        elif tag in TRANSFORM_TAGS and len(open_tags) > 0 and open_tags[-1] == "node":
+            # The transforms of a node come before its instances and children
+            nodes[-1][1] = nodes[-1][1] @ _transform_matrix(element)
+        elif tag == "float_array":
+            values = np.array((element.text or "").split(), dtype=np.float64) if convert_arrays else None
+            float_arrays[element.get("id")] = values
+            element.clear()
+        elif tag == "accessor":
+            accessor = (element.get("source", "").lstrip("#"), int(element.get("stride", 1)))
+        elif tag == "source":
+            if not accessor is None and accessor[0] in float_arrays:
+                sources[element.get("id")] = accessor
+            accessor = None
+        elif tag == "vertices":
+            vertices[element.get("id")] = {semantic: source for semantic, source, _, _ in _inputs(element)}
+        elif tag in PRIMITIVE_TAGS:
+            primitives.append(_parse_primitive(element) if convert_arrays else None)
+            element.clear()
+        elif tag == "geometry":
+            geometries.append((element.get("id"), element.get("name"), vertices, primitives))
+            vertices, primitives = dict(), list()
+            element.clear()
+    return float_arrays, sources, geometries, geometry_nodes
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _source_values(source_id, float_arrays, sources):
+    """Returns the values of a <source> as a (n, stride) array"""
+    array_id, stride = sources[source_id]
+    return float_arrays[array_id].reshape(-1, stride)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_dae(path):
+    """
+    Read the geometry of a .dae file into a MeshGeometry. Each <geometry> becomes an
+    object, named as the node that instances it (as Blender does when importing it).
+    The positions are the ones of the file, the transforms of the nodes are not applied
+    to them (read_dae_with_transforms returns them)
+    """
+    return read_dae_with_transforms(path)[0]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_dae_asset(path):
+    """
+    Returns (meter, up_axis) from the <asset> of a .dae file: the length in meters of its unit
+    and its up axis ("Y_UP", "Z_UP"...), (1.0, "Y_UP") if they are not given, as in COLLADA.
+    Only the beginning of the file is read
+    """
+    meter, up_axis = 1.0, "Y_UP"
+    for event, element in iterparse(path, events=("end",)):
+        tag = _tag(element)
+        if tag == "unit":
+            meter = float(element.get("meter", 1.0))
+        elif tag == "up_axis":
+            up_axis = (element.text or up_axis).strip()
+        elif tag == "asset":
+            break
+    return meter, up_axis
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_dae_with_transforms(path):
+    """
+    Read the geometry of a .dae file as read_dae, and the 4x4 matrix that places each of its
+    objects in the scene (the transforms of the node that instances it and of its parents,
+    the identity if it is not instanced). Returns (geometry, list of matrices)
+    """
+    float_arrays, sources, geometries, geometry_nodes = _parse_document(path)
+    matrices = list()
+    positions, normals, uvs = list(), list(), list()
+    face_vertices, face_uvs, face_normals, face_sizes = list(), list(), list(), list()
+    statements, vertex_ranges = list(), list()
+    n_positions = n_normals = n_uvs = n_faces = 0
+    for geometry_id, geometry_name, vertices, primitives in geometries:
+        if len(vertices) == 0:
+            continue
+        vertex_inputs = next(iter(vertices.values()))
+        geometry_positions = _source_values(vertex_inputs["POSITION"], float_arrays, sources)[:, :3]
+        positions.append(geometry_positions)
+        vertex_ranges.append((n_positions, n_positions + len(geometry_positions)))
+        node_name, matrix = geometry_nodes.get(geometry_id, (geometry_name or geometry_id, np.eye(4)))
+        statements.append((n_faces, "o " + node_name))
+        matrices.append(matrix)
+        # Each normal and uv source is appended once, and indexed with its offset
+        normal_bases, uv_bases = dict(), dict()
+        for primitive in primitives:
+            if not primitive["material"] is None:
+                statements.append((n_faces, "usemtl " + primitive["material"]))
+            indices = primitive["indices"]
+            v = vt = vn = None
+            uv_set = None
+            for semantic, source, offset, set_number in primitive["inputs"]:
+                if semantic == "VERTEX":
+                    v = indices[:, offset]
+                elif semantic == "NORMAL":
+                    if not source in normal_bases:
+                        normal_bases[source] = n_normals
+                        normals.append(_source_values(source, float_arrays, sources)[:, :3])
+                        n_normals += len(normals[-1])
+                    vn = indices[:, offset] + normal_bases[source]
+                elif semantic == "TEXCOORD" and (uv_set is None or set_number < uv_set):
+                    uv_set = set_number
+                    if not source in uv_bases:
+                        uv_bases[source] = n_uvs
+                        uvs.append(_source_values(source, float_arrays, sources)[:, :2])
+                        n_uvs += len(uvs[-1])
+                    vt = indices[:, offset] + uv_bases[source]
+            if vn is None and "NORMAL" in vertex_inputs:
+                source = vertex_inputs["NORMAL"]
+                if not source in normal_bases:
+                    normal_bases[source] = n_normals
+                    normals.append(_source_values(source, float_arrays, sources)[:, :3])
+                    n_normals += len(normals[-1])
+                vn = v + normal_bases[source]
+            face_vertices.append(v + n_positions)
+            face_normals.append(np.full(len(v), -1, dtype=np.int64) if vn is None else vn)
+            face_uvs.append(np.full(len(v), -1, dtype=np.int64) if vt is None else vt)
+            face_sizes.append(primitive["sizes"])
+            n_faces += len(primitive["sizes"])
+        n_positions += len(geometry_positions)
+    face_sizes = np.concatenate(face_sizes) if len(face_sizes) > 0 else np.zeros(0, dtype=np.int64)
+    return MeshGeometry(
+        np.concatenate(positions) if len(positions) > 0 else np.zeros((0, 3)),
+        normals=np.concatenate(normals) if len(normals) > 0 else None,
+        uvs=np.concatenate(uvs) if len(uvs) > 0 else None,
+        face_vertices=np.concatenate(face_vertices) if len(face_vertices) > 0 else None,
+        face_uvs=np.concatenate(face_uvs) if len(face_uvs) > 0 else None,
+        face_normals=np.concatenate(face_normals) if len(face_normals) > 0 else None,
+        face_offsets=np.concatenate([[0], np.cumsum(face_sizes)]),
+        statements=statements,
+        vertex_ranges=vertex_ranges), matrices
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _position_array_ids(path):
+    """
+    Returns the ids of the <float_array> elements that hold the positions of the
+    geometries of a .dae file, in the same order as read_dae reads them
+    """
+    float_arrays, sources, geometries, _ = _parse_document(path, convert_arrays=False)
+    array_ids = list()
+    for _, _, vertices, _ in geometries:
+        if len(vertices) == 0:
+            continue
+        array_id, stride = sources[next(iter(vertices.values()))["POSITION"]]
+        if stride != 3:
+            raise Exception(f"Positions with stride {stride} in {path} can not be written")
+        array_ids.append(array_id)
+    return array_ids
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_dae_positions(geometry: MeshGeometry, source_path, file_path=None):
+    """
+    Write the positions of a MeshGeometry read from source_path into the position arrays
+    of that same document, saving the result to file_path (source_path if not specified).
+    Only the text of the position arrays changes, the rest of the document is kept as is.
+    The positions are the ones of the file, relative to the nodes that instance each geometry,
+    as read_dae returns them (the transforms of the nodes still apply to them)
+    """
+    if file_path is None:
+        file_path = source_path
+    array_ids = _position_array_ids(source_path)
+    with open(source_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    spans, start_vertex = list(), 0
+    for array_id in array_ids:
+        match = re.search(r"""<float_array\b[^>]*\bid\s*=\s*(["'])""" + re.escape(array_id) + r"\1[^>]*>", text)
+        if match is None:
+            raise Exception(f"The position array {array_id} was not found in the text of {source_path}")
+        count = re.search(r"""\bcount\s*=\s*(["'])(\d+)\1""", match.group(0))
+        if count is None:
+            raise Exception(f"The position array {array_id} of {source_path} has no count")
+        count = int(count.group(2))
+        if match.group(0).endswith("/>"):
+            end = match.end()
+            if count > 0:
+                raise Exception(f"The position array {array_id} of {source_path} is empty but has a count of {count}")
+        else:
+            end = text.find("</float_array>", match.end())
+            if end < 0:
+                raise Exception(f"The position array {array_id} of {source_path} is not closed")
+        spans.append((match.end(), end, geometry.positions[start_vertex:start_vertex + count // 3]))
+        start_vertex += count // 3
+    if start_vertex != geometry.n_vertices:
+        raise Exception(f"The geometry has {geometry.n_vertices} vertices but {source_path} has {start_vertex}")
+    pieces, position = list(), 0
+    for start, end, values in sorted(spans, key=lambda span: span[0]):
+        pieces.append(text[position:start])
+        pieces.append(" ".join(values.ravel().astype(str).tolist()))
+        position = end
+    pieces.append(text[position:])
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("".join(pieces))
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _float_text(values):
+    return " ".join(np.asarray(values, dtype=np.float64).ravel().astype(str).tolist())
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _source_element(source_id, values, parameters):
+    """Text of a <source> element with a float array of len(parameters) columns"""
+    values = np.asarray(values, dtype=np.float64)[:, :len(parameters)]
+    params = "".join(f'<param name="{name}" type="float"/>' for name in parameters)
+    return (f'        <source id="{source_id}">\n'
+            f'          <float_array id="{source_id}-array" count="{values.size}">{_float_text(values)}</float_array>\n'
+            f'          <technique_common><accessor source="#{source_id}-array" count="{len(values)}" '
+            f'stride="{len(parameters)}">{params}</accessor></technique_common>\n'
+            f'        </source>\n')
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _used_values(indices, values):
+    """
+    If every corner has a value (index >= 0), returns the used values and the corner
+    indices into them, otherwise (None, None)
+    """
+    if len(indices) == 0 or len(values) == 0 or np.any(indices < 0):
+        return None, None
+    used, local_indices = np.unique(indices, return_inverse=True)
+    return values[used], local_indices.ravel()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _color_text(material, keyword, default):
+    """Text of an rgba <color> from the rgb values of a .mtl statement"""
+    values = [float(value) for value in material.get(keyword, default)[:3]]
+    values += values[-1:] * (3 - len(values))
+    return " ".join(str(value) for value in values + [1.0])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _effect_element(effect_id, material, folder):
+    """
+    Text of the <effect> of a material read with obj_io.read_mtl, and of the <image>
+    of its diffuse texture ("" if it has none), which is referenced relative to folder
+    """
+    image, newparams = "", ""
+    diffuse = f'<color sid="diffuse">{_color_text(material, "Kd", ["0.8"])}</color>'
+    if "map_Kd" in material:
+        texture = os.path.relpath(material["map_Kd"][0], folder)
+        image = f'    <image id="{effect_id}-image"><init_from>{escape(texture)}</init_from></image>\n'
+        newparams = (f'<newparam sid="{effect_id}-surface"><surface type="2D"><init_from>{effect_id}-image</init_from>'
+                     f'</surface></newparam><newparam sid="{effect_id}-sampler"><sampler2D>'
+                     f'<source>{effect_id}-surface</source></sampler2D></newparam>')
+        diffuse = f'<texture texture="{effect_id}-sampler" texcoord="UVMap"/>'
+    effect = (f'    <effect id="{effect_id}"><profile_COMMON>{newparams}<technique sid="common"><phong>'
+              f'<emission><color sid="emission">{_color_text(material, "Ke", ["0"])}</color></emission>'
+              f'<ambient><color sid="ambient">{_color_text(material, "Ka", ["0"])}</color></ambient>'
+              f'<diffuse>{diffuse}</diffuse>'
+              f'<specular><color sid="specular">{_color_text(material, "Ks", ["0.5"])}</color></specular>'
+              f'<shininess><float sid="shininess">{float(material.get("Ns", ["50"])[0])}</float></shininess>'
+              f'<transparency><float sid="transparency">{float(material.get("d", ["1"])[0])}</float></transparency>'
+              f'</phong></technique></profile_COMMON></effect>\n')
+    return effect, image
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_dae(geometry: MeshGeometry, path, materials=None, meter=1.0, up_axis="Z_UP"):
+    """
+    Write a MeshGeometry as a new COLLADA document, with the given unit (its length in meters)
+    and up axis (by default, meters and Z up, as gazebo uses). Each object of the
+    geometry becomes a <geometry> instanced by a node of the same name, with its vertices in the
+    order given by object_vertex_indices, so the indices of the vertices inside each object do
+    not change once it is imported into Blender. Normals and uvs are written for the objects in
+    which every corner has them.
+    The faces of each 'usemtl' run are written as a <polylist> bound to that material. The
+    materials are defined from materials, a dictionary as returned by obj_io.read_mtl (with the
+    colors, shininess, transparency and diffuse texture of each one), or with default colors if
+    they are not in it
+    """
+    materials = dict() if materials is None else materials
+    default_name = os.path.splitext(os.path.basename(path))[0]
+    lookup = np.full(geometry.n_vertices, -1, dtype=np.int64)
+    geometries, nodes, used_ids = list(), list(), set()
+    material_ids = dict()
+
+    def unique_id(name):
+        new_id = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+        while new_id in used_ids:
+            new_id += "_"
+        used_ids.add(new_id)
+        return new_id
+    material_runs = geometry.materials()
+    for n_object, (name, first_face, last_face) in enumerate(geometry.objects()):
+        name = default_name if name is None else name
+        object_id = unique_id(name)
+        mesh_id = object_id + "-mesh"
+        vertex_indices = geometry.object_vertex_indices(n_object)
+        lookup[vertex_indices] = np.arange(len(vertex_indices))
+        start, end = geometry.face_offsets[first_face], geometry.face_offsets[last_face]
+        columns = [lookup[geometry.face_vertices[start:end]]]
+        sources = _source_element(mesh_id + "-positions", geometry.positions[vertex_indices], "XYZ")
+        inputs = f'<input semantic="VERTEX" source="#{mesh_id}-vertices" offset="0"/>'
+        normals, normal_indices = _used_values(geometry.face_normals[start:end], geometry.normals)
+        if not normals is None:
+            sources += _source_element(mesh_id + "-normals", normals, "XYZ")
+            inputs += f'<input semantic="NORMAL" source="#{mesh_id}-normals" offset="{len(columns)}"/>'
+            columns.append(normal_indices)
+        uvs, uv_indices = _used_values(geometry.face_uvs[start:end], geometry.uvs)
+        if not uvs is None:
+            sources += _source_element(mesh_id + "-map", uvs, "ST")
+            inputs += f'<input semantic="TEXCOORD" source="#{mesh_id}-map" offset="{len(columns)}" set="0"/>'
+            columns.append(uv_indices)
+        sizes = geometry.face_sizes()
+        corners = np.stack(columns, axis=1).astype(str)
+        # One <polylist> for each run of faces with the same material, in the order of the faces
+        polylists, bindings = "", dict()
+        for material, run_first, run_last in material_runs:
+            run_first, run_last = max(run_first, first_face), min(run_last, last_face)
+            if run_first >= run_last:
+                continue
+            material_attribute = ""
+            if not material is None:
+                if not material in material_ids:
+                    material_ids[material] = unique_id(material) + "-material"
+                material_attribute = f" material={quoteattr(material)}"
+                bindings[material] = material_ids[material]
+            run_corners = corners[geometry.face_offsets[run_first] - start:geometry.face_offsets[run_last] - start]
+            polylists += (f'        <polylist count="{run_last - run_first}"{material_attribute}>{inputs}\n'
+                          f'          <vcount>{" ".join(sizes[run_first:run_last].astype(str).tolist())}</vcount>\n'
+                          f'          <p>{" ".join(run_corners.ravel().tolist())}</p>\n        </polylist>\n')
+        geometries.append(
+            f'    <geometry id="{mesh_id}" name={quoteattr(name)}>\n      <mesh>\n{sources}'
+            f'        <vertices id="{mesh_id}-vertices"><input semantic="POSITION" source="#{mesh_id}-positions"/></vertices>\n'
+            f'{polylists}      </mesh>\n    </geometry>\n')
+        bind_material = ""
+        if len(bindings) > 0:
+            bind_material = "<bind_material><technique_common>" + "".join(
+                f'<instance_material symbol={quoteattr(material)} target="#{material_id}">'
+                f'<bind_vertex_input semantic="UVMap" input_semantic="TEXCOORD" input_set="0"/></instance_material>'
+                for material, material_id in bindings.items()) + "</technique_common></bind_material>"
+        nodes.append(f'      <node id="{object_id}" name={quoteattr(name)} type="NODE">'
+                     f'<instance_geometry url="#{mesh_id}" name={quoteattr(name)}>{bind_material}</instance_geometry></node>\n')
+    images, effects, material_elements = list(), list(), list()
+    for material, material_id in material_ids.items():
+        effect_id = material_id[:-len("-material")] + "-effect"
+        effect, image = _effect_element(effect_id, materials.get(material, dict()), os.path.dirname(os.path.abspath(path)))
+        effects.append(effect)
+        if image != "":
+            images.append(image)
+        material_elements.append(f'    <material id="{material_id}" name={quoteattr(material)}>'
+                                 f'<instance_effect url="#{effect_id}"/></material>\n')
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n'
+                '<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">\n'
+                f'  <asset><unit name="meter" meter="{float(meter)}"/><up_axis>{escape(up_axis)}</up_axis></asset>\n')
+        for library, elements in (("images", images), ("effects", effects), ("materials", material_elements)):
+            if len(elements) > 0:
+                f.write(f"  <library_{library}>\n" + "".join(elements) + f"  </library_{library}>\n")
+        f.write('  <library_geometries>\n')
+        for text in geometries:
+            f.write(text)
+        f.write('  </library_geometries>\n'
+                '  <library_visual_scenes>\n    <visual_scene id="Scene" name="Scene">\n')
+        for text in nodes:
+            f.write(text)
+        f.write('    </visual_scene>\n  </library_visual_scenes>\n'
+                '  <scene><instance_visual_scene url="#Scene"/></scene>\n</COLLADA>\n')
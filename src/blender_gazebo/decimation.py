@@ -0,0 +1,563 @@
+"""
+Simplification of the meshes of gazebo models without Blender, by quadric error edge collapse
+(Garland and Heckbert), to generate lightweight collision meshes and levels of detail.
+The collapses are done in rounds over numpy arrays: in each round the cost of collapsing every
+edge is computed at once, and a set of cheap edges that do not share vertices is collapsed
+together, rejecting the collapses that would flip faces. The vertices of the borders of the mesh
+(edges used by a single face) are not moved by default, so the simplified tiles still join their
+neighbours without gaps.
+The collision mesh of a mesh is written next to it as <name>_collision, and only the <collision>
+references of the model.sdf are changed to use it, the <visual> ones keep the original mesh.
+"""
+# IMPORTS
+import os
+import time
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import blender_gazebo.obj_io as obj_io
+import blender_gazebo.dae_io as dae_io
+from blender_gazebo.gazebo_blender_model import GazeboBlenderModel, GazeboModelMesh
+from blender_gazebo.mesh_geometry import MeshGeometry
+from blender_gazebo.normalization import scale_in_scene, UNIT_SCALE
+from blender_gazebo.file_operations import write_file_atomically
+from blender_gazebo.change_tracking import ChangeManifest
+from blender_gazebo.instrumentation import count, traced
+# GLOBAL VARIABLES
+COLLISION_SUFFIX = "_collision"
+LOD_SUFFIX = "_lod"
+# Name of the decimation in the change manifests (change_tracking.ChangeManifest)
+STAGE_NAME = "decimation"
+# Minimum cosine between the normal of a face before and after a collapse for it to be accepted
+MIN_NORMAL_COSINE = 0.2
+# Number of times the selection of the edges to collapse is extended in each round
+MATCHING_PASSES = 4
+# Maximum number of (point, triangle) pairs compared at once by TriangleGrid.distances
+CHUNK_SIZE = 1 << 20
+# Rings of cells searched around a point before comparing it with all the triangles
+MAX_RINGS = 3
+
+# CLASSES
+class TriangleGrid:
+    """
+    Uniform grid over the triangles (F, 3) of a mesh, each triangle is in all the cells that its
+    bounding box overlaps. The distance of a point to the mesh is found by looking at the cells
+    around it in growing rings, until the triangles outside of them can not be closer.
+    - cell_size: side of the cells, by default the median size of the triangles
+    """
+
+    def __init__(self, positions, faces, cell_size=None):
+        self.corners = np.asarray(positions, dtype=np.float64)[faces]
+        low, high = self.corners.min(axis=1), self.corners.max(axis=1)
+        if cell_size is None:
+            cell_size = np.median((high - low).max(axis=1)) if len(faces) > 0 else 1.0
+        self.cell_size = max(float(cell_size), 1e-9)
+        self.origin = low.min(axis=0) if len(faces) > 0 else np.zeros(3)
+        first, last = self.cells_of(low), self.cells_of(high)
+        self.shape = last.max(axis=0) + 1 if len(faces) > 0 else np.ones(3, dtype=np.int64)
+        spans = last - first + 1
+        counts = np.prod(spans, axis=1)
+        triangles = np.repeat(np.arange(len(faces)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        spans = spans[triangles]
+        cells = first[triangles] + np.stack([local // (spans[:, 1] * spans[:, 2]), (local // spans[:, 2]) % spans[:, 1],
+                                             local % spans[:, 2]], axis=1)
+        keys = self._keys(cells)
+        order = np.argsort(keys, kind="stable")
+        self.triangles = triangles[order]
+        self.keys, self.starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self.ends = self.starts + counts
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {len(self.corners)} triangles in {len(self.keys)} cells of {self.cell_size:g}"
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def cells_of(self, points):
+        return np.floor((np.asarray(points, dtype=np.float64).reshape(-1, 3) - self.origin) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def _candidates(self, cells):
+        """Pairs (number of the cell in cells, triangle) of the triangles in each of the cells"""
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        keys = self._keys(np.where(inside[:, None], cells, 0))
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = inside & (self.keys[positions] == keys)
+        counts = np.where(found, self.ends[positions] - self.starts[positions], 0)
+        owners = np.repeat(np.arange(len(cells)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return owners, self.triangles[np.repeat(self.starts[positions], counts) + offsets]
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _closest(self, points, distances, queries, triangles):
+        """Lower distances[queries] to the distance from points[queries] to the triangles, in chunks"""
+        for start in range(0, len(queries), CHUNK_SIZE):
+            chunk_queries, chunk_triangles = queries[start:start + CHUNK_SIZE], triangles[start:start + CHUNK_SIZE]
+            corners = self.corners[chunk_triangles]
+            closest = closest_points_on_triangles(points[chunk_queries], corners[:, 0], corners[:, 1], corners[:, 2])
+            np.minimum.at(distances, chunk_queries, np.linalg.norm(closest - points[chunk_queries], axis=1))
+
+    def distances(self, points):
+        """Distance of each point to the nearest triangle (inf if there are no triangles)"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        distances = np.full(len(points), np.inf)
+        if len(self.keys) == 0:
+            return distances
+        cells = self.cells_of(points)
+        pending = np.arange(len(points))
+        ring = 0
+        while len(pending) > 0:
+            if ring > MAX_RINGS:
+                # The points far from the mesh are compared with every triangle
+                for point in pending:
+                    self._closest(points, distances, np.full(len(self.corners), point), np.arange(len(self.corners)))
+                break
+            offsets = np.array([offset for offset in itertools.product(range(-ring, ring + 1), repeat=3)
+                                if max(abs(value) for value in offset) == ring], dtype=np.int64)
+            points_per_chunk = max(1, CHUNK_SIZE // (len(offsets) * 8))
+            for start in range(0, len(pending), points_per_chunk):
+                chunk = pending[start:start + points_per_chunk]
+                for offset in offsets:
+                    owners, triangles = self._candidates(cells[chunk] + offset)
+                    self._closest(points, distances, chunk[owners], triangles)
+            # The triangles that were not looked at are outside of the searched cells, so they are
+            # at least as far as the border of those cells
+            low = self.origin + (cells[pending] - ring) * self.cell_size
+            high = self.origin + (cells[pending] + ring + 1) * self.cell_size
+            margins = np.minimum(points[pending] - low, high - points[pending]).min(axis=1)
+            covers_grid = np.all((cells[pending] - ring <= 0) & (cells[pending] + ring >= self.shape - 1), axis=1)
+            pending = pending[(distances[pending] > margins) & ~covers_grid]
+            ring += 1
+        return distances
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_geometry(path):
+    """
+    Read a mesh file. The transforms of the nodes of a .dae are baked into its positions, as the
+    simplified meshes are written with nodes without transforms
+    """
+    extension = str.lower(os.path.splitext(path)[1])
+    if extension == ".obj":
+        return obj_io.read_obj(path)
+    elif extension == ".dae":
+        geometry, matrices = dae_io.read_dae_with_transforms(path)
+        return scale_in_scene(geometry, UNIT_SCALE, matrices, keep_transforms=False)
+    raise Exception(f"Headless reading of {path} is not supported")
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_geometry(geometry: MeshGeometry, path, meter=1.0, up_axis="Z_UP"):
+    """
+    Write a new mesh file (the format is given by the extension), returns False if its contents did not change.
+    The .dae files are written with the given unit and up axis, those of the mesh they were read from
+    """
+    extension = str.lower(os.path.splitext(path)[1])
+    if extension == ".obj":
+        return write_file_atomically(path, lambda temporal_path: obj_io.write_obj(geometry, temporal_path))
+    elif extension == ".dae":
+        return write_file_atomically(
+            path, lambda temporal_path: dae_io.write_dae(geometry, temporal_path, meter=meter, up_axis=up_axis))
+    raise Exception(f"Headless writing of {path} is not supported")
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def face_planes(positions, faces):
+    """(F, 4) planes (unit normal, offset) of the triangles, and their (F, 3) normals before normalizing"""
+    corners = positions[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    unit_normals = normals / np.where(lengths > 0, lengths, 1)
+    offsets = -np.einsum("ij,ij->i", unit_normals, corners[:, 0])
+    return np.concatenate([unit_normals, offsets[:, None]], axis=1), normals
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def vertex_quadrics(positions, faces):
+    """(V, 4, 4) sum of the fundamental quadrics of the planes of the faces around each vertex"""
+    planes, _ = face_planes(positions, faces)
+    plane_quadrics = planes[:, :, None] * planes[:, None, :]
+    quadrics = np.zeros((len(positions), 4, 4))
+    for corner in range(3):
+        np.add.at(quadrics, faces[:, corner], plane_quadrics)
+    return quadrics
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def unique_edges(faces):
+    """(E, 2) sorted vertex pairs of the edges of the triangles, and the number of faces that use each one"""
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    n_vertices = int(faces.max()) + 1 if len(faces) > 0 else 0
+    keys, n_faces = np.unique(edges[:, 0] * n_vertices + edges[:, 1], return_counts=True)
+    return np.stack([keys // max(n_vertices, 1), keys % max(n_vertices, 1)], axis=1), n_faces
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def border_vertices(n_vertices, faces):
+    """(V,) mask of the vertices of edges that are not shared by exactly two faces (borders and non manifold edges)"""
+    edges, n_faces = unique_edges(faces)
+    border = np.zeros(n_vertices, dtype=bool)
+    border[edges[n_faces != 2].ravel()] = True
+    return border
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _quadric_costs(quadrics, points):
+    homogeneous = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+    return np.maximum(np.einsum("ni,nij,nj->n", homogeneous, quadrics, homogeneous), 0.0)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def collapse_targets(positions, quadrics, edges, locked):
+    """
+    Position of the vertex that replaces each edge and its quadric cost. It is the position that
+    minimizes the quadric of the edge, or the best of its ends and its middle if the quadric is
+    singular (flat regions). The edges with a locked end collapse into it
+    """
+    u, v = edges[:, 0], edges[:, 1]
+    edge_quadrics = quadrics[u] + quadrics[v]
+    a, b = edge_quadrics[:, :3, :3], edge_quadrics[:, :3, 3]
+    scale = np.abs(a).max(axis=(1, 2))
+    solvable = np.abs(np.linalg.det(a)) > 1e-9 * np.maximum(scale, 1e-300) ** 3
+    middles = (positions[u] + positions[v]) / 2
+    targets = middles.copy()
+    if np.any(solvable):
+        targets[solvable] = np.linalg.solve(a[solvable], -b[solvable][:, :, None])[:, :, 0]
+    # The optimal position can be far away from the edge when the quadric is almost singular
+    lengths = np.linalg.norm(positions[u] - positions[v], axis=1)
+    solvable &= np.linalg.norm(targets - middles, axis=1) <= 2 * lengths
+    costs = np.where(solvable, _quadric_costs(edge_quadrics, targets), np.inf)
+    for candidate in (middles, positions[u], positions[v]):
+        candidate_costs = _quadric_costs(edge_quadrics, candidate)
+        better = ~solvable & (candidate_costs < costs)
+        targets[better], costs[better] = candidate[better], candidate_costs[better]
+    for locked_end, position in ((locked[u], positions[u]), (locked[v], positions[v])):
+        targets[locked_end] = position[locked_end]
+    costs[locked[u] | locked[v]] = _quadric_costs(edge_quadrics[locked[u] | locked[v]], targets[locked[u] | locked[v]])
+    return targets, costs
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def select_independent_edges(edges, costs, n_vertices):
+    """
+    Indices of a set of edges without common vertices, preferring the cheapest ones: an edge
+    is selected if it is the cheapest of the remaining edges of both of its vertices
+    """
+    rank = np.empty(len(edges), dtype=np.int64)
+    rank[np.lexsort((np.arange(len(edges)), costs))] = np.arange(len(edges))
+    selected = np.zeros(len(edges), dtype=bool)
+    used = np.zeros(n_vertices, dtype=bool)
+    for _ in range(MATCHING_PASSES):
+        free = ~used[edges[:, 0]] & ~used[edges[:, 1]] & ~selected
+        if not np.any(free):
+            break
+        best = np.full(n_vertices, len(edges), dtype=np.int64)
+        np.minimum.at(best, edges[free, 0], rank[free])
+        np.minimum.at(best, edges[free, 1], rank[free])
+        chosen = free & (best[edges[:, 0]] == rank) & (best[edges[:, 1]] == rank)
+        if not np.any(chosen):
+            break
+        selected |= chosen
+        used[edges[chosen].ravel()] = True
+    return np.flatnonzero(selected)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _remove_duplicated_faces(faces):
+    """Mask of the faces that are not degenerate nor a repetition of a previous face"""
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+    indices = np.flatnonzero(keep)
+    corners = np.sort(faces[indices], axis=1)
+    order = np.lexsort((indices, corners[:, 2], corners[:, 1], corners[:, 0]))
+    repeated = np.zeros(len(order), dtype=bool)
+    repeated[1:] = np.all(corners[order[1:]] == corners[order[:-1]], axis=1)
+    unique = np.zeros(len(faces), dtype=bool)
+    unique[indices[order[~repeated]]] = True
+    return unique
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _remap_statements(statements, kept_face_of_triangle, n_faces):
+    """Move the statements of the original faces to the faces that are left, dropping the objects left without faces"""
+    remapped = [(int(np.searchsorted(kept_face_of_triangle, face)), line) for face, line in statements]
+    objects = [n for n, (_, line) in enumerate(remapped) if line.startswith("o ")]
+    empty = set()
+    for n, statement_number in enumerate(objects):
+        end = remapped[objects[n + 1]][0] if n + 1 < len(objects) else n_faces
+        if remapped[statement_number][0] >= end:
+            empty.add(statement_number)
+    return [statement for n, statement in enumerate(remapped) if not n in empty]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _collapse(positions, faces, edges, targets, selected, locked):
+    """New positions and faces after collapsing the selected edges, and the vertices kept and removed by each collapse"""
+    kept_ends = np.where(locked[edges[selected, 1]], edges[selected, 1], edges[selected, 0])
+    removed_ends = np.where(locked[edges[selected, 1]], edges[selected, 0], edges[selected, 1])
+    representatives = np.arange(len(positions))
+    representatives[removed_ends] = kept_ends
+    new_positions = positions.copy()
+    new_positions[kept_ends] = targets[selected]
+    return new_positions, representatives[faces], kept_ends, removed_ends
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _without_flips(positions, faces, old_normals, edges, targets, selected, locked):
+    """
+    Remove from the selected collapses the ones that flip (or collapse to a line) a face that
+    they move, until the rest can be done together. Returns them and the (R, 2) rejected edges
+    """
+    rejected = list()
+    while len(selected) > 0:
+        new_positions, new_faces, kept_ends, removed_ends = _collapse(positions, faces, edges, targets, selected, locked)
+        collapse_of_vertex = np.full(len(positions), -1, dtype=np.int64)
+        collapse_of_vertex[kept_ends] = np.arange(len(selected))
+        collapse_of_vertex[removed_ends] = np.arange(len(selected))
+        moved = np.any(collapse_of_vertex[faces] >= 0, axis=1)
+        degenerate = (new_faces[:, 0] == new_faces[:, 1]) | (new_faces[:, 1] == new_faces[:, 2]) | (new_faces[:, 2] == new_faces[:, 0])
+        check = np.flatnonzero(moved & ~degenerate)
+        _, new_normals = face_planes(new_positions, new_faces[check])
+        new_lengths = np.linalg.norm(new_normals, axis=1)
+        cosines = np.einsum("ij,ij->i", old_normals[check], new_normals) / np.where(new_lengths > 0, new_lengths, 1)
+        flipped = check[(cosines < MIN_NORMAL_COSINE) | (new_lengths == 0)]
+        if len(flipped) == 0:
+            break
+        flipping = np.unique(collapse_of_vertex[faces[flipped]])
+        flipping = flipping[flipping >= 0]
+        rejected.append(edges[selected[flipping]])
+        selected = np.delete(selected, flipping)
+    return selected, np.concatenate(rejected) if len(rejected) > 0 else np.zeros((0, 2), dtype=np.int64)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+@traced()
+def decimate_geometry(geometry: MeshGeometry, target_faces=None, max_error=None, preserve_borders=True, max_rounds=200):
+    """
+    Simplify a geometry by collapsing edges until it has target_faces triangles, or until every
+    collapse left would move the surface more than max_error (in the units of the mesh), whichever
+    comes first. The faces are triangulated, and the result has no normals nor uvs, only the
+    objects and the other statements of the original faces that are left.
+    With preserve_borders the vertices of the open borders of the mesh are not moved
+    """
+    assert not (target_faces is None and max_error is None), "a target_faces or a max_error is needed"
+    sizes = geometry.face_sizes()
+    face_of_triangle = np.repeat(np.arange(len(sizes)), np.maximum(sizes - 2, 0))
+    faces = geometry.triangles()
+    positions = geometry.positions.copy()
+    n_vertices = len(positions)
+    keep = _remove_duplicated_faces(faces)
+    faces, triangle_ids = faces[keep], np.flatnonzero(keep)
+    quadrics = vertex_quadrics(positions, faces)
+    locked = border_vertices(n_vertices, faces) if preserve_borders else np.zeros(n_vertices, dtype=bool)
+    target_faces = 0 if target_faces is None else target_faces
+    # Edges whose collapse flipped faces, they are not tried again until some other collapse is done
+    blocked = np.zeros(0, dtype=np.int64)
+    for _ in range(max_rounds):
+        if len(faces) <= target_faces:
+            break
+        edges, n_edge_faces = unique_edges(faces)
+        collapsible = ~(locked[edges[:, 0]] & locked[edges[:, 1]])
+        collapsible &= ~np.isin(edges[:, 0] * n_vertices + edges[:, 1], blocked)
+        edges, n_edge_faces = edges[collapsible], n_edge_faces[collapsible]
+        targets, costs = collapse_targets(positions, quadrics, edges, locked)
+        if not max_error is None:
+            affordable = np.sqrt(costs) <= max_error
+            edges, n_edge_faces, targets, costs = edges[affordable], n_edge_faces[affordable], targets[affordable], costs[affordable]
+        if len(edges) == 0:
+            break
+        selected = select_independent_edges(edges, costs, n_vertices)
+        old_normals = face_planes(positions, faces)[0][:, :3]
+        selected, rejected = _without_flips(positions, faces, old_normals, edges, targets, selected, locked)
+        blocked = np.union1d(blocked, rejected[:, 0] * n_vertices + rejected[:, 1])
+        if len(selected) == 0:
+            # Everything that was tried flips faces, the next round tries other edges
+            continue
+        # Do not remove (many) more faces than needed to reach the target
+        selected = selected[np.argsort(costs[selected], kind="stable")]
+        removed_faces = np.cumsum(n_edge_faces[selected])
+        selected = selected[:np.searchsorted(removed_faces, len(faces) - target_faces) + 1]
+        selected, rejected = _without_flips(positions, faces, old_normals, edges, targets, selected, locked)
+        if len(selected) == 0:
+            blocked = np.union1d(blocked, rejected[:, 0] * n_vertices + rejected[:, 1])
+            continue
+        blocked = np.zeros(0, dtype=np.int64)
+        new_positions, new_faces, kept_ends, removed_ends = _collapse(positions, faces, edges, targets, selected, locked)
+        positions = new_positions
+        np.add.at(quadrics, kept_ends, quadrics[removed_ends])
+        keep = _remove_duplicated_faces(new_faces)
+        faces, triangle_ids = new_faces[keep], triangle_ids[keep]
+        count("edges_collapsed", len(selected))
+    used, faces = np.unique(faces, return_inverse=True)
+    kept_face_of_triangle = face_of_triangle[triangle_ids]
+    statements = _remap_statements(geometry.statements, kept_face_of_triangle, len(triangle_ids))
+    return MeshGeometry(positions[used], face_vertices=faces.reshape(-1), statements=statements,
+                        vertex_colors=None if geometry.vertex_colors is None else geometry.vertex_colors[used])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def closest_points_on_triangles(points, a, b, c):
+    """Closest point of each triangle (a, b, c) to each point, all (N, 3) arrays"""
+    ab, ac, ap = b - a, c - a, points - a
+    d1, d2 = np.einsum("ij,ij->i", ab, ap), np.einsum("ij,ij->i", ac, ap)
+    bp = points - b
+    d3, d4 = np.einsum("ij,ij->i", ab, bp), np.einsum("ij,ij->i", ac, bp)
+    cp = points - c
+    d5, d6 = np.einsum("ij,ij->i", ab, cp), np.einsum("ij,ij->i", ac, cp)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = va + vb + vc
+        v = np.where(denominator != 0, vb / denominator, 0.0)
+        w = np.where(denominator != 0, vc / denominator, 0.0)
+        closest = a + ab * v[:, None] + ac * w[:, None]
+        # Regions of the edges and the vertices of the triangle, from the least to the most specific
+        t = np.clip((d4 - d3) / ((d4 - d3) + (d5 - d6)), 0, 1)
+        on_bc = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+        closest[on_bc] = (b + (c - b) * t[:, None])[on_bc]
+        t = np.clip(d2 / (d2 - d6), 0, 1)
+        on_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+        closest[on_ac] = (a + ac * t[:, None])[on_ac]
+        t = np.clip(d1 / (d1 - d3), 0, 1)
+        on_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+        closest[on_ab] = (a + ab * t[:, None])[on_ab]
+    on_c = (d6 >= 0) & (d5 <= d6)
+    closest[on_c] = c[on_c]
+    on_b = (d3 >= 0) & (d4 <= d3)
+    closest[on_b] = b[on_b]
+    on_a = (d1 <= 0) & (d2 <= 0)
+    closest[on_a] = a[on_a]
+    return closest
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def distances_to_surface(points, geometry: MeshGeometry):
+    """Distance of each point to the surface (the faces) of the geometry"""
+    return TriangleGrid(geometry.positions, geometry.triangles()).distances(points)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def surface_samples(geometry: MeshGeometry):
+    """Points on the surface of the geometry: its used vertices and the centers of its faces"""
+    faces = geometry.triangles()
+    corners = geometry.positions[faces]
+    return np.concatenate([geometry.positions[np.unique(faces)], corners.mean(axis=1)])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def hausdorff_distance(geometry_a: MeshGeometry, geometry_b: MeshGeometry):
+    """
+    Estimate of the (symmetric) Hausdorff distance between two surfaces, the largest distance
+    from the samples of each surface to the other one. Returns it and the mean distance
+    """
+    a_to_b = distances_to_surface(surface_samples(geometry_a), geometry_b)
+    b_to_a = distances_to_surface(surface_samples(geometry_b), geometry_a)
+    distances = np.concatenate([a_to_b, b_to_a])
+    if len(distances) == 0:
+        return 0.0, 0.0
+    return float(distances.max()), float(distances.mean())
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def decimation_stats(original: MeshGeometry, decimated: MeshGeometry, scale=1.0):
+    """Faces, vertices and error of a decimated geometry, the distances multiplied by scale"""
+    original_faces = len(original.triangles())
+    hausdorff, mean_distance = hausdorff_distance(original, decimated)
+    return {"faces_before": original_faces, "faces_after": decimated.n_faces,
+            "vertices_before": original.n_vertices, "vertices_after": decimated.n_vertices,
+            "face_reduction": 1 - decimated.n_faces / original_faces if original_faces > 0 else 0.0,
+            "hausdorff": hausdorff * scale, "mean_distance": mean_distance * scale}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def source_path_of(mesh: GazeboModelMesh):
+    """
+    File from which the collision mesh of a mesh is generated: the mesh itself, or for a mesh
+    that is already a <name>_collision mesh, the <name> mesh next to it if it still exists
+    """
+    name, extension = os.path.splitext(mesh.path)
+    if name.endswith(COLLISION_SUFFIX) and os.path.exists(name[:-len(COLLISION_SUFFIX)] + extension):
+        return name[:-len(COLLISION_SUFFIX)] + extension
+    return mesh.path
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def decimate_mesh(mesh: GazeboModelMesh, collision_ratio=0.1, lod_ratios=(), max_error=None, preserve_borders=True):
+    """
+    Write the collision mesh of a mesh, with collision_ratio times its faces, and point the
+    <collision> references of the mesh to it (in the tree of the model.sdf, which is not written).
+    A <name>_lod<n> mesh is also written for each ratio of lod_ratios (they are not referenced).
+    max_error limits how far (in the units of the model) the simplified surfaces can move.
+    Returns a description of what was done, None if the mesh is not used for collisions
+    """
+    collision_references = mesh.references_of_kind("collision")
+    if len(collision_references) == 0:
+        return None
+    source_path = source_path_of(mesh)
+    name, extension = os.path.splitext(source_path)
+    geometry = read_geometry(source_path)
+    # The unit and up axis of a .dae are kept, so the errors in meters include its unit
+    meter, up_axis = dae_io.read_dae_asset(source_path) if str.lower(extension) == ".dae" else (1.0, "Z_UP")
+    n_faces = len(geometry.triangles())
+    scale = max(abs(value) for value in mesh.scale) * meter
+    report = {"uri": mesh.uri, "source": source_path, "lods": list()}
+    for level, ratio in [(None, collision_ratio)] + list(enumerate(lod_ratios, start=1)):
+        decimated = decimate_geometry(geometry, target_faces=int(np.ceil(ratio * n_faces)),
+                                      max_error=None if max_error is None else max_error / scale,
+                                      preserve_borders=preserve_borders)
+        path = name + (COLLISION_SUFFIX if level is None else f"{LOD_SUFFIX}{level}") + extension
+        stats = decimation_stats(geometry, decimated, scale)
+        stats.update({"path": path, "ratio": ratio, "written": write_geometry(decimated, path, meter, up_axis)})
+        count("files_written", stats["written"])
+        if level is None:
+            report["collision"] = stats
+        else:
+            report["lods"].append(stats)
+    collision_uri = os.path.join(os.path.dirname(mesh.uri), os.path.basename(name) + COLLISION_SUFFIX + extension)
+    mesh.update_uri_in_xml_references(collision_uri, kind="collision")
+    report["collision"]["uri"] = collision_uri
+    return report
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+@traced()
+def decimate_model(model_path, collision_ratio=0.1, lod_ratios=(), max_error=None, preserve_borders=True):
+    """
+    Generate the collision meshes (and levels of detail) of all the meshes of the model in
+    model_path and write its model.sdf. Returns a dictionary with the model, the meshes that
+    were decimated and the errors that happened
+    """
+    report = {"model": model_path, "meshes": list(), "errors": list(), "seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        model = GazeboBlenderModel(model_path)
+    except Exception as e:
+        report["errors"].append(str(e))
+        return report
+    for mesh in model.meshes:
+        if mesh.path is None:
+            continue
+        try:
+            result = decimate_mesh(mesh, collision_ratio, lod_ratios, max_error, preserve_borders)
+            if not result is None:
+                report["meshes"].append(result)
+        except Exception as e:
+            report["errors"].append(f"{mesh.uri}: {e}")
+    model.flush()
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def decimate_models(folder, collision_ratio=0.1, lod_ratios=(), max_error=None, preserve_borders=True, workers=None,
+                    model_names=None, changes=None):
+    """
+    Decimate every model in a folder (or only the ones in model_names), each one in a worker of
+    a pool of processes (of os.cpu_count() workers if not specified). Returns the reports of
+    decimate_model. If a ChangeManifest is given as changes (or True, for the one of the folder),
+    only the models that changed since they were last decimated are decimated (the others get a
+    report with "skipped"), and they are recorded in it once decimated
+    """
+    if changes is True:
+        changes = ChangeManifest(folder)
+    if model_names is None:
+        model_names = [name for name in sorted(os.listdir(folder))
+                       if not name.startswith(".") and os.path.isdir(os.path.join(folder, name))]
+    paths = [os.path.join(folder, name) for name in model_names]
+    changed = None if changes is None else set(changes.changed_models(STAGE_NAME, model_names))
+    reports = {path: {"model": path, "meshes": list(), "errors": list(), "skipped": True} for path in paths
+               if not changed is None and not os.path.basename(path) in changed}
+    pending = [path for path in paths if not path in reports]
+    arguments = (collision_ratio, tuple(lod_ratios), max_error, preserve_borders)
+
+    def finish(report):
+        reports[report["model"]] = report
+        if not changes is None and len(report["errors"]) == 0:
+            changes.record(STAGE_NAME, os.path.basename(report["model"]))
+    if workers == 1:
+        for path in pending:
+            finish(decimate_model(path, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(decimate_model, path, *arguments) for path in pending]
+            for future in as_completed(futures):
+                finish(future.result())
+    return [reports[path] for path in paths]
@@ -0,0 +1,180 @@
+"""
+Low level file operations used to copy model files as cheaply as the filesystem allows, and to
+write them atomically, leaving the files untouched when their contents do not change.
+"""
+# IMPORTS
+import os
+import shutil
+import fcntl
+import filecmp
+import threading
+# GLOBAL VARIABLES
+# ioctl to share the data blocks of a file with another (btrfs, xfs, ...), from linux/fs.h
+FICLONE = 0x40049409
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def reflink_file(source, target):
+    """
+    Make target a copy-on-write clone of source. Returns False if the filesystem does not
+    support it (target is then left empty)
+    """
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            return False
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def copy_file_in_kernel(source, target):
+    """
+    Copy the contents of source into target without passing them through user space.
+    Returns False if copy_file_range is not available
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            return False
+    return remaining == 0
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def clone_file(source, target, hardlink=False):
+    """
+    Copy a file with the cheapest method available: a hardlink (only if hardlink is True,
+    the two paths then share the same file), a reflink, copy_file_range or a normal copy.
+    The permissions and times of the file are kept. Returns the method used
+    """
+    if os.path.lexists(target):
+        os.remove(target)
+    if hardlink:
+        try:
+            os.link(source, target)
+            return "hardlink"
+        except OSError:
+            pass
+    if reflink_file(source, target):
+        method = "reflink"
+    elif copy_file_in_kernel(source, target):
+        method = "copy_file_range"
+    else:
+        shutil.copyfile(source, target)
+        method = "copy"
+    shutil.copystat(source, target)
+    return method
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def clone_tree(source, target, hardlink_filter=None):
+    """
+    Copy the directory source and all its contents to target (which should not exist),
+    like 'cp -a' but without starting a process, cloning each file with clone_file.
+    The files for which hardlink_filter(path) returns True are hardlinked.
+    Returns the number of bytes cloned
+    """
+    n_bytes = 0
+    copied_folders = list()
+    for folder, _, files in os.walk(source):
+        target_folder = os.path.join(target, os.path.relpath(folder, source))
+        os.makedirs(target_folder, exist_ok=True)
+        copied_folders.append((folder, target_folder))
+        for file_name in files:
+            source_file = os.path.join(folder, file_name)
+            target_file = os.path.join(target_folder, file_name)
+            if os.path.islink(source_file):
+                os.symlink(os.readlink(source_file), target_file)
+                continue
+            hardlink = not hardlink_filter is None and hardlink_filter(source_file)
+            clone_file(source_file, target_file, hardlink=hardlink)
+            n_bytes += os.path.getsize(source_file)
+    # The times of the folders are copied at the end, once their contents do not change anymore
+    for folder, target_folder in reversed(copied_folders):
+        shutil.copystat(folder, target_folder)
+    return n_bytes
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def break_hardlink(path):
+    """
+    If path is hardlinked to other files, replace it with its own copy (cloned as cheaply as
+    possible), so that writing to it does not change the others. Returns True if it was linked
+    """
+    if os.stat(path).st_nlink <= 1:
+        return False
+    temporal_path = temporal_path_for(path)
+    try:
+        clone_file(path, temporal_path)
+        os.replace(temporal_path, path)
+    finally:
+        if os.path.exists(temporal_path):
+            os.remove(temporal_path)
+    return True
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def temporal_path_for(path):
+    """Path of a temporary file in the same folder as path and with its extension, unique to the thread"""
+    root, extension = os.path.splitext(path)
+    return f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def replace_if_changed(temporal_path, path):
+    """
+    Move temporal_path to path with os.replace, so that path is never left half written.
+    If path already has the same contents it is not modified (keeping its modification time)
+    and temporal_path is deleted. Returns True if path was replaced
+    """
+    if os.path.isfile(path) and filecmp.cmp(temporal_path, path, shallow=False):
+        os.remove(temporal_path)
+        return False
+    if os.path.exists(path):
+        shutil.copymode(path, temporal_path)
+    os.replace(temporal_path, path)
+    return True
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_file_atomically(path, writer):
+    """
+    Call writer(temporal_path) to write the new contents of path, and then replace_if_changed.
+    temporal_path has the same name as path but is in a temporary folder next to it, so the
+    files that the writer creates beside it (the .mtl of an .obj exported by Blender) keep their
+    names, and are also moved next to path. Returns True if path was replaced
+    """
+    folder, file_name = os.path.split(os.path.abspath(path))
+    temporal_folder = os.path.join(folder, f".{file_name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    os.makedirs(temporal_folder)
+    try:
+        writer(os.path.join(temporal_folder, file_name))
+        replaced = replace_if_changed(os.path.join(temporal_folder, file_name), os.path.abspath(path))
+        for other_file in os.listdir(temporal_folder):
+            replace_if_changed(os.path.join(temporal_folder, other_file), os.path.join(folder, other_file))
+        return replaced
+    finally:
+        shutil.rmtree(temporal_folder, ignore_errors=True)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_bytes_atomically(path, data: bytes):
+    """Write data to path through a temporary file, unless path already contains it. Returns True if path was replaced"""
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    temporal_path = temporal_path_for(path)
+    try:
+        with open(temporal_path, "wb") as f:
+            f.write(data)
+        if os.path.exists(path):
+            shutil.copymode(path, temporal_path)
+        os.replace(temporal_path, path)
+        return True
+    finally:
+        if os.path.exists(temporal_path):
+            os.remove(temporal_path)
@@ -3,12 +3,22 @@ Classes to manipulate gazebo models and their different components, and to manip
 Blender.
 """
 # IMPORTS
-from xml.etree.ElementTree import ElementTree
+from xml.etree.ElementTree import ElementTree, iterparse, ParseError
+import io
 import os
 import json
 import shutil
+import copy
+import zipfile
 from subprocess import call
-import blender_gazebo.blender_functions as blender
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import blender_gazebo.obj_io as obj_io
+import blender_gazebo.dae_io as dae_io
+import blender_gazebo.point_sets as point_sets
+import blender_gazebo.vertex_index as vertex_index
+from blender_gazebo.file_operations import clone_tree, write_bytes_atomically, write_file_atomically
+from blender_gazebo.sdf_stream import SdfTextEditor, iter_sdf_meshes
+from blender_gazebo.instrumentation import span, count, traced
 # GLOBAL VARIABLES
 SUBT_MODELS_DIRECTORY = "/home/lorenzo/git/subt_gazebo/models"
 
@@ -24,24 +34,68 @@ def cp_dir(source, target):
 
 
 #-----------------------------------------------------------------------------------------------------------------------------------
-def models_from_folder(folder: str):
+def models_from_folder(folder: str, workers: int = None, executor: str = "thread", lazy: bool = None, catalog = None):
     """
     Given a folder containing gazebo models, iterate
     over elements of folder and create instances of GazeboModel 
-    for each
+    for each.
+    - workers: if given, the models are parsed in a pool of that many workers
+    - executor: "thread" or "process", the kind of pool used when workers is given
+    - lazy: return LazyGazeboBlenderModel handles, that only parse the xml files
+      and the meshes the first time they are needed. By default the handles are
+      lazy only when a catalog is given
+    - catalog: a model_catalog.ModelCatalog of the folder, if given, only the models
+      that changed since the last call are parsed to update it, and the models are
+      built from the entries of the catalog
+    The returned list has the same models and the same order in every mode
     """
     assert os.path.isdir(folder)
+    assert executor in ("thread", "process"), f"unknown executor {executor}"
+    if lazy is None:
+        lazy = not catalog is None
+    if not catalog is None:
+        catalog.refresh(workers=workers, executor=executor)
+        for error in catalog.errors().values():
+            print(error)
+        return catalog.models(lazy=lazy, workers=workers, executor=executor)
+    # Hidden entries (like backup stores) are never models
+    paths = [os.path.join(folder, model_name) for model_name in os.listdir(folder) if not model_name.startswith(".")]
+    model_class = LazyGazeboBlenderModel if lazy else GazeboBlenderModel
     list_of_models = list()
-    for model_name in os.listdir(folder):
-        try:
-            list_of_models.append(GazeboBlenderModel(
-                os.path.join(folder, model_name)))
-        except Exception as e:
-            print(e)
+    for model, error in load_models(paths, model_class, workers, executor):
+        if error is None:
+            list_of_models.append(model)
+        else:
+            print(error)
     return list_of_models
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def load_models(paths, model_class, workers: int = None, executor: str = "thread"):
+    """
+    Create a model of the given class for each path, in a pool of workers if
+    workers is given. Returns a list of tuples (model, error) in the order of paths
+    """
+    if workers is None or workers <= 1:
+        return [_load_model_or_error(path, model_class) for path in paths]
+    pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        return list(pool.map(_load_model_or_error, paths, [model_class] * len(paths)))
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _load_model_or_error(path, model_class):
+    """
+    Create a model of the given class, returns a tuple (model, error), where
+    one of the two is None. Used by load_models so that a pool of
+    workers can report errors back in the same order as the folder
+    """
+    try:
+        return model_class(path), None
+    except Exception as e:
+        return None, e
     
 #-----------------------------------------------------------------------------------------------------------------------------------
-def copy_model_with_different_name(model, new_name, destination_folder  = None):
+@traced()
+def copy_model_with_different_name(model, new_name, destination_folder  = None, link_meshes = False):
     '''
     This function takes a GazeboModel object, and copies it to 
     a different folder, changing the name inside the archives
@@ -50,6 +104,12 @@ def copy_model_with_different_name(model, new_name, destination_folder  = None):
     - The name in the model.sdf file
     - The name in the model.config file
     - The uri of the meshes inside the model.sdf files
+    The files are copied without starting any process, with reflinks when the filesystem
+    allows it. If link_meshes is True, the mesh files are hardlinked instead, which should
+    only be done if the meshes of the copy are not going to be modified.
+    The model.sdf and model.config of the copy are generated from the already parsed
+    files of the original model, so they are not read again. Only the name and the uris
+    are changed in the text of the model.sdf, the rest of the file is kept as it was
     '''
     assert isinstance(model, GazeboBlenderModel)
     # First, copy all the contents fo the model to new folder
@@ -61,20 +121,37 @@ def copy_model_with_different_name(model, new_name, destination_folder  = None):
         copied_model_path = os.path.join(destination_folder, new_name)
     if os.path.isdir(copied_model_path):
         shutil.rmtree(copied_model_path)
-    cp_dir(model.base_folder, copied_model_path)
+    mesh_paths = set(os.path.abspath(mesh.path) for mesh in model.meshes if not mesh.path is None)
+    hardlink_filter = (lambda path: os.path.abspath(path) in mesh_paths) if link_meshes else None
+    count("bytes_copied", clone_tree(model.base_folder, copied_model_path, hardlink_filter=hardlink_filter))
     # Second change the name in the model.config and model.sdf files
-    copied_model = GazeboBlenderModel(copied_model_path)
-    copied_model.change_name(new_name)
+    config_tree = copy.deepcopy(model.config_tree)
+    sdf_tree = copy.deepcopy(model.sdf_tree)
+    config_tree.find("name").text = new_name
+    sdf_tree.find("model").attrib["name"] = new_name
     # Third, change the base path of the URIs of the meshes
-    for mesh in copied_model.meshes:
-        assert isinstance(mesh, GazeboModelMesh)
-        for xml_reference in mesh.xml_elements:
-            original_uri = xml_reference.find("uri").text
-            new_uri = change_uri_root(original_uri, new_name)
-            xml_reference.find("uri").text = new_uri
-            print(xml_reference.find("uri").text)
-    copied_model.write_sdf_file()
+    for mesh_element in sdf_tree.iter("mesh"):
+        uri_element = mesh_element.find("uri")
+        if not uri_element is None and not uri_element.text is None:
+            uri_element.text = change_uri_root(uri_element.text, new_name)
+    copied_model = GazeboBlenderModel.from_trees(copied_model_path, config_tree, sdf_tree)
+    copied_model.mark_dirty("config", "sdf")
+    copied_model.flush()
     return copied_model
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def copy_model_with_different_names(model, new_names, destination_folder = None, link_meshes = False, workers = None):
+    '''
+    Copy a model once for each of the new names, see copy_model_with_different_name.
+    If workers is given, the copies are made in a pool of that many threads.
+    Returns the list of copied models, in the same order as new_names
+    '''
+    def copy_with_name(new_name):
+        return copy_model_with_different_name(model, new_name, destination_folder, link_meshes)
+    if workers is None or workers <= 1:
+        return [copy_with_name(new_name) for new_name in new_names]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(copy_with_name, new_names))
     
 #-----------------------------------------------------------------------------------------------------------------------------------
 def is_type_in_folder(folder, type_termination):
@@ -118,6 +195,7 @@ def try_fix_xml_for_first_line(path):
         raise
 
 # -----------------------------------------------------------------------------------------------------------------------------------
+@traced()
 def load_xml_file(path,  after_fix= False):
     """
     Create an ElementTree form an .xml file, 
@@ -135,6 +213,45 @@ def load_xml_file(path,  after_fix= False):
                 f"Problem reading xml file for {path} and no fix available")
     return tree
 
+#-----------------------------------------------------------------------------------------------------------------------------------
+def check_xml_file(path):
+    """
+    Go through an .xml file without building its tree. As load_xml_file, if it can not
+    be parsed, it tries to fix it, and raises an exception if it still can not be parsed
+    """
+    try:
+        for _ in iterparse(path):
+            pass
+    except ParseError:
+        if not try_to_fix_xml_file(path):
+            raise Exception(f"Problem reading xml file for {path} and no fix available")
+        check_xml_file(path)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def mesh_path_of_uri(base_folder, uri):
+    """Path of the file of a mesh uri of a model, the meshes are always looked for in its meshes folder"""
+    return os.path.join(base_folder, "meshes", os.path.basename(uri))
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def scan_model_meshes(base_folder, sdf_file_path):
+    """
+    Returns the meshes referenced by the model.sdf of a model, streaming it with
+    sdf_stream.iter_sdf_meshes instead of building its tree, as a list of dictionaries with
+    the uri, path, scale and number of references of each mesh file. Raises the same
+    exceptions as GazeboBlenderModel when the file can not be parsed or a mesh file is missing
+    """
+    meshes_by_path = dict()
+    for reference in iter_sdf_meshes(sdf_file_path):
+        path = None if reference.uri is None else mesh_path_of_uri(base_folder, reference.uri)
+        if not path is None and not os.path.exists(path):
+            raise Exception("The mesh file does not exist")
+        if path in meshes_by_path:
+            meshes_by_path[path]["n_references"] += 1
+            continue
+        meshes_by_path[path] = {"uri": reference.uri, "path": path, "n_references": 1,
+                                "scale": (1.0, 1.0, 1.0) if reference.scale is None else reference.scale}
+    return list(meshes_by_path.values())
+
 #-----------------------------------------------------------------------------------------------------------------------------------
 def change_uri_root(original_gazebo_uri, new_model_name):
     """
@@ -163,11 +280,29 @@ class GazeboBlenderModel:
     """
 
     def __init__(self, path):
-        self.base_folder = path
-        self.name = os.path.basename(path)
-        self._check_contents_of_base_folder()
-        self._load_files()
-        self._parse_sdf_file()
+        with span("GazeboBlenderModel", model=path):
+            self.base_folder = path
+            self.name = os.path.basename(path)
+            self._dirty_files = set()
+            self._check_contents_of_base_folder()
+            self._load_files()
+            self._parse_sdf_file()
+
+    @classmethod
+    def from_trees(cls, path, config_tree, sdf_tree):
+        """
+        Create the model of the folder path from the already parsed model.config
+        and model.sdf files, instead of reading them from the folder
+        """
+        model = cls.__new__(cls)
+        model.base_folder = path
+        model.name = os.path.basename(path)
+        model._dirty_files = set()
+        model._check_contents_of_base_folder()
+        model.config_tree = config_tree
+        model.sdf_tree = sdf_tree
+        model._parse_sdf_file()
+        return model
 
     def __str__(self):
         return f"{self.__class__.__name__} of {self.name}"
@@ -205,44 +340,125 @@ class GazeboBlenderModel:
         """
         # Extrat the relevant info fromt the sdf file
         self.meshes = list()
-        for child in self.sdf_tree.iter():
-            if child.tag == "mesh":
-                m = GazeboModelMesh(self, child)
-                if not m in self.meshes:
-                    self.meshes.append(m)
-                else:
-                    self.meshes[self.meshes.index(m)].add_xml_reference(child)
+        # The meshes that point to the same file are the same mesh, with several references
+        meshes_by_path = dict()
+        for child in self.sdf_tree.iter("mesh"):
+            m = GazeboModelMesh(self, child)
+            if not m.path in meshes_by_path:
+                meshes_by_path[m.path] = m
+                self.meshes.append(m)
+            else:
+                meshes_by_path[m.path].add_xml_reference(child)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def mark_dirty(self, *files):
+        '''
+        Record that the tree of "sdf" or "config" was changed, so that flush writes its file
+        '''
+        for file in files:
+            assert file in ("sdf", "config"), f"unknown file {file}"
+            self._dirty_files.add(file)
+
+    @property
+    def is_dirty(self):
+        """True if there are changes of the model.sdf, model.config or meshes that have not been written"""
+        return len(self._dirty_files) > 0 or any(mesh.is_dirty for mesh in self.meshes)
+
+    def flush(self):
+        '''
+        Write all the pending changes: the model.config and model.sdf files if their trees were
+        changed, and the geometry and the recorded points of the meshes that were modified.
+        The files are replaced atomically, and not touched if their contents did not change.
+        Returns the number of files written
+        '''
+        written = 0
+        if "config" in self._dirty_files:
+            written += self.write_config_file()
+        if "sdf" in self._dirty_files:
+            written += self.patch_sdf_file()
+        for mesh in self.meshes:
+            written += mesh.flush()
+        return written
 
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     def write_sdf_file(self):
         '''
-        Re-write the info in the model.sdf file
+        Re-write the info in the model.sdf file, returns True if its contents changed
+        '''
+        buffer = io.BytesIO()
+        self.sdf_tree.write(buffer)
+        self._dirty_files.discard("sdf")
+        if write_bytes_atomically(self.sdf_file_path, buffer.getvalue()):
+            count("files_written")
+            return True
+        return False
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def patch_sdf_file(self):
+        '''
+        Write the model name and the uris and scales of the meshes of the tree into the model.sdf
+        file, changing only their text, so that comments and formatting are kept. If the meshes
+        of the file do not match those of the tree, the whole tree is written instead
         '''
-        self.sdf_tree.write(self.sdf_file_path)
+        editor = SdfTextEditor(self.sdf_file_path)
+        mesh_elements = list(self.sdf_tree.iter("mesh"))
+        mesh_values = editor.mesh_values()
+        if len(mesh_values) != len(mesh_elements):
+            return self.write_sdf_file()
+        for mesh_number, (element, (uri, scale)) in enumerate(zip(mesh_elements, mesh_values)):
+            uri_element, scale_element = element.find("uri"), element.find("scale")
+            if not uri_element is None and uri_element.text != uri:
+                editor.set_mesh_uri(mesh_number, uri_element.text)
+            if not scale_element is None and scale_element.text != scale:
+                editor.set_mesh_scale(mesh_number, scale_element.text)
+        model_element = self.sdf_tree.find("model")
+        if not model_element is None:
+            editor.set_model_name(model_element.attrib["name"])
+        self._dirty_files.discard("sdf")
+        if editor.save():
+            count("files_written")
+            return True
+        return False
 
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     def write_config_file(self):
         '''
-        Re-write the info in the model.config file
+        Re-write the info in the model.config file, returns True if its contents changed
         '''
-        self.config_tree.write(self.config_file_path)
+        buffer = io.BytesIO()
+        self.config_tree.write(buffer)
+        self._dirty_files.discard("config")
+        if write_bytes_atomically(self.config_file_path, buffer.getvalue()):
+            count("files_written")
+            return True
+        return False
 
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    def create_backup(self):
+    @traced()
+    def create_backup(self, store = None, snapshot_id = None):
         """
         Copy the contents of all the mesh files and the model.sdf file into 
-        a backup files
+        a backup files.
+        If a backup_store.BackupStore is given, the files are backed up in it instead,
+        in the snapshot snapshot_id (a new one if None), which is returned
         """
+        if not store is None:
+            return store.snapshot(self, snapshot_id=snapshot_id)
         shutil.copy(self.sdf_file_path,self.sdf_bkp_file_path)
         for mesh in self.meshes:
             assert isinstance(mesh, GazeboModelMesh)
             mesh.create_backup()
 
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    def restore_from_backup(self):
+    @traced()
+    def restore_from_backup(self, store = None, snapshot_id = None):
         '''
-        Restore the contents of the mesh files and the model.sdf file fromthe backup files
+        Restore the contents of the mesh files and the model.sdf file fromthe backup files.
+        If a backup_store.BackupStore is given, the files are restored from the snapshot
+        snapshot_id of the store (the newest one if None)
         '''
+        if not store is None:
+            return store.restore(self, snapshot_id=snapshot_id)
         shutil.copy(self.sdf_bkp_file_path, self.sdf_file_path)
         for mesh in self.meshes:
             assert isinstance(mesh, GazeboModelMesh)
@@ -251,12 +467,15 @@ class GazeboBlenderModel:
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     def change_name(self, new_name):
         '''
-        This function changes the name in the model.sdf and model.config files
+        This function changes the name in the model.sdf and model.config trees,
+        the files are written by flush
         '''
-        self.config_tree.find("name").text = new_name
-        self.write_config_file()
-        self.sdf_tree.find("model").attrib["name"] = new_name
-        self.write_sdf_file()
+        if self.config_tree.find("name").text != new_name:
+            self.config_tree.find("name").text = new_name
+            self.mark_dirty("config")
+        if self.sdf_tree.find("model").attrib["name"] != new_name:
+            self.sdf_tree.find("model").attrib["name"] = new_name
+            self.mark_dirty("sdf")
     
             
 
@@ -264,22 +483,91 @@ class GazeboBlenderModel:
 # -----------------------------------------------------------------------------------------------------------------------------------
 
 
+class LazyGazeboBlenderModel(GazeboBlenderModel):
+    """
+    Lightweight handle to a gazebo model. On creation the files of the model are only
+    checked, streaming them (so a handle is created for the same models for which a
+    GazeboBlenderModel can be created), the trees of the model.config and model.sdf files
+    and the meshes are built the first time that any of them is accessed
+    """
+    _LAZY_ATTRIBUTES = ("config_tree", "sdf_tree", "meshes")
+
+    def __init__(self, path):
+        self.base_folder = path
+        self.name = os.path.basename(path)
+        self._dirty_files = set()
+        self._check_contents_of_base_folder()
+        check_xml_file(self.config_file_path)
+        # Found by streaming the model.sdf, the model_catalog.ModelCatalog stores them
+        self.scanned_meshes = scan_model_meshes(self.base_folder, self.sdf_file_path)
+
+    @classmethod
+    def from_catalog_entry(cls, entry):
+        """
+        Create the handle from a model_catalog.CatalogEntry, the paths of the
+        entry are used as they are, without listing the base folder
+        """
+        model = cls.__new__(cls)
+        model.base_folder = entry.base_folder
+        model.name = os.path.basename(entry.base_folder)
+        model._dirty_files = set()
+        model.config_file_path = entry.config_file_path
+        model.sdf_file_path = entry.sdf_file_path
+        model.sdf_bkp_file_path = os.path.join(entry.base_folder, "__bkp__model.sdf")
+        model.meshes_folder = os.path.join(entry.base_folder, "meshes")
+        return model
+
+    def __getattr__(self, name):
+        # Only called when the attribute is not found, so once the model is loaded
+        # the access to these attributes has no overhead
+        if name in self._LAZY_ATTRIBUTES:
+            self._load_files()
+            self._parse_sdf_file()
+            return self.__dict__[name]
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @property
+    def is_loaded(self):
+        """True if the xml files and meshes of the model have already been parsed"""
+        return "meshes" in self.__dict__
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
 class GazeboModelMesh:
     """
     This class will be used to manipulate the data of the meshes used
     by the gazebo models. All the interaction with the files should be done 
-    from this class
+    from this class.
+    The BlenderMeshInfo of the mesh is only read the first time that mesh_info is used.
+    The geometry set with set_geometry is kept until flush is called
     """
+    __slots__ = ("parent", "xml_elements", "uri", "scale", "path", "folder", "file_name", "file_type",
+                 "backup_file_name", "backup_path", "_mesh_info", "_pending_geometry")
 
     def __init__(self, parent: GazeboBlenderModel, xml_element):
         self.parent = parent
         self.xml_elements = [xml_element,]
+        self._mesh_info = None
+        self._pending_geometry = None
         self._parse_data()
-        self.mesh_info = BlenderMeshInfo(self)
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     def __str__(self):
         return f"Model mesh: {self.uri}"
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @property
+    def mesh_info(self):
+        if self._mesh_info is None:
+            self._mesh_info = BlenderMeshInfo(self)
+        return self._mesh_info
+
+    @mesh_info.setter
+    def mesh_info(self, mesh_info):
+        self._mesh_info = mesh_info
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     def __eq__(self, other):
         """
@@ -289,6 +577,9 @@ class GazeboModelMesh:
             return other.path == self.path
         return False
 
+    def __hash__(self):
+        return hash(self.path)
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
     def _parse_data(self):
@@ -296,8 +587,7 @@ class GazeboModelMesh:
         self.uri = self.xml_elements[0].find("uri").text
         self.scale = self.xml_elements[0].find("scale")
         if not self.uri is None:
-            self.path = os.path.join(
-                self.parent.base_folder, "meshes", os.path.basename(self.uri))
+            self.path = mesh_path_of_uri(self.parent.base_folder, self.uri)
             self.folder, self.file_name = os.path.split(self.path)
             _, self.file_type = os.path.splitext(self.path)
             self.backup_file_name = "__bkp__" + self.file_name
@@ -340,26 +630,115 @@ class GazeboModelMesh:
         '''
         for ref in self.xml_elements:
             scale_element = ref.find("scale")
-            if not scale_element is None:
+            if not scale_element is None and scale_element.text != new_scale:
                 scale_element.text = new_scale
+                self.parent.mark_dirty("sdf")
 
 #- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    def update_uri_in_xml_references(self, new_uri):
+    def references_of_kind(self, kind):
+        '''The xml references to this mesh that are inside a <visual> or a <collision> (kind) element'''
+        inside = set()
+        for element in self.parent.sdf_tree.iter(kind):
+            inside.update(element.iter("mesh"))
+        return [ref for ref in self.xml_elements if ref in inside]
+
+    def update_uri_in_xml_references(self, new_uri, kind=None):
         '''
         If the model should now load a new mesh file, this must be specified in the model.sdf (.xml)
-        file. With this function, the new uri can be specified and it will be modified
+        file. With this function, the new uri can be specified and it will be modified.
+        If kind is "visual" or "collision", only the references of that kind are changed
         '''
-        for ref in self.xml_elements:
+        for ref in (self.xml_elements if kind is None else self.references_of_kind(kind)):
             uri_element = ref.find("uri")
-            if not uri_element is None:
+            if not uri_element is None and uri_element.text != new_uri:
                 uri_element.text = new_uri
+                self.parent.mark_dirty("sdf")
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @traced()
+    def load_geometry(self):
+        '''
+        Read the mesh file into a MeshGeometry (numpy arrays), without using Blender.
+        If a geometry was set and has not been written, it is returned instead
+        '''
+        if not self._pending_geometry is None:
+            return self._pending_geometry
+        if str.lower(self.file_type) == ".obj":
+            return obj_io.read_obj(self.path)
+        elif str.lower(self.file_type) == ".dae":
+            return dae_io.read_dae(self.path)
+        raise Exception(f"Headless reading of {self.file_type} files is not supported")
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @traced()
+    def save_geometry(self, geometry, file_path=None):
+        '''
+        Write a MeshGeometry to the specified file, if no file is specified,
+        it is saved to the original file of the mesh. The .dae files are written
+        by changing the positions in the original .dae document of the mesh.
+        The file is replaced atomically, returns False if its contents did not change
+        '''
+        if file_path is None:
+            file_path = self.path
+        extension = str.lower(os.path.splitext(file_path)[1])
+        if extension == ".obj":
+            writer = lambda temporal_path: obj_io.write_obj(geometry, temporal_path)
+        elif extension == ".dae" and str.lower(self.file_type) == ".dae":
+            writer = lambda temporal_path: dae_io.write_dae_positions(geometry, self.path, temporal_path)
+        else:
+            raise Exception(f"Headless writing of {file_path} is not supported")
+        if not write_file_atomically(file_path, writer):
+            return False
+        count("files_written")
+        count("vertices_written", geometry.n_vertices)
+        return True
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def remap_points(self, old_geometry, tolerance=1e-4, old_positions=None):
+        '''
+        After the mesh file was written again with its vertices in a different order, move the
+        recorded points from the vertices of old_geometry (the geometry before it was written)
+        to the same vertices in the file, found by their positions. old_positions are the old
+        vertices in the coordinates of the new file, if it was transformed.
+        If the file has the same vertices and faces as old_geometry (only their positions were
+        edited) the indices are still valid and nothing is changed.
+        The points are written by flush. Returns the number of vertices that were not matched
+        '''
+        if not self.mesh_info.has_points():
+            return 0
+        new_geometry = self.load_geometry()
+        if old_positions is None and old_geometry.same_topology(new_geometry):
+            return 0
+        default_name = os.path.splitext(self.file_name)[0]
+        return self.mesh_info.remap_points(old_geometry, new_geometry, tolerance, old_positions, default_name)
+
+    def set_geometry(self, geometry):
+        '''Replace the geometry of the mesh, the file is written by flush'''
+        self._pending_geometry = geometry
+
+    @property
+    def is_dirty(self):
+        return not self._pending_geometry is None or (not self._mesh_info is None and self._mesh_info.dirty)
+
+    def flush(self):
+        '''Write the geometry and the recorded points if they were changed, returns the number of files written'''
+        written = 0
+        if not self._pending_geometry is None:
+            written += self.save_geometry(self._pending_geometry)
+            self._pending_geometry = None
+        if not self._mesh_info is None:
+            written += self._mesh_info.flush()
+        return written
 
     def select_ground_points(self, deselect_previous = True):
         """Select in blender the points asociated with the ground"""
+        # blender_functions is imported here so that this module can be used outside of Blender
+        import blender_gazebo.blender_functions as blender
         points_to_select = self.mesh_info.data["GROUND_POINTS"]
         blender.select_points(points_to_select, deselect_previous=deselect_previous)
     def select_upper_points(self, deselect_previous = True):
         """Select in blender the points asociated with the ground"""
+        import blender_gazebo.blender_functions as blender
         points_to_select = self.mesh_info.data["UPPER_POINTS"] 
         blender.select_points(points_to_select, deselect_previous=deselect_previous)
     def select_all_points(self):
@@ -370,8 +749,21 @@ class GazeboModelMesh:
 #-----------------------------------------------------------------------------------------------------------------------------------
 #-----------------------------------------------------------------------------------------------------------------------------------
 class BlenderMeshInfo:
-    def __init__(self, parent: GazeboModelMesh):
+    """
+    Information about a mesh recorded in Blender: the indices of the ground and upper points
+    of each of its objects. It is saved as sorted uint32 arrays in a MESH_info.npz file, which is
+    only read when the points are first used. The MESH_info.json files of the old format are
+    read if there is no .npz file, and are migrated to it the next time the data is written.
+    file_format="json" keeps reading and writing the old format.
+    Nothing is written until write_data_to_file (or flush, if the points were changed) is called
+    """
+    __slots__ = ("parent", "file_format", "blender_data_file_path", "points_file_path", "data", "dirty")
+
+    def __init__(self, parent: GazeboModelMesh, file_format = "npz"):
+        assert file_format in ("npz", "json"), f"unknown format {file_format}"
         self.parent = parent
+        self.file_format = file_format
+        self.dirty = False
         self.parse_blender_data_file()
 
     def parse_blender_data_file(self):
@@ -380,24 +772,68 @@ class BlenderMeshInfo:
         stores the data inside this class
         """
         self.blender_data_file_path = os.path.splitext(self.parent.path)[0] + "_info.json"
+        self.points_file_path = point_sets.points_file_path(self.blender_data_file_path)
+        use_npz = os.path.exists(self.points_file_path) and \
+            (self.file_format == "npz" or not os.path.exists(self.blender_data_file_path))
         try:
-            with open(self.blender_data_file_path,"r") as f:
-                self.data = json.load(f)
-        except: 
+            if use_npz:
+                self.data = point_sets.load_points_file(self.points_file_path)
+            else:
+                self.data = point_sets.load_json_points_file(self.blender_data_file_path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # No points recorded yet (or unreadable ones), the file is created when they are written
             self.data = {"UPPER_POINTS":{}, "GROUND_POINTS":{}}
-            self.write_data_to_file()
-            self.parse_blender_data_file()
- 
 
     def write_data_to_file(self):
-        with open(self.blender_data_file_path, "w") as f:
-            f.write(json.dumps(self.data,indent=1))
+        """Write the points atomically, returns False if the file already had them"""
+        if self.file_format == "npz":
+            written = write_file_atomically(
+                self.points_file_path, lambda temporal_path: point_sets.save_points_file(temporal_path, self.data))
+        else:
+            data = {points_type: {name: point_sets.PointSet(indices).tolist() for name, indices in points.items()}
+                    for points_type, points in self.data.items()}
+            written = write_bytes_atomically(self.blender_data_file_path, json.dumps(data,indent=1).encode())
+        self.dirty = False
+        if written:
+            count("files_written")
+        return written
+
+    def flush(self):
+        return self.write_data_to_file() if self.dirty else False
 
     def set_new_ground_points(self, new_ground_points):
-        self.data["GROUND_POINTS"] = new_ground_points 
+        self.data["GROUND_POINTS"] = point_sets.to_point_sets(new_ground_points)
+        self.dirty = True
 
     def set_new_upper_points(self, new_upper_points):
-        self.data["UPPER_POINTS"] = new_upper_points
+        self.data["UPPER_POINTS"] = point_sets.to_point_sets(new_upper_points)
+        self.dirty = True
+
+    def all_points(self):
+        """Union of the ground and upper points of each object"""
+        return point_sets.combine_selections(self.data["GROUND_POINTS"], self.data["UPPER_POINTS"], "union")
+
+    def has_points(self):
+        return any(len(indices) > 0 for points in self.data.values() for indices in points.values())
+
+    def n_points(self):
+        """Number of recorded points, of all the types and objects"""
+        return sum(len(indices) for points in self.data.values() for indices in points.values())
+
+    def remap_points(self, old_geometry, new_geometry, tolerance=1e-4, old_positions=None, default_name=None):
+        """
+        Translate the recorded points from the vertices of old_geometry to those of new_geometry,
+        matching them by position (see vertex_index.remap_selection). Returns the number of
+        vertices of new_geometry that had no vertex of old_geometry within tolerance
+        """
+        grid = vertex_index.VertexGrid(old_geometry.positions if old_positions is None else old_positions)
+        unmatched = 0
+        for points_type in list(self.data.keys()):
+            selection, unmatched = vertex_index.remap_selection(
+                old_geometry, new_geometry, self.data[points_type], tolerance, default_name=default_name, grid=grid)
+            self.data[points_type] = point_sets.to_point_sets(selection)
+        self.dirty = True
+        return unmatched
 
 
 
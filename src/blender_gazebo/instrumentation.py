@@ -0,0 +1,199 @@
+"""
+Optional timing instrumentation of the package. When it is enabled, the instrumented operations
+record nested spans (with their duration) and counters (bytes copied, vertices touched, files
+written...), which can be saved as a Chrome trace-event json file (open it in chrome://tracing
+or https://ui.perfetto.dev) and summarized as a table.
+It is enabled with the tracing context manager, or by setting the BLENDER_GAZEBO_TRACE environment
+variable to the path of the trace file, which is then written when the interpreter exits.
+When it is disabled the instrumented code only checks a global variable.
+"""
+# IMPORTS
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+from contextlib import contextmanager
+# GLOBAL VARIABLES
+TRACE_ENVIRONMENT_VARIABLE = "BLENDER_GAZEBO_TRACE"
+_tracer = None
+
+# CLASSES
+class _NullSpan:
+    """Span used when the instrumentation is disabled, does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add_span(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class Tracer:
+    """Records the spans and the counters of the instrumented operations, from any thread"""
+
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.events = list()
+        self.counters = dict()
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} with {len(self.events)} events"
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def add_span(self, name, start_ns, end_ns, args=None):
+        event = {"name": name, "ph": "X", "ts": (start_ns - self.origin) / 1000, "dur": (end_ns - start_ns) / 1000,
+                 "pid": self.pid, "tid": threading.get_ident()}
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        with self._lock:
+            self.events.append(event)
+
+    def add_count(self, name, value):
+        """Add value to a counter, its running total is recorded as a counter event"""
+        with self._lock:
+            total = self.counters.get(name, 0) + value
+            self.counters[name] = total
+            self.events.append({"name": name, "ph": "C", "ts": (time.perf_counter_ns() - self.origin) / 1000,
+                                "pid": self.pid, "args": {name: total}})
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def write_chrome_trace(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def span_statistics(self):
+        """Returns {span_name: (count, total_seconds, max_seconds)}"""
+        statistics = dict()
+        with self._lock:
+            events = [event for event in self.events if event["ph"] == "X"]
+        for event in events:
+            count, total, maximum = statistics.get(event["name"], (0, 0.0, 0.0))
+            duration = event["dur"] / 1e6
+            statistics[event["name"]] = (count + 1, total + duration, max(maximum, duration))
+        return statistics
+
+    def summary(self):
+        """Table with the number of calls and the times of each span, slowest first, and the counters"""
+        lines = [f"{'span':<50}{'calls':>8}{'total s':>12}{'mean ms':>12}{'max ms':>12}"]
+        statistics = sorted(self.span_statistics().items(), key=lambda item: -item[1][1])
+        for name, (count, total, maximum) in statistics:
+            lines.append(f"{name:<50}{count:>8}{total:>12.3f}{1000 * total / count:>12.3f}{1000 * maximum:>12.3f}")
+        if len(self.counters) > 0:
+            lines.append(f"{'counter':<50}{'total':>20}")
+            for name, total in sorted(self.counters.items()):
+                lines.append(f"{name:<50}{total:>20}")
+        return "\n".join(lines)
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def enabled():
+    return not _tracer is None
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def span(name, **args):
+    """Context manager that records the time spent inside it, if the instrumentation is enabled"""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, args)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def count(name, value=1):
+    """Add value to the counter name, if the instrumentation is enabled"""
+    if not _tracer is None:
+        _tracer.add_count(name, value)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def traced(name=None):
+    """Decorator that records a span for every call to the function"""
+    def decorator(function):
+        span_name = function.__qualname__ if name is None else name
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with _Span(_tracer, span_name, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def start_tracing():
+    """Enable the instrumentation with a new Tracer, and return it"""
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def stop_tracing():
+    """Disable the instrumentation, returns the Tracer that was recording"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+@contextmanager
+def tracing(trace_path=None, print_summary=True):
+    """
+    Enable the instrumentation inside a with block. At the end, the trace is saved to
+    trace_path (if given) and the summary is printed (if print_summary)
+    """
+    tracer = start_tracing()
+    try:
+        yield tracer
+    finally:
+        stop_tracing()
+        if not trace_path is None:
+            tracer.write_chrome_trace(trace_path)
+        if print_summary:
+            print(tracer.summary(), file=sys.stderr)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _trace_from_environment():
+    trace_path = os.environ.get(TRACE_ENVIRONMENT_VARIABLE)
+    if not trace_path:
+        return
+    tracer = start_tracing()
+
+    def write_trace():
+        # Only the process that started the trace writes it
+        if tracer.pid != os.getpid():
+            return
+        tracer.write_chrome_trace(trace_path)
+        print(tracer.summary(), file=sys.stderr)
+    atexit.register(write_trace)
+
+
+_trace_from_environment()
@@ -0,0 +1,152 @@
+"""
+Backup and restore of whole folders of models, with the models processed concurrently in a
+bounded pool of threads. On network filesystems each file operation spends most of its time
+waiting, so having several of them in flight is what makes a library-wide backup fast; the size
+of the pool (workers) should be raised until the filesystem is saturated, more only adds contention.
+The backups are either the __bkp__ files next to the originals or snapshots of a BackupStore.
+Each model gives a report (a dictionary) with the files written and the error if it failed, a
+failed model does not stop the others. With dry_run=True nothing is written, and the reports
+list the files that would be.
+"""
+# IMPORTS
+import os
+import time
+import filecmp
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from blender_gazebo.gazebo_blender_model import GazeboBlenderModel
+from blender_gazebo.backup_store import BackupStore, new_snapshot_id
+from blender_gazebo.file_operations import clone_file, temporal_path_for
+from blender_gazebo.instrumentation import span, count
+# GLOBAL VARIABLES
+DEFAULT_WORKERS = 16
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def model_paths(folder):
+    """Paths of the models of a folder, hidden entries (like backup stores) excluded"""
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if not name.startswith(".") and os.path.isdir(os.path.join(folder, name))]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def print_progress(report, n_done, n_total):
+    """Progress callback that prints a line for each model"""
+    if report["ok"]:
+        action = "would write" if report["dry_run"] else "wrote"
+        print(f"[{n_done}/{n_total}] {report['model']}: {action} {len(report['files'])} files ({report['bytes']} bytes)")
+    else:
+        print(f"[{n_done}/{n_total}] {report['model']}: ERROR {report['error']}")
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _copy_atomically(source, target):
+    """Copy source over target through a temporary file, so that target is never left half written"""
+    temporary_path = temporal_path_for(target)
+    clone_file(source, temporary_path)
+    os.replace(temporary_path, target)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _backup_files(model: GazeboBlenderModel):
+    """(original, __bkp__ file) pairs of a model"""
+    pairs = [(model.sdf_file_path, model.sdf_bkp_file_path)]
+    pairs += [(mesh.path, mesh.backup_path) for mesh in model.meshes if not mesh.path is None]
+    return pairs
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _backup_model(model: GazeboBlenderModel, store, snapshot_id, dry_run):
+    """Returns the files backed up (or that would be) and the number of bytes stored"""
+    if not store is None:
+        pending = store.pending_files(model)
+        if not dry_run:
+            store.snapshot(model, snapshot_id=snapshot_id)
+        return pending, sum(os.path.getsize(path) for path in pending)
+    files, n_bytes = list(), 0
+    for path, backup_path in _backup_files(model):
+        if not dry_run:
+            _copy_atomically(path, backup_path)
+        files.append(backup_path)
+        n_bytes += os.path.getsize(path)
+    return files, n_bytes
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _restore_model(model: GazeboBlenderModel, store, snapshot_id, dry_run):
+    """Returns the files restored (or that would be) and their number of bytes"""
+    if not store is None:
+        files = store.restore(model, snapshot_id=snapshot_id, dry_run=dry_run)
+    else:
+        files = list()
+        for path, backup_path in _backup_files(model):
+            if not os.path.exists(backup_path):
+                raise Exception(f"{backup_path} does not exist")
+            if os.path.exists(path) and filecmp.cmp(path, backup_path, shallow=False):
+                continue
+            if not dry_run:
+                _copy_atomically(backup_path, path)
+            files.append(path)
+    n_bytes = sum(os.path.getsize(path) for path in files if os.path.exists(path))
+    if not dry_run:
+        count("files_written", len(files))
+    return files, n_bytes
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _run_on_model(operation, item, store, snapshot_id, dry_run):
+    """Load the model if a path is given and run the operation, returns its report"""
+    path = item.base_folder if isinstance(item, GazeboBlenderModel) else item
+    report = {"model": os.path.basename(path), "path": path, "ok": False, "dry_run": dry_run, "files": list(),
+              "bytes": 0, "error": None, "traceback": None, "seconds": 0.0}
+    start = time.perf_counter()
+    try:
+        with span(operation.__name__, model=path):
+            model = item if isinstance(item, GazeboBlenderModel) else GazeboBlenderModel(item)
+            report["files"], report["bytes"] = operation(model, store, snapshot_id, dry_run)
+        report["ok"] = True
+    except Exception as e:
+        report["error"] = f"{type(e).__name__}: {e}"
+        report["traceback"] = traceback.format_exc()
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _run_on_models(operation, models, store, snapshot_id, workers, dry_run, progress):
+    """Run the operation on every model in a pool of workers threads, returns the reports in the order of models"""
+    models = list(models)
+    reports = [None] * len(models)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_run_on_model, operation, item, store, snapshot_id, dry_run): n
+                   for n, item in enumerate(models)}
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            report = future.result()
+            reports[futures[future]] = report
+            if not progress is None:
+                progress(report, n_done, len(models))
+    return reports
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def backup_models(models, store: BackupStore = None, snapshot_id=None, workers=DEFAULT_WORKERS, dry_run=False,
+                  progress=None):
+    """
+    Back up the models (GazeboBlenderModel or paths to them) in their __bkp__ files, or in the
+    store if one is given, all in the same snapshot (a new one if snapshot_id is None).
+    progress(report, n_done, n_total) is called as each model finishes. Returns the reports
+    """
+    if not store is None and snapshot_id is None:
+        snapshot_id = new_snapshot_id()
+    return _run_on_models(_backup_model, models, store, snapshot_id, workers, dry_run, progress)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def restore_models(models, store: BackupStore = None, snapshot_id=None, workers=DEFAULT_WORKERS, dry_run=False,
+                   progress=None):
+    """
+    Restore the models (GazeboBlenderModel or paths to them) from their __bkp__ files, or from
+    the snapshot snapshot_id of the store (the newest one of each model if None). Only the files
+    that differ from the backup are written. Returns the reports
+    """
+    return _run_on_models(_restore_model, models, store, snapshot_id, workers, dry_run, progress)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def summarize_reports(reports):
+    """Totals of a list of reports, and the errors of the models that failed"""
+    return {"models": len(reports), "succeeded": sum(1 for report in reports if report["ok"]),
+            "files": sum(len(report["files"]) for report in reports),
+            "bytes": sum(report["bytes"] for report in reports),
+            "errors": {report["path"]: report["error"] for report in reports if not report["ok"]},
+            "seconds": sum(report["seconds"] for report in reports)}
@@ -0,0 +1,427 @@
+"""
+Backends that hold the meshes loaded by blender_functions: BpyBackend works on the objects of
+the running Blender instance, and NumpyBackend keeps the meshes in memory as numpy arrays, with
+the same semantics (object names, vertex indices, coordinates), so that the selection, transform
+and save code can be used and profiled outside of Blender.
+The backend is chosen with set_backend, or with the BLENDER_GAZEBO_BACKEND environment variable
+("bpy" or "numpy"). By default bpy is used if it can be imported.
+"""
+# IMPORTS
+import os
+from abc import ABC, abstractmethod
+import numpy as np
+import blender_gazebo.obj_io as obj_io
+import blender_gazebo.dae_io as dae_io
+from blender_gazebo.mesh_geometry import MeshGeometry
+from blender_gazebo.instrumentation import span, traced
+# GLOBAL VARIABLES
+BACKEND_ENVIRONMENT_VARIABLE = "BLENDER_GAZEBO_BACKEND"
+# Blender imports .obj files with Y up, turning (x, y, z) into (x, -z, y), and undoes it when exporting them
+OBJ_IMPORT_ROTATION = np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]], dtype=np.float64)
+# Arrays of a MeshGeometry written by NumpyBackend.write_objects
+GEOMETRY_ARRAYS = ("positions", "normals", "uvs", "face_vertices", "face_uvs", "face_normals", "face_offsets")
+_backend = None
+
+# CLASSES
+class MeshBackend(ABC):
+    """
+    Interface of the backends. The objects are identified by their name, and the
+    selection of an object is a boolean array with an element per vertex
+    """
+    name = None
+
+    def __str__(self):
+        return f"{self.__class__.__name__}"
+
+    @abstractmethod
+    def clear(self):
+        """Delete all the objects"""
+
+    @abstractmethod
+    def load_mesh(self, path):
+        """Import a mesh file, returns the names of the new objects"""
+
+    @abstractmethod
+    def object_names(self):
+        """Names of the objects that contain a mesh"""
+
+    @abstractmethod
+    def get_selections(self):
+        """Returns {object_name: boolean array} with the selected vertices of every object"""
+
+    @abstractmethod
+    def set_selections(self, selections):
+        """Set the selected vertices of the objects in {object_name: boolean array}, the edges and faces are deselected"""
+
+    @abstractmethod
+    def transform(self, matrix, center=(0.0, 0.0, 0.0)):
+        """Apply a 3x3 linear transformation, around center, to the vertices of all the objects, in world coordinates"""
+
+    @abstractmethod
+    def save(self, file_path):
+        """Export all the objects to an .obj or .dae file"""
+
+    # Extension of the files written by write_objects
+    cache_extension = None
+
+    @abstractmethod
+    def write_objects(self, names, path):
+        """Save the objects as they are in the backend, so that read_objects loads them faster than load_mesh"""
+
+    @abstractmethod
+    def read_objects(self, path):
+        """Load the objects saved by write_objects, returns their names"""
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class BpyBackend(MeshBackend):
+    """The objects of the running Blender instance, handled through bpy"""
+    name = "bpy"
+
+    def __init__(self):
+        with span("import bpy"):
+            import bpy
+        self.bpy = bpy
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _mesh_objects(self):
+        """Returns a list of (name, object) with the objects that contain a mesh"""
+        return [(key, obj) for key, obj in self.bpy.data.objects.items() if obj.type == "MESH"]
+
+    @staticmethod
+    def _get_vertex_selection(mesh):
+        """Returns a boolean array with the selection state of every vertex of a mesh"""
+        selection = np.zeros(len(mesh.vertices), dtype=bool)
+        mesh.vertices.foreach_get("select", selection)
+        return selection
+
+    @staticmethod
+    def _set_selection(elements, selection):
+        """Set the selection state of all the vertices, edges or polygons of a mesh at once"""
+        elements.foreach_set("select", np.broadcast_to(np.asarray(selection, dtype=bool), (len(elements),)))
+
+    def _in_object_mode(self, function):
+        """
+        Run function in object mode, going back to the previous mode afterwards. The selection
+        of the meshes is only updated when leaving edit mode
+        """
+        active_object = self.bpy.context.active_object
+        if active_object is None:
+            return function()
+        mode = active_object.mode
+        self.bpy.ops.object.mode_set(mode='OBJECT')
+        try:
+            return function()
+        finally:
+            self.bpy.ops.object.mode_set(mode=mode)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def clear(self):
+        objs = self.bpy.data.objects
+        for k in objs.keys():
+            objs.remove(objs[k], do_unlink=True)
+
+    def load_mesh(self, path):
+        previous = set(self.bpy.data.objects.keys())
+        extension = str.lower(os.path.splitext(path)[1])
+        if extension == ".obj":
+            self.bpy.ops.import_scene.obj(filepath=path)
+        elif extension == ".dae":
+            self.bpy.ops.wm.collada_import(filepath=path)
+        else:
+            raise Exception(f"{path} can not be imported")
+        return [name for name in self.bpy.data.objects.keys() if not name in previous]
+
+    def object_names(self):
+        return [name for name, _ in self._mesh_objects()]
+
+    def get_selections(self):
+        return self._in_object_mode(
+            lambda: {name: self._get_vertex_selection(obj.data) for name, obj in self._mesh_objects()})
+
+    def set_selections(self, selections):
+        def set_all():
+            for name, selection in selections.items():
+                obj = self.bpy.data.objects.get(name)
+                if obj is None:
+                    raise Exception(f"There is no object {name}")
+                self._set_selection(obj.data.polygons, False)
+                self._set_selection(obj.data.edges, False)
+                self._set_selection(obj.data.vertices, selection)
+        self._in_object_mode(set_all)
+
+    def transform(self, matrix, center=(0.0, 0.0, 0.0)):
+        """
+        The vertices of the meshes are transformed (in world coordinates), and the objects are
+        left where they are, as NumpyBackend does, so that the change is saved with the mesh data
+        """
+        from mathutils import Matrix
+        center = Matrix.Translation(tuple(center))
+        transformation = center @ Matrix(np.asarray(matrix, dtype=np.float64).tolist()).to_4x4() @ center.inverted()
+
+        def transform_all():
+            transformed = set()
+            for _, obj in self._mesh_objects():
+                # A mesh shared by several objects is only transformed once
+                if obj.data.name in transformed:
+                    continue
+                transformed.add(obj.data.name)
+                obj.data.transform(obj.matrix_world.inverted() @ transformation @ obj.matrix_world)
+                obj.data.update()
+        self._in_object_mode(transform_all)
+
+    def save(self, file_path):
+        extension = str.lower(os.path.splitext(file_path)[1])
+        if extension == ".obj":
+            self.bpy.ops.export_scene.obj(filepath=file_path)
+        elif extension == ".dae":
+            self.bpy.ops.wm.collada_export(filepath=file_path)
+        else:
+            raise Exception(f"{file_path} can not be exported")
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    cache_extension = ".blend"
+
+    def write_objects(self, names, path):
+        """The objects are written as a .blend library, with their meshes and materials"""
+        objects = set(self.bpy.data.objects[name] for name in names)
+        self.bpy.data.libraries.write(path, objects, fake_user=True)
+
+    def read_objects(self, path):
+        """The objects are appended from the .blend library and linked to the scene"""
+        with self.bpy.data.libraries.load(path, link=False) as (data_from, data_to):
+            data_to.objects = list(data_from.objects)
+        names = list()
+        for obj in data_to.objects:
+            if obj is None:
+                continue
+            self.bpy.context.scene.collection.objects.link(obj)
+            obj.select_set(True)
+            names.append(obj.name)
+        return names
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class NumpyBackend(MeshBackend):
+    """
+    Meshes kept in memory, read and written with obj_io and dae_io. Each object of a file becomes
+    an object with its vertices in the order that Blender gives them, and with the coordinates that
+    they would have in Blender (.obj files are rotated to Z up when loaded and back when saved).
+    The objects with repeated names get the suffixes .001, .002... as in Blender
+    """
+    name = "numpy"
+
+    def __init__(self):
+        self.objects = dict()
+        self.selections = dict()
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _unique_name(self, name):
+        if not name in self.objects:
+            return name
+        n = 1
+        while f"{name}.{n:03d}" in self.objects:
+            n += 1
+        return f"{name}.{n:03d}"
+
+    def clear(self):
+        self.objects = dict()
+        self.selections = dict()
+
+    @traced()
+    def load_mesh(self, path):
+        extension = str.lower(os.path.splitext(path)[1])
+        if extension == ".obj":
+            geometry = obj_io.read_obj(path)
+            geometry = _transformed(geometry, OBJ_IMPORT_ROTATION)
+        elif extension == ".dae":
+            geometry = dae_io.read_dae(path)
+        else:
+            raise Exception(f"{path} can not be imported")
+        default_name = os.path.splitext(os.path.basename(path))[0]
+        names = list()
+        for n_object, (name, _, _) in enumerate(geometry.objects()):
+            name = self._unique_name(default_name if name is None else name)
+            self.objects[name] = _object_geometry(geometry, n_object)
+            self.selections[name] = np.zeros(self.objects[name].n_vertices, dtype=bool)
+            names.append(name)
+        return names
+
+    def object_names(self):
+        return list(self.objects.keys())
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def get_selections(self):
+        return {name: selection.copy() for name, selection in self.selections.items()}
+
+    def set_selections(self, selections):
+        for name, selection in selections.items():
+            if not name in self.objects:
+                raise Exception(f"There is no object {name}")
+            self.selections[name] = np.broadcast_to(
+                np.asarray(selection, dtype=bool), (self.objects[name].n_vertices,)).copy()
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def transform(self, matrix, center=(0.0, 0.0, 0.0)):
+        for name, geometry in self.objects.items():
+            self.objects[name] = _transformed(geometry, matrix, center)
+
+    def save(self, file_path):
+        extension = str.lower(os.path.splitext(file_path)[1])
+        geometry = _combined_geometry(self.objects)
+        if extension == ".obj":
+            obj_io.write_obj(_transformed(geometry, OBJ_IMPORT_ROTATION.T), file_path)
+        elif extension == ".dae":
+            dae_io.write_dae(geometry, file_path)
+        else:
+            raise Exception(f"{file_path} can not be exported")
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    cache_extension = ".npz"
+
+    def write_objects(self, names, path):
+        """The arrays of the objects are written to a .npz file"""
+        arrays = {"names": np.array(names, dtype=str)}
+        for n, name in enumerate(names):
+            geometry = self.objects[name]
+            for field in GEOMETRY_ARRAYS:
+                arrays[f"{n}/{field}"] = getattr(geometry, field)
+            arrays[f"{n}/statement_faces"] = np.array([face for face, _ in geometry.statements], dtype=np.int64)
+            arrays[f"{n}/statement_lines"] = np.array([line for _, line in geometry.statements], dtype=str)
+            if not geometry.vertex_colors is None:
+                arrays[f"{n}/vertex_colors"] = geometry.vertex_colors
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    def read_objects(self, path):
+        names = list()
+        with np.load(path) as npz_file:
+            for n, name in enumerate(npz_file["names"].tolist()):
+                fields = {field: npz_file[f"{n}/{field}"] for field in GEOMETRY_ARRAYS}
+                statements = list(zip(npz_file[f"{n}/statement_faces"].tolist(), npz_file[f"{n}/statement_lines"].tolist()))
+                colors_key = f"{n}/vertex_colors"
+                fields["vertex_colors"] = npz_file[colors_key] if colors_key in npz_file.files else None
+                geometry = MeshGeometry(statements=statements, vertex_ranges=[(0, len(fields["positions"]))], **fields)
+                name = self._unique_name(name)
+                self.objects[name] = geometry
+                self.selections[name] = np.zeros(geometry.n_vertices, dtype=bool)
+                names.append(name)
+        return names
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _transformed(geometry: MeshGeometry, matrix, center=(0.0, 0.0, 0.0)):
+    """Copy of the geometry with a linear transformation around center applied, the normals are kept normalized"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    center = np.asarray(center, dtype=np.float64)
+    transformed = geometry.copy(positions=(geometry.positions - center) @ matrix.T + center)
+    if len(transformed.normals) > 0:
+        # The normals are transformed with the inverse transpose of the matrix
+        normals = transformed.normals @ np.linalg.inv(matrix)
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        transformed.normals = normals / np.where(lengths > 0, lengths, 1)
+    return transformed
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _compact(indices, values):
+    """Keep only the values used by the indices, returns them and the indices into them (-1 is kept)"""
+    used = np.unique(indices[indices >= 0])
+    lookup = np.full(len(values) + 1, -1, dtype=np.int64)
+    lookup[used] = np.arange(len(used))
+    return values[used], lookup[indices]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _object_geometry(geometry: MeshGeometry, n_object):
+    """The n-th object of a geometry as a geometry of its own, with its vertices in the order of Blender"""
+    name, first_face, last_face = geometry.objects()[n_object]
+    vertex_indices = geometry.object_vertex_indices(n_object)
+    lookup = np.full(geometry.n_vertices, -1, dtype=np.int64)
+    lookup[vertex_indices] = np.arange(len(vertex_indices))
+    start, end = geometry.face_offsets[first_face], geometry.face_offsets[last_face]
+    normals, face_normals = _compact(geometry.face_normals[start:end], geometry.normals)
+    uvs, face_uvs = _compact(geometry.face_uvs[start:end], geometry.uvs)
+    statements = [(face - first_face, line) for face, line in geometry.statements
+                  if first_face <= face < last_face and not line.startswith("o ")]
+    return MeshGeometry(
+        geometry.positions[vertex_indices], normals=normals, uvs=uvs,
+        face_vertices=lookup[geometry.face_vertices[start:end]], face_uvs=face_uvs, face_normals=face_normals,
+        face_offsets=geometry.face_offsets[first_face:last_face + 1] - start, statements=statements,
+        vertex_colors=None if geometry.vertex_colors is None else geometry.vertex_colors[vertex_indices],
+        vertex_ranges=[(0, len(vertex_indices))])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _combined_geometry(objects):
+    """A single geometry with all the objects of {name: geometry}, one after the other"""
+    positions, normals, uvs, colors = list(), list(), list(), list()
+    face_vertices, face_normals, face_uvs, face_offsets = list(), list(), list(), [np.zeros(1, dtype=np.int64)]
+    statements, vertex_ranges = list(), list()
+    n_vertices = n_normals = n_uvs = n_faces = n_corners = 0
+    uv_columns = min([g.uvs.shape[1] for g in objects.values()], default=2)
+    for name, geometry in objects.items():
+        positions.append(geometry.positions)
+        normals.append(geometry.normals)
+        uvs.append(geometry.uvs[:, :uv_columns])
+        colors.append(geometry.vertex_colors)
+        face_vertices.append(geometry.face_vertices + n_vertices)
+        face_normals.append(np.where(geometry.face_normals >= 0, geometry.face_normals + n_normals, -1))
+        face_uvs.append(np.where(geometry.face_uvs >= 0, geometry.face_uvs + n_uvs, -1))
+        face_offsets.append(geometry.face_offsets[1:] + n_corners)
+        statements.append((n_faces, "o " + name))
+        statements.extend((face + n_faces, line) for face, line in geometry.statements)
+        vertex_ranges.append((n_vertices, n_vertices + geometry.n_vertices))
+        n_vertices += geometry.n_vertices
+        n_normals += len(geometry.normals)
+        n_uvs += len(geometry.uvs)
+        n_faces += geometry.n_faces
+        n_corners += len(geometry.face_vertices)
+    has_colors = len(colors) > 0 and all(not c is None for c in colors)
+    return MeshGeometry(
+        np.concatenate(positions) if len(positions) > 0 else np.zeros((0, 3)),
+        normals=np.concatenate(normals) if len(normals) > 0 else None,
+        uvs=np.concatenate(uvs) if len(uvs) > 0 else None,
+        face_vertices=np.concatenate(face_vertices) if len(face_vertices) > 0 else None,
+        face_uvs=np.concatenate(face_uvs) if len(face_uvs) > 0 else None,
+        face_normals=np.concatenate(face_normals) if len(face_normals) > 0 else None,
+        face_offsets=np.concatenate(face_offsets), statements=statements,
+        vertex_colors=np.concatenate(colors) if has_colors else None, vertex_ranges=vertex_ranges)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def bpy_available():
+    try:
+        import bpy
+        return True
+    except ImportError:
+        return False
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def create_backend(name):
+    """Create a backend by its name, "bpy" or "numpy" """
+    backends = {BpyBackend.name: BpyBackend, NumpyBackend.name: NumpyBackend}
+    if not name in backends:
+        raise Exception(f"Unknown mesh backend {name}, available: {list(backends.keys())}")
+    return backends[name]()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def set_backend(backend):
+    """Set the backend used by blender_functions, given as a MeshBackend or by its name. Returns it"""
+    global _backend
+    _backend = create_backend(backend) if isinstance(backend, str) else backend
+    return _backend
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_backend():
+    """
+    The backend used by blender_functions. If none has been set, it is created from
+    the BLENDER_GAZEBO_BACKEND environment variable, or bpy if it is available
+    """
+    if _backend is None:
+        name = os.environ.get(BACKEND_ENVIRONMENT_VARIABLE)
+        if name is None:
+            name = BpyBackend.name if bpy_available() else NumpyBackend.name
+        set_backend(name)
+    return _backend
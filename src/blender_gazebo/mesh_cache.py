@@ -0,0 +1,129 @@
+"""
+Cache of imported meshes. Importing an .obj or .dae file in Blender is slow, so the first time that
+a mesh file is loaded its objects are saved in the format of the backend (a .blend library for bpy,
+a .npz file of vertex and face arrays for numpy), and the next times they are appended from it.
+The entries are keyed by the path of the mesh file and its modification time and size (or the hash
+of its contents if check_contents is True), so editing a mesh file invalidates its entry.
+When the cache is bigger than max_bytes, the least recently used entries are deleted.
+The folder and the size of the default cache are set with the BLENDER_GAZEBO_MESH_CACHE
+(set it to "off" to disable the cache) and BLENDER_GAZEBO_MESH_CACHE_MB environment variables.
+"""
+# IMPORTS
+import os
+import hashlib
+from blender_gazebo.file_operations import write_file_atomically
+from blender_gazebo.instrumentation import span, count
+# GLOBAL VARIABLES
+CACHE_ENVIRONMENT_VARIABLE = "BLENDER_GAZEBO_MESH_CACHE"
+CACHE_SIZE_ENVIRONMENT_VARIABLE = "BLENDER_GAZEBO_MESH_CACHE_MB"
+DEFAULT_CACHE_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "blender_gazebo", "meshes")
+DEFAULT_MAX_MB = 2048
+_default_cache = None
+
+# CLASSES
+class MeshCache:
+    """
+    Folder with the imported meshes of a backend (see mesh_backends.MeshBackend.write_objects)
+    - load: load a mesh file into the backend, from the cache if possible
+    - evict: delete the least recently used entries until the cache fits in max_bytes
+    """
+
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, max_bytes=DEFAULT_MAX_MB * 1024 ** 2, check_contents=False):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.check_contents = check_contents
+        os.makedirs(folder, exist_ok=True)
+
+    def __str__(self):
+        return f"{self.__class__.__name__} at {self.folder}"
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def key(self, mesh_path, backend):
+        """Name of the entry of a mesh file, it changes when the file is modified"""
+        mesh_path = os.path.abspath(mesh_path)
+        stat = os.stat(mesh_path)
+        hasher = hashlib.sha1(f"{backend.name}\n{mesh_path}\n{stat.st_size}\n".encode())
+        if self.check_contents:
+            with open(mesh_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 ** 2), b""):
+                    hasher.update(block)
+        else:
+            hasher.update(str(stat.st_mtime_ns).encode())
+        return hasher.hexdigest()
+
+    def entry_path(self, mesh_path, backend):
+        return os.path.join(self.folder, self.key(mesh_path, backend) + backend.cache_extension)
+
+    def load(self, mesh_path, backend):
+        """Load the mesh file into the backend, returns the names of the new objects"""
+        path = self.entry_path(mesh_path, backend)
+        if os.path.isfile(path):
+            try:
+                with span("MeshCache.hit", mesh=mesh_path):
+                    names = backend.read_objects(path)
+                os.utime(path)
+                count("mesh_cache_hits")
+                return names
+            except Exception as e:
+                print(f"The cached mesh {path} could not be read ({e}), importing {mesh_path}")
+                os.remove(path)
+        count("mesh_cache_misses")
+        names = backend.load_mesh(mesh_path)
+        self.store(names, path, backend)
+        return names
+
+    def store(self, names, path, backend):
+        """Write the objects to the entry path, through a temporary file so that it is never left half written"""
+        try:
+            with span("MeshCache.store", entry=path):
+                write_file_atomically(path, lambda temporal_path: backend.write_objects(names, temporal_path))
+        except Exception as e:
+            print(f"The objects {names} could not be cached ({e})")
+            return
+        count("bytes_cached", os.path.getsize(path))
+        self.evict()
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def entries(self):
+        """List of (last_use_time, size, path) of the entries, the least recently used first"""
+        entries = list()
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not ".tmp" in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    @property
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            count("mesh_cache_evictions")
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def get_default_cache():
+    """The cache configured by the environment variables, None if it is disabled"""
+    global _default_cache
+    folder = os.environ.get(CACHE_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_FOLDER)
+    if folder.lower() in ("off", "0", "false", ""):
+        return None
+    max_bytes = int(float(os.environ.get(CACHE_SIZE_ENVIRONMENT_VARIABLE, DEFAULT_MAX_MB)) * 1024 ** 2)
+    if _default_cache is None or _default_cache.folder != folder or _default_cache.max_bytes != max_bytes:
+        _default_cache = MeshCache(folder, max_bytes)
+    return _default_cache
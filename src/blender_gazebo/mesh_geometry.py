@@ -0,0 +1,183 @@
+"""
+Container for the geometry of a mesh file as contiguous numpy arrays, so that the
+meshes of the gazebo models can be read, modified and written without Blender.
+"""
+# IMPORTS
+import numpy as np
+
+# CLASSES
+class MeshGeometry:
+    """
+    Geometry of a mesh file:
+    - positions: (V, 3) float64 array with the coordinates of the vertices
+    - normals: (N, 3) float64 array
+    - uvs: (T, 2) or (T, 3) float64 array with the texture coordinates
+    - face_vertices, face_uvs, face_normals: (C,) int64 arrays, with one element for each
+      corner of each face, indexing the positions, uvs and normals (-1 if the corner has none)
+    - face_offsets: (F + 1,) int64 array, the corners of face i are face_offsets[i]:face_offsets[i+1]
+    - statements: list of (face_index, line) with the lines of the file that are not geometry
+      (object names, materials, smoothing groups...) and the index of the face that follows them
+    - vertex_colors: (V, 3) float64 array or None
+    - vertex_ranges: None if the vertices of each object are numbered by Blender in the order
+      in which they are used by the faces (.obj), or a list with the (start, stop) range of the
+      vertices of each object if they keep the order of the file (.dae)
+    """
+
+    def __init__(self, positions, normals=None, uvs=None, face_vertices=None, face_uvs=None,
+                 face_normals=None, face_offsets=None, statements=None, vertex_colors=None, vertex_ranges=None):
+        self.positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 3)
+        self.normals = np.zeros((0, 3)) if normals is None else np.ascontiguousarray(normals, dtype=np.float64)
+        self.uvs = np.zeros((0, 2)) if uvs is None else np.ascontiguousarray(uvs, dtype=np.float64)
+        self.face_vertices = np.zeros(0, dtype=np.int64) if face_vertices is None \
+            else np.ascontiguousarray(face_vertices, dtype=np.int64)
+        n_corners = len(self.face_vertices)
+        self.face_uvs = np.full(n_corners, -1, dtype=np.int64) if face_uvs is None \
+            else np.ascontiguousarray(face_uvs, dtype=np.int64)
+        self.face_normals = np.full(n_corners, -1, dtype=np.int64) if face_normals is None \
+            else np.ascontiguousarray(face_normals, dtype=np.int64)
+        if face_offsets is None:
+            assert n_corners % 3 == 0, "face_offsets are needed if the faces are not triangles"
+            face_offsets = np.arange(0, n_corners + 1, 3)
+        self.face_offsets = np.ascontiguousarray(face_offsets, dtype=np.int64)
+        self.statements = list() if statements is None else list(statements)
+        self.vertex_colors = vertex_colors
+        self.vertex_ranges = vertex_ranges
+
+    def __str__(self):
+        return f"{self.__class__.__name__} with {self.n_vertices} vertices and {self.n_faces} faces"
+
+    @property
+    def n_vertices(self):
+        return len(self.positions)
+
+    @property
+    def n_faces(self):
+        return len(self.face_offsets) - 1
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def face_sizes(self):
+        """Number of corners of each face"""
+        return np.diff(self.face_offsets)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def triangles(self):
+        """
+        Returns a (T, 3) array with the vertex indices of the faces split in triangles
+        (as a fan around the first corner of each face)
+        """
+        sizes = self.face_sizes()
+        if len(sizes) == 0:
+            return np.zeros((0, 3), dtype=np.int64)
+        if np.all(sizes == 3):
+            return self.face_vertices.reshape(-1, 3)
+        n_triangles = sizes - 2
+        face_of_triangle = np.repeat(np.arange(len(sizes)), n_triangles)
+        first = self.face_offsets[:-1][face_of_triangle]
+        k = np.arange(len(face_of_triangle)) - np.repeat(np.cumsum(n_triangles) - n_triangles, n_triangles)
+        return np.stack([
+            self.face_vertices[first],
+            self.face_vertices[first + k + 1],
+            self.face_vertices[first + k + 2]], axis=1)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def objects(self):
+        """
+        Returns a list of (name, first_face, last_face) with the objects ('o' statements)
+        of the mesh. If there are none, the whole mesh is returned as a single object
+        """
+        starts = [(face, line.split(" ", 1)[1].strip()) for face, line in self.statements
+                  if line.startswith("o ")]
+        if len(starts) == 0:
+            return [(None, 0, self.n_faces)]
+        objects = list()
+        for n, (face, name) in enumerate(starts):
+            end = starts[n + 1][0] if n + 1 < len(starts) else self.n_faces
+            objects.append((name, face, end))
+        return objects
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def materials(self):
+        """
+        Returns a list of (material, first_face, last_face) with the runs of faces that use
+        the same material ('usemtl' statements). The faces before the first one have None
+        """
+        starts = [(face, line.split(" ", 1)[1].strip() if " " in line else None) for face, line in self.statements
+                  if line.split(" ", 1)[0] == "usemtl"]
+        if len(starts) == 0 or starts[0][0] > 0:
+            starts.insert(0, (0, None))
+        runs = list()
+        for n, (face, name) in enumerate(starts):
+            end = starts[n + 1][0] if n + 1 < len(starts) else self.n_faces
+            if end > face:
+                runs.append((name, face, end))
+        return runs
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def object_vertex_indices(self, n_object):
+        """
+        Indices of the vertices of the n-th object, in the order that they have once the object
+        is imported into Blender, so the position of a vertex in this array is its index
+        inside the Blender object
+        """
+        if not self.vertex_ranges is None:
+            return np.arange(*self.vertex_ranges[n_object])
+        _, first_face, last_face = self.objects()[n_object]
+        corners = self.face_vertices[self.face_offsets[first_face]:self.face_offsets[last_face]]
+        unique_vertices, first_use = np.unique(corners, return_index=True)
+        return unique_vertices[np.argsort(first_use, kind="stable")]
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def mask_from_selection(self, selection):
+        """
+        Given a selection as stored in a BlenderMeshInfo ({object_name: [vertex indices]}), with
+        the indices local to each Blender object, returns a (V,) boolean mask over the positions
+        """
+        mask = np.zeros(self.n_vertices, dtype=bool)
+        objects = self.objects()
+        for n_object, (name, _, _) in enumerate(objects):
+            if name in selection:
+                local_indices = selection[name]
+            elif len(objects) == 1 and len(selection) == 1:
+                # With a single object, the name given by blender can differ from the one in the file
+                local_indices = next(iter(selection.values()))
+            else:
+                continue
+            local_indices = np.asarray(local_indices, dtype=np.int64)
+            global_indices = self.object_vertex_indices(n_object)
+            mask[global_indices[local_indices[local_indices < len(global_indices)]]] = True
+        return mask
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def selection_from_mask(self, mask, default_name=None):
+        """
+        Inverse of mask_from_selection: given a (V,) boolean mask over the positions, returns the
+        selection {object_name: [vertex indices]} with the indices local to each Blender object.
+        The objects without name get default_name
+        """
+        selection = dict()
+        for n_object, (name, _, _) in enumerate(self.objects()):
+            name = default_name if name is None else name
+            selection[name] = np.flatnonzero(mask[self.object_vertex_indices(n_object)])
+        return selection
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def same_topology(self, other):
+        """
+        True if other has the same vertices, faces and objects (the positions can differ), so that
+        the indices of the vertices inside each Blender object are the same in both geometries
+        """
+        return (self.n_vertices == other.n_vertices and np.array_equal(self.face_offsets, other.face_offsets)
+                and np.array_equal(self.face_vertices, other.face_vertices) and self.objects() == other.objects()
+                and self.vertex_ranges == other.vertex_ranges)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def copy(self, positions=None):
+        """Returns a copy of the geometry, with new positions if they are given"""
+        return MeshGeometry(
+            self.positions.copy() if positions is None else positions,
+            normals=self.normals.copy(), uvs=self.uvs.copy(),
+            face_vertices=self.face_vertices.copy(), face_uvs=self.face_uvs.copy(),
+            face_normals=self.face_normals.copy(), face_offsets=self.face_offsets.copy(),
+            statements=self.statements,
+            vertex_colors=None if self.vertex_colors is None else self.vertex_colors.copy(),
+            vertex_ranges=self.vertex_ranges)
@@ -0,0 +1,259 @@
+"""
+Persistent index of a folder of gazebo models.
+The catalog stores, for every model in a folder, the paths of its files and the
+information of its meshes, together with the modification time and size of every
+file involved. When the catalog is refreshed, only the models whose files have
+changed are parsed again, so listing a big library that has not changed only
+costs a few stat calls per model (or nothing at all if the index is trusted).
+"""
+# IMPORTS
+import os
+import json
+import sqlite3
+import hashlib
+from blender_gazebo.gazebo_blender_model import GazeboBlenderModel, LazyGazeboBlenderModel, load_models
+# GLOBAL VARIABLES
+DEFAULT_CATALOGS_FOLDER = os.path.join(os.path.expanduser("~"), ".cache", "blender_gazebo", "catalogs")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    name TEXT PRIMARY KEY,
+    base_folder TEXT NOT NULL,
+    config_file_path TEXT,
+    sdf_file_path TEXT,
+    position INTEGER,
+    fingerprint TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS meshes (
+    model_name TEXT NOT NULL,
+    uri TEXT,
+    path TEXT,
+    file_type TEXT,
+    scale TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    n_references INTEGER
+);
+CREATE INDEX IF NOT EXISTS meshes_by_model ON meshes (model_name);
+"""
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def default_catalog_path(folder):
+    """
+    Path of the catalog file of a models folder when no path is specified. The catalogs
+    are kept outside the models folder so that the folder itself is not modified
+    """
+    folder = os.path.abspath(folder)
+    folder_hash = hashlib.sha1(folder.encode()).hexdigest()[:16]
+    return os.path.join(DEFAULT_CATALOGS_FOLDER, f"{os.path.basename(folder)}_{folder_hash}.sqlite")
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _stat_or_none(path):
+    """Returns [mtime_ns, size] of a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def model_fingerprint(model_path, mesh_paths=()):
+    """
+    Returns a string that changes whenever the model folder, its model.config,
+    its model.sdf or any of the given mesh files is modified
+    """
+    fingerprint = [
+        _stat_or_none(model_path),
+        _stat_or_none(os.path.join(model_path, "model.config")),
+        _stat_or_none(os.path.join(model_path, "model.sdf")),
+    ]
+    for mesh_path in mesh_paths:
+        fingerprint.append(_stat_or_none(mesh_path))
+    return json.dumps(fingerprint)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def mesh_files_in_folder(model_path):
+    """
+    Returns the sorted paths of all the files inside the meshes folder of a model. Used
+    to fingerprint the models that could not be parsed, whose mesh paths are not known
+    """
+    mesh_files = []
+    for root, _, files in os.walk(os.path.join(model_path, "meshes")):
+        mesh_files.extend(os.path.join(root, file) for file in files)
+    return sorted(mesh_files)
+
+
+# CLASSES
+class CatalogMesh:
+    """
+    Information of a mesh as stored in the catalog
+    """
+    __slots__ = ("uri", "path", "file_type", "scale", "size", "mtime_ns", "n_references")
+
+    def __init__(self, uri, path, file_type, scale, size, mtime_ns, n_references):
+        self.uri = uri
+        self.path = path
+        self.file_type = file_type
+        self.scale = scale
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.n_references = n_references
+
+    def __str__(self):
+        return f"Catalog mesh: {self.uri}"
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class CatalogEntry:
+    """
+    Information of a model as stored in the catalog
+    """
+    __slots__ = ("name", "base_folder", "config_file_path", "sdf_file_path", "meshes")
+
+    def __init__(self, name, base_folder, config_file_path, sdf_file_path, meshes):
+        self.name = name
+        self.base_folder = base_folder
+        self.config_file_path = config_file_path
+        self.sdf_file_path = sdf_file_path
+        self.meshes = meshes
+
+    def __str__(self):
+        return f"Catalog entry of {self.name}"
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class ModelCatalog:
+    """
+    Persistent (sqlite) index of the models inside a folder
+    """
+
+    def __init__(self, folder, catalog_path=None):
+        assert os.path.isdir(folder), f"{folder} is not a folder"
+        self.folder = folder
+        self.catalog_path = default_catalog_path(folder) if catalog_path is None else catalog_path
+        os.makedirs(os.path.dirname(os.path.abspath(self.catalog_path)), exist_ok=True)
+        self.connection = sqlite3.connect(self.catalog_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.folder}"
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _stored_mesh_paths(self):
+        """Returns a dictionary with the paths of the meshes of each model in the catalog"""
+        mesh_paths = {}
+        for model_name, path in self.connection.execute("SELECT model_name, path FROM meshes"):
+            mesh_paths.setdefault(model_name, []).append(path)
+        return mesh_paths
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def refresh(self, workers=None, executor="thread"):
+        """
+        Bring the catalog up to date with the folder. Only the models that are new or whose
+        files have changed are parsed again, streaming their files (as LazyGazeboBlenderModel
+        checks them) without building their trees. Returns the list of names of the parsed models.
+        The models that could not be parsed are fingerprinted with all the files of their
+        meshes folder, so that they are parsed again when a mesh is added or changed
+        """
+        stored = dict(self.connection.execute("SELECT name, fingerprint FROM models"))
+        failed = set(self.errors())
+        mesh_paths = self._stored_mesh_paths()
+        names_in_folder = [name for name in os.listdir(self.folder) if not name.startswith(".")]
+        to_parse = []
+        for name in names_in_folder:
+            path = os.path.join(self.folder, name)
+            paths_of_meshes = mesh_files_in_folder(path) if name in failed else mesh_paths.get(name, ())
+            if stored.get(name) != model_fingerprint(path, paths_of_meshes):
+                to_parse.append(name)
+        paths = [os.path.join(self.folder, name) for name in to_parse]
+        results = load_models(paths, LazyGazeboBlenderModel, workers, executor)
+        with self.connection:
+            removed = set(stored) - set(names_in_folder)
+            for name in list(removed) + to_parse:
+                self.connection.execute("DELETE FROM models WHERE name = ?", (name,))
+                self.connection.execute("DELETE FROM meshes WHERE model_name = ?", (name,))
+            for name, path, (model, error) in zip(to_parse, paths, results):
+                if error is None:
+                    self._insert_model(model)
+                else:
+                    self.connection.execute(
+                        "INSERT INTO models (name, base_folder, fingerprint, error) VALUES (?, ?, ?, ?)",
+                        (name, path, model_fingerprint(path, mesh_files_in_folder(path)), str(error)))
+            self.connection.executemany(
+                "UPDATE models SET position = ? WHERE name = ?",
+                [(n, name) for n, name in enumerate(names_in_folder)])
+        return to_parse
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _insert_model(self, model: LazyGazeboBlenderModel):
+        """Store the information of a model, with the meshes found when its handle was created"""
+        mesh_paths = [mesh["path"] for mesh in model.scanned_meshes if not mesh["path"] is None]
+        self.connection.execute(
+            "INSERT INTO models (name, base_folder, config_file_path, sdf_file_path, fingerprint, error) "
+            "VALUES (?, ?, ?, ?, ?, NULL)",
+            (model.name, model.base_folder, model.config_file_path, model.sdf_file_path,
+             model_fingerprint(model.base_folder, mesh_paths)))
+        for mesh in model.scanned_meshes:
+            stat = _stat_or_none(mesh["path"]) if not mesh["path"] is None else None
+            mtime_ns, size = stat if not stat is None else (None, None)
+            file_type = None if mesh["path"] is None else os.path.splitext(mesh["path"])[1]
+            self.connection.execute(
+                "INSERT INTO meshes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (model.name, mesh["uri"], mesh["path"], file_type,
+                 " ".join(str(s) for s in mesh["scale"]), size, mtime_ns, mesh["n_references"]))
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def entries(self):
+        """
+        Returns the CatalogEntry of every valid model in the catalog, in the order of
+        the folder listing, without touching the models folder
+        """
+        meshes = {}
+        for row in self.connection.execute("SELECT * FROM meshes ORDER BY rowid"):
+            model_name, uri, path, file_type, scale, size, mtime_ns, n_references = row
+            scale = tuple(float(s) for s in scale.split(" "))
+            meshes.setdefault(model_name, []).append(
+                CatalogMesh(uri, path, file_type, scale, size, mtime_ns, n_references))
+        entries = []
+        for name, base_folder, config_file_path, sdf_file_path in self.connection.execute(
+                "SELECT name, base_folder, config_file_path, sdf_file_path FROM models "
+                "WHERE error IS NULL ORDER BY position"):
+            entries.append(CatalogEntry(name, base_folder, config_file_path, sdf_file_path, meshes.get(name, [])))
+        return entries
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def errors(self):
+        """Returns a dictionary with the error of every model of the folder that could not be loaded"""
+        return dict(self.connection.execute("SELECT name, error FROM models WHERE error IS NOT NULL"))
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def models(self, lazy=True, workers=None, executor="thread"):
+        """
+        Returns the models of the catalog as LazyGazeboBlenderModel handles built from the
+        entries, without touching the models folder (or as fully parsed GazeboBlenderModel
+        if lazy is False, parsed in a pool of workers if workers is given)
+        """
+        entries = self.entries()
+        if lazy:
+            return [LazyGazeboBlenderModel.from_catalog_entry(entry) for entry in entries]
+        models = []
+        for model, error in load_models([entry.base_folder for entry in entries], GazeboBlenderModel, workers, executor):
+            if error is None:
+                models.append(model)
+            else:
+                print(error)
+        return models
@@ -0,0 +1,167 @@
+"""
+Smooth, seeded deformation of meshes with gradient (Perlin) noise computed with numpy.
+Unlike bpy.ops.transform.vertex_random, close vertices move in a similar way, and the
+vertices on the borders of a tile are kept in place so that neighbouring tiles still match.
+"""
+# IMPORTS
+import numpy as np
+# GLOBAL VARIABLES
+# Directions to the middle of the edges of a cube, the usual gradients of 3D Perlin noise
+GRADIENTS = np.array([
+    [1, 1, 0], [-1, 1, 0], [1, -1, 0], [-1, -1, 0],
+    [1, 0, 1], [-1, 0, 1], [1, 0, -1], [-1, 0, -1],
+    [0, 1, 1], [0, -1, 1], [0, 1, -1], [0, -1, -1]], dtype=np.float32)
+CORNERS = [(i, j, k) for i in (0, 1) for j in (0, 1) for k in (0, 1)]
+# Number of points evaluated at once
+CHUNK_SIZE = 1 << 14
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _permutation_table(seed):
+    """Random permutation of 0..255, repeated twice to avoid the wrap around when hashing"""
+    permutation = np.random.default_rng(seed).permutation(256).astype(np.int64)
+    return np.concatenate([permutation, permutation])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _fade(t):
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _gradient_noise_chunk(points, permutation, gradient_tables):
+    """gradient_noise for a chunk of points small enough to stay in cache"""
+    cells = np.floor(points)
+    local = (points - cells).astype(np.float32)
+    cells = cells.astype(np.int32) & 255
+    lx, ly, lz = local[:, 0], local[:, 1], local[:, 2]
+    hash_x = [permutation[cells[:, 0] + i] for i in (0, 1)]
+    hash_y = [[permutation[hash_x[i] + cells[:, 1] + j] + cells[:, 2] for j in (0, 1)] for i in (0, 1)]
+    values = np.empty((3, 8, len(points)), dtype=np.float32)
+    for n_corner, (i, j, k) in enumerate(CORNERS):
+        corner_hash = permutation[hash_y[i][j] + k]
+        ox, oy, oz = lx - i, ly - j, lz - k
+        for axis in range(3):
+            gx, gy, gz = gradient_tables[axis]
+            values[axis, n_corner] = gx[corner_hash] * ox + gy[corner_hash] * oy + gz[corner_hash] * oz
+    fade = _fade(local)
+    fx, fy, fz = fade[:, 0], fade[:, 1], fade[:, 2]
+    # Interpolation along z, then y, then x (corners are ordered as i, j, k)
+    v = values[:, 0::2] + fz * (values[:, 1::2] - values[:, 0::2])
+    v = v[:, 0::2] + fy * (v[:, 1::2] - v[:, 0::2])
+    v = v[:, 0] + fx * (v[:, 1] - v[:, 0])
+    return v.T
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def gradient_noise(points, seed=0):
+    """
+    Evaluate 3D gradient noise at an (P, 3) array of points. Returns a (P, 3) array, with
+    an independent noise value for each axis, with values approximately in [-1, 1]
+    """
+    permutation = _permutation_table(seed)
+    # Each axis uses a different gradient for the same corner, the gradient of each
+    # corner hash is tabulated per axis and per component
+    gradient_tables = [GRADIENTS[permutation[np.arange(256) + axis * 85] % 12].T.copy() for axis in range(3)]
+    permutation = permutation.astype(np.int32)
+    points = np.asarray(points, dtype=np.float64)
+    noise = np.empty(points.shape, dtype=np.float64)
+    for start in range(0, len(points), CHUNK_SIZE):
+        noise[start:start + CHUNK_SIZE] = _gradient_noise_chunk(
+            points[start:start + CHUNK_SIZE], permutation, gradient_tables)
+    return noise
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def fractal_noise(points, seed=0, frequency=1.0, octaves=1, lacunarity=2.0, persistence=0.5):
+    """
+    Sum of several octaves of gradient noise. frequency can be a float or a value per axis
+    """
+    points = np.asarray(points, dtype=np.float64) * np.asarray(frequency, dtype=np.float64)
+    noise = np.zeros(points.shape, dtype=np.float64)
+    amplitude, total_amplitude = 1.0, 0.0
+    for octave in range(octaves):
+        noise += amplitude * gradient_noise(points * lacunarity**octave, seed=[seed, octave])
+        total_amplitude += amplitude
+        amplitude *= persistence
+    return noise / total_amplitude
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def border_weights(positions, falloff, axes=(0, 1), tolerance=1e-6, bounds=None):
+    """
+    Returns a (V,) array that is 0 for the vertices on the borders of the tile (the faces of
+    its bounding box along the given axes), grows smoothly to 1 at a distance falloff from
+    them, and is 1 further inside. bounds is (min, max) of the tile, the bounding box of
+    the positions if not given
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    weights = np.ones(len(positions), dtype=np.float64)
+    if len(positions) == 0:
+        return weights
+    if bounds is None:
+        bounds = (positions.min(axis=0), positions.max(axis=0))
+    lower, upper = np.asarray(bounds[0], dtype=np.float64), np.asarray(bounds[1], dtype=np.float64)
+    for axis in axes:
+        distance = np.minimum(positions[:, axis] - lower[axis], upper[axis] - positions[:, axis])
+        if falloff > 0:
+            t = np.clip((distance - tolerance) / falloff, 0, 1)
+            axis_weights = t * t * (3 - 2 * t)
+        else:
+            axis_weights = (distance > tolerance).astype(np.float64)
+        weights = np.minimum(weights, axis_weights)
+    return weights
+
+
+# CLASSES
+class NoiseDeformation:
+    """
+    Deformation of the vertices of a mesh with fractal gradient noise:
+    - amplitude: maximum displacement, a float or a value per axis
+    - frequency: frequency of the noise, a float or a value per axis
+    - border_falloff: distance from the borders of the tile in which the displacement fades out
+    - border_axes: axes along which the tile is repeated, the vertices in its borders are not moved.
+      The default (x and y) is for Z up positions, the TileVariationEngine rotates the positions
+      of Y up (.obj) meshes to Z up before deforming them
+    """
+
+    def __init__(self, amplitude=0.5, frequency=1.0, octaves=1, lacunarity=2.0, persistence=0.5,
+                 border_falloff=1.0, border_axes=(0, 1), border_tolerance=1e-6):
+        self.amplitude = np.broadcast_to(np.asarray(amplitude, dtype=np.float64), (3,))
+        self.frequency = np.broadcast_to(np.asarray(frequency, dtype=np.float64), (3,))
+        self.octaves = octaves
+        self.lacunarity = lacunarity
+        self.persistence = persistence
+        self.border_falloff = border_falloff
+        self.border_axes = border_axes
+        self.border_tolerance = border_tolerance
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of amplitude {self.amplitude.tolist()}"
+
+    def parameters(self):
+        """The arguments of the deformation, as a json serializable dictionary"""
+        return {"amplitude": self.amplitude.tolist(), "frequency": self.frequency.tolist(), "octaves": self.octaves,
+                "lacunarity": self.lacunarity, "persistence": self.persistence, "border_falloff": self.border_falloff,
+                "border_axes": list(self.border_axes), "border_tolerance": self.border_tolerance}
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def displacement(self, positions, seed, mask=None, bounds=None):
+        """
+        Returns the (V, 3) displacement of the vertices. Only the vertices in the mask are moved,
+        and the same seed always gives the same displacement
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        displacement = np.zeros(positions.shape, dtype=np.float64)
+        indices = np.arange(len(positions)) if mask is None else np.flatnonzero(mask)
+        if len(indices) == 0:
+            return displacement
+        if bounds is None:
+            bounds = (positions.min(axis=0), positions.max(axis=0))
+        weights = border_weights(positions[indices], self.border_falloff, self.border_axes, self.border_tolerance, bounds)
+        # The vertices on the borders do not move, so there is no need to compute their noise
+        indices, weights = indices[weights > 0], weights[weights > 0]
+        selected = positions[indices]
+        noise = fractal_noise(selected, seed, self.frequency, self.octaves, self.lacunarity, self.persistence)
+        displacement[indices] = noise * self.amplitude * weights[:, None]
+        return displacement
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def apply(self, positions, seed, mask=None, bounds=None):
+        """Returns the deformed positions"""
+        return np.asarray(positions, dtype=np.float64) + self.displacement(positions, seed, mask, bounds)
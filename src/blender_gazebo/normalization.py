@@ -0,0 +1,210 @@
+"""
+Normalization of the meshes of gazebo models without Blender: the <scale> of each mesh is baked
+into its vertices, and the .obj meshes are converted to .dae (with their materials), with the same
+rotation that the Blender pipeline gave them.
+The model.sdf files are updated to reference the new meshes with a scale of 1.
+The normalized models can be recorded in a run_manifest.RunManifest, so that normalizing the
+folder again skips the models that have not changed since.
+"""
+# IMPORTS
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import blender_gazebo.obj_io as obj_io
+import blender_gazebo.dae_io as dae_io
+from blender_gazebo.gazebo_blender_model import GazeboBlenderModel, GazeboModelMesh
+from blender_gazebo.mesh_geometry import MeshGeometry
+from blender_gazebo.mesh_backends import OBJ_IMPORT_ROTATION
+from blender_gazebo.run_manifest import RunManifest, MANIFEST_FILE_NAME, fingerprint_folder
+from blender_gazebo.change_tracking import ChangeManifest
+from blender_gazebo.instrumentation import traced
+# GLOBAL VARIABLES
+# Name of the normalization in the change manifests (change_tracking.ChangeManifest)
+STAGE_NAME = "normalization"
+# Rotation of 90 degrees around X, (x, y, z) -> (x, -z, y)
+Y_UP_TO_Z_UP = np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]], dtype=np.float64)
+# The Blender pipeline imported the .obj (which rotates it with OBJ_IMPORT_ROTATION), rotated it with
+# bpy.ops.transform.rotate(value=pi/2, orient_axis="X") (which turns clockwise for positive values,
+# (x, y, z) -> (x, z, -y)) and exported the result as .dae. The net rotation is the identity, the
+# converted .dae has the coordinates of the .obj file
+BLENDER_PIPELINE_ROTATION = np.array([[1, 0, 0], [0, 0, 1], [0, -1, 0]], dtype=np.float64)
+OBJ_TO_DAE_ROTATION = BLENDER_PIPELINE_ROTATION @ OBJ_IMPORT_ROTATION
+UNIT_SCALE = (1.0, 1.0, 1.0)
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def transform_geometry(geometry: MeshGeometry, scale=UNIT_SCALE, rotation=None):
+    """
+    Returns a copy of the geometry with the positions scaled and then rotated (rotation is
+    a 3x3 matrix). The normals are transformed with the inverse transpose and normalized
+    """
+    scale = np.asarray(scale, dtype=np.float64)
+    rotation = np.eye(3) if rotation is None else np.asarray(rotation, dtype=np.float64)
+    transformed = geometry.copy(positions=(geometry.positions * scale) @ rotation.T)
+    if len(transformed.normals) > 0:
+        normals = (transformed.normals / scale) @ rotation.T
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        transformed.normals = normals / np.where(lengths > 0, lengths, 1)
+    return transformed
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def scale_in_scene(geometry: MeshGeometry, scale, matrices, keep_transforms=True):
+    """
+    Returns a copy of a geometry read with dae_io.read_dae_with_transforms with the scale applied
+    in the scene, where each object is placed by its 4x4 matrix (which is how gazebo scales it).
+    If keep_transforms is True the positions stay relative to the nodes, so that the transforms
+    of the document still apply to them, otherwise the transforms are baked into the positions
+    """
+    scale_matrix = np.diag(list(scale) + [1.0])
+    positions = geometry.positions.copy()
+    normals = geometry.normals.copy()
+    objects = geometry.objects()
+    for n_object, ((first, last), matrix) in enumerate(zip(geometry.vertex_ranges, matrices)):
+        transform = scale_matrix @ matrix
+        if keep_transforms:
+            transform = np.linalg.inv(matrix) @ transform
+        positions[first:last] = positions[first:last] @ transform[:3, :3].T + transform[:3, 3]
+        _, first_face, last_face = objects[n_object]
+        object_normals = geometry.face_normals[geometry.face_offsets[first_face]:geometry.face_offsets[last_face]]
+        object_normals = np.unique(object_normals[object_normals >= 0])
+        if len(object_normals) > 0:
+            rotated = normals[object_normals] @ np.linalg.inv(transform[:3, :3])
+            lengths = np.linalg.norm(rotated, axis=1, keepdims=True)
+            normals[object_normals] = rotated / np.where(lengths > 0, lengths, 1)
+    transformed = geometry.copy(positions=positions)
+    transformed.normals = normals
+    return transformed
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def normalize_mesh(mesh: GazeboModelMesh, target_format=".dae", obj_rotation=OBJ_TO_DAE_ROTATION):
+    """
+    Bake the scale of a mesh into its vertices and save it in target_format (".dae" or ".obj"),
+    updating the references to it in the tree of the model.sdf (which is not written). When an
+    .obj is converted to .dae, it is rotated with obj_rotation (a 3x3 matrix, by default the same
+    rotation that the Blender pipeline applied, Y_UP_TO_Z_UP to turn a Y up mesh to Z up) and
+    the materials of its .mtl libraries are written in the .dae.
+    The original file is kept if the mesh changes of format. The recorded points of a mesh that
+    changes of format are remapped to the vertices of the new file (they are written by flush).
+    The scale of a .dae is applied in the scene, after the transforms of its nodes (so a
+    rotated node is scaled along the axes of the scene, as gazebo does), and the transforms
+    are baked into the vertices if it is converted to .obj, together with its <unit>, so the
+    .obj is in meters (a .dae that keeps its format keeps its unit).
+    Returns a description of what was done, None if the mesh was already normalized
+    """
+    target_format = target_format.lower()
+    assert target_format in (".dae", ".obj"), f"unknown format {target_format}"
+    file_type = mesh.file_type.lower()
+    scales = set(
+        UNIT_SCALE if element.find("scale") is None else tuple(float(i) for i in element.find("scale").text.split())
+        for element in mesh.xml_elements)
+    if len(scales) > 1:
+        raise Exception(f"{mesh.uri} is referenced with different scales {sorted(scales)}, it can not be baked")
+    scaled = mesh.scale != UNIT_SCALE
+    converted = file_type != target_format
+    if not scaled and not converted:
+        return None
+    rotation = None
+    if converted and file_type == ".obj" and not obj_rotation is None and not np.allclose(obj_rotation, np.eye(3)):
+        rotation = obj_rotation
+    if file_type == ".dae":
+        geometry, matrices = dae_io.read_dae_with_transforms(mesh.path)
+        # A converted .dae loses its <unit>, so its length in meters is baked with the scale
+        meter = dae_io.read_dae_asset(mesh.path)[0] if converted else 1.0
+        geometry = scale_in_scene(geometry, np.asarray(mesh.scale) * meter, matrices, keep_transforms=not converted)
+    else:
+        geometry = transform_geometry(mesh.load_geometry(), mesh.scale, rotation)
+    new_path = os.path.splitext(mesh.path)[0] + target_format
+    if not converted:
+        mesh.save_geometry(geometry)
+    elif target_format == ".dae":
+        materials = obj_io.read_material_libraries(geometry, mesh.folder) if file_type == ".obj" else None
+        dae_io.write_dae(geometry, new_path, materials)
+    else:
+        obj_io.write_obj(geometry, new_path)
+    if scaled:
+        mesh.update_scale_in_xml_references("1.0 1.0 1.0")
+    if converted:
+        mesh.update_uri_in_xml_references(os.path.splitext(mesh.uri)[0] + target_format)
+    points_unmatched = 0
+    if converted and mesh.mesh_info.has_points():
+        new_geometry = dae_io.read_dae(new_path) if target_format == ".dae" else obj_io.read_obj(new_path)
+        points_unmatched = mesh.mesh_info.remap_points(
+            geometry, new_geometry, default_name=os.path.splitext(mesh.file_name)[0])
+    return {"uri": mesh.uri, "scale": mesh.scale, "path": new_path, "rotated": not rotation is None,
+            "points_unmatched": points_unmatched}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+@traced()
+def normalize_model(model_path, target_format=".dae", obj_rotation=OBJ_TO_DAE_ROTATION):
+    """
+    Normalize all the meshes of the model in model_path and write its model.sdf. Returns a
+    dictionary with the model, the meshes that were changed and the errors that happened
+    """
+    report = {"model": model_path, "meshes": list(), "errors": list()}
+    try:
+        model = GazeboBlenderModel(model_path)
+    except Exception as e:
+        report["errors"].append(str(e))
+        return report
+    for mesh in model.meshes:
+        if mesh.path is None:
+            continue
+        try:
+            result = normalize_mesh(mesh, target_format, obj_rotation)
+            if not result is None:
+                report["meshes"].append(result)
+        except Exception as e:
+            report["errors"].append(f"{mesh.uri}: {e}")
+    model.flush()
+    return report
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def normalize_models(folder, target_format=".dae", obj_rotation=OBJ_TO_DAE_ROTATION, workers=None, manifest=None, model_names=None,
+                     changes=None):
+    """
+    Normalize every model in a folder (or only the ones in model_names), each one in a worker of
+    a pool of processes (of os.cpu_count() workers if not specified). Returns the reports of
+    normalize_model.
+    If a RunManifest is given (or True, for the manifest of the folder), the models normalized
+    without errors are recorded in it as they finish, and the ones that were already recorded
+    with the same parameters and have not changed since are skipped (their report has "skipped").
+    If a ChangeManifest is given as changes (or True, for the one of the folder), only the models
+    that changed since it last recorded them for the normalization are normalized, and they are
+    recorded in it once normalized
+    """
+    if manifest is True:
+        manifest = RunManifest(os.path.join(folder, MANIFEST_FILE_NAME))
+    elif manifest is False:
+        manifest = None
+    if changes is True:
+        changes = ChangeManifest(folder)
+    parameters = {"target_format": target_format,
+                  "obj_rotation": None if obj_rotation is None else np.asarray(obj_rotation, dtype=np.float64).tolist()}
+    if model_names is None:
+        model_names = [name for name in sorted(os.listdir(folder))
+                       if not name.startswith(".") and os.path.isdir(os.path.join(folder, name))]
+    paths = [os.path.join(folder, name) for name in model_names]
+    changed = None if changes is None else set(changes.changed_models(STAGE_NAME, model_names))
+    reports = {path: {"model": path, "meshes": list(), "errors": list(), "skipped": True} for path in paths
+               if (not changed is None and not os.path.basename(path) in changed) or
+               (not manifest is None and manifest.is_done(os.path.basename(path), parameters, folder))}
+    pending = [path for path in paths if not path in reports]
+
+    def finish(report):
+        reports[report["model"]] = report
+        if len(report["errors"]) > 0:
+            return
+        if not manifest is None:
+            manifest.record(os.path.basename(report["model"]), parameters,
+                            fingerprint_folder(report["model"], folder), meshes=len(report["meshes"]))
+        if not changes is None:
+            changes.record(STAGE_NAME, os.path.basename(report["model"]))
+    if workers == 1:
+        for path in pending:
+            finish(normalize_model(path, target_format, obj_rotation))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(normalize_model, path, target_format, obj_rotation) for path in pending]
+            for future in as_completed(futures):
+                finish(future.result())
+    return [reports[path] for path in paths]
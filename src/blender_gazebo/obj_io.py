@@ -0,0 +1,242 @@
+"""
+Reader and writer of .obj files to and from MeshGeometry instances, without Blender.
+The files are parsed in chunks of lines, so that big meshes are never held in memory
+as text, and every chunk is converted to numpy arrays at once.
+"""
+# IMPORTS
+import os
+import numpy as np
+from blender_gazebo.mesh_geometry import MeshGeometry
+# GLOBAL VARIABLES
+DEFAULT_CHUNK_LINES = 1 << 18
+WRITE_CHUNK_ROWS = 1 << 16
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _parse_floats(lines, prefix_length):
+    """
+    Convert a list of lines like 'v 1.0 2.0 3.0' into a 2D float array. All the lines
+    are expected to have the same number of values
+    """
+    values = np.array(" ".join(line[prefix_length:] for line in lines).split(), dtype=np.float64)
+    n_values = len(lines[0][prefix_length:].split())
+    if len(values) != n_values * len(lines):
+        raise Exception("Lines with different number of values in .obj file")
+    return values.reshape(len(lines), n_values)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _resolve_indices(indices, counts):
+    """
+    Convert the 1-based (or negative, relative) indices of an .obj file to 0-based indices.
+    counts is the number of elements defined before each index. Missing indices (0) become -1
+    """
+    return np.where(indices > 0, indices - 1, np.where(indices < 0, counts + indices, -1))
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _parse_faces(lines):
+    """
+    Convert a list of lines like 'f 1/1/1 2/2/1 3/3/1' into the vertex, uv and normal index
+    of every corner (1-based or negative as in the file, 0 when missing) and the size of each face
+    """
+    corners = [line[2:].split() for line in lines]
+    sizes = np.fromiter((len(c) for c in corners), dtype=np.int64, count=len(corners))
+    tokens = [token for c in corners for token in c]
+    first = tokens[0]
+    n_slashes = first.count("/")
+    n_double_slashes = len(tokens) if "//" in first else 0
+    text = " ".join(tokens)
+    if text.count("/") == n_slashes * len(tokens) and text.count("//") == n_double_slashes:
+        # Fast path, all the corners have the same format
+        n_fields = n_slashes + 1 - (1 if "//" in first else 0)
+        fields = np.array(text.replace("//", "/").replace("/", " ").split(), dtype=np.int64)
+        fields = fields.reshape(len(tokens), n_fields)
+        v = fields[:, 0]
+        vt = fields[:, 1] if n_fields == 3 or (n_fields == 2 and not "//" in first) else np.zeros_like(v)
+        vn = fields[:, -1] if n_fields == 3 or "//" in first else np.zeros_like(v)
+    else:
+        v, vt, vn = (np.zeros(len(tokens), dtype=np.int64) for _ in range(3))
+        for n, token in enumerate(tokens):
+            fields = token.split("/")
+            v[n] = int(fields[0])
+            if len(fields) > 1 and fields[1] != "":
+                vt[n] = int(fields[1])
+            if len(fields) > 2 and fields[2] != "":
+                vn[n] = int(fields[2])
+    return v, vt, vn, sizes
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def iter_obj_chunks(path, chunk_lines=DEFAULT_CHUNK_LINES):
+    """
+    Yields the lines of an .obj file in lists of at most chunk_lines lines
+    """
+    with open(path, "r") as f:
+        chunk = list()
+        for line in f:
+            chunk.append(line)
+            if len(chunk) == chunk_lines:
+                yield chunk
+                chunk = list()
+        if len(chunk) > 0:
+            yield chunk
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_obj(path, chunk_lines=DEFAULT_CHUNK_LINES):
+    """
+    Read an .obj file into a MeshGeometry
+    """
+    positions, normals, uvs = list(), list(), list()
+    face_vertices, face_uvs, face_normals, face_sizes = list(), list(), list(), list()
+    statements = list()
+    n_positions = n_normals = n_uvs = n_faces = 0
+    for chunk in iter_obj_chunks(path, chunk_lines):
+        kinds = [line[:3] for line in chunk]
+        v_lines = [line for line, kind in zip(chunk, kinds) if kind[:2] == "v "]
+        vt_lines = [line for line, kind in zip(chunk, kinds) if kind == "vt "]
+        vn_lines = [line for line, kind in zip(chunk, kinds) if kind == "vn "]
+        f_positions = [n for n, kind in enumerate(kinds) if kind[:2] == "f "]
+        # Number of elements defined before each face, needed for the negative indices
+        is_v = np.fromiter((kind[:2] == "v " for kind in kinds), dtype=np.int64, count=len(kinds))
+        is_vt = np.fromiter((kind == "vt " for kind in kinds), dtype=np.int64, count=len(kinds))
+        is_vn = np.fromiter((kind == "vn " for kind in kinds), dtype=np.int64, count=len(kinds))
+        for n, line in enumerate(chunk):
+            if kinds[n][:2] in ("v ", "f ") or kinds[n] in ("vt ", "vn "):
+                continue
+            stripped = line.strip()
+            if stripped != "":
+                statements.append((n_faces + int(np.searchsorted(f_positions, n)), stripped))
+        if len(v_lines) > 0:
+            positions.append(_parse_floats(v_lines, 2))
+        if len(vt_lines) > 0:
+            uvs.append(_parse_floats(vt_lines, 3))
+        if len(vn_lines) > 0:
+            normals.append(_parse_floats(vn_lines, 3))
+        if len(f_positions) > 0:
+            v, vt, vn, sizes = _parse_faces([chunk[n] for n in f_positions])
+            line_of_corner = np.repeat(np.array(f_positions), sizes)
+            face_vertices.append(_resolve_indices(v, n_positions + np.cumsum(is_v)[line_of_corner]))
+            face_uvs.append(_resolve_indices(vt, n_uvs + np.cumsum(is_vt)[line_of_corner]))
+            face_normals.append(_resolve_indices(vn, n_normals + np.cumsum(is_vn)[line_of_corner]))
+            face_sizes.append(sizes)
+        n_positions += len(v_lines)
+        n_uvs += len(vt_lines)
+        n_normals += len(vn_lines)
+        n_faces += len(f_positions)
+    positions = np.concatenate(positions) if len(positions) > 0 else np.zeros((0, 3))
+    vertex_colors = None
+    if positions.shape[1] == 6:
+        positions, vertex_colors = positions[:, :3], np.ascontiguousarray(positions[:, 3:])
+    elif positions.shape[1] != 3:
+        positions = positions[:, :3]
+    face_sizes = np.concatenate(face_sizes) if len(face_sizes) > 0 else np.zeros(0, dtype=np.int64)
+    return MeshGeometry(
+        positions,
+        normals=np.concatenate(normals) if len(normals) > 0 else None,
+        uvs=np.concatenate(uvs) if len(uvs) > 0 else None,
+        face_vertices=np.concatenate(face_vertices) if len(face_vertices) > 0 else None,
+        face_uvs=np.concatenate(face_uvs) if len(face_uvs) > 0 else None,
+        face_normals=np.concatenate(face_normals) if len(face_normals) > 0 else None,
+        face_offsets=np.concatenate([[0], np.cumsum(face_sizes)]),
+        statements=statements,
+        vertex_colors=vertex_colors)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _format_rows(prefix, array):
+    """
+    Yields the lines for the rows of a float array, in chunks. The shortest representation
+    that converts back to the same float is used, so that no precision is lost
+    """
+    for start in range(0, len(array), WRITE_CHUNK_ROWS):
+        rows = array[start:start + WRITE_CHUNK_ROWS].astype(str).tolist()
+        yield "".join(prefix + " ".join(row) + "\n" for row in rows)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _format_corners(geometry: MeshGeometry):
+    """Returns an array of strings with the 'v/vt/vn' text of every corner of every face"""
+    corners = (geometry.face_vertices + 1).astype(str)
+    has_uvs = np.any(geometry.face_uvs >= 0)
+    has_normals = np.any(geometry.face_normals >= 0)
+    if has_uvs or has_normals:
+        uvs = np.where(geometry.face_uvs >= 0, (geometry.face_uvs + 1).astype(str), "")
+        corners = np.char.add(np.char.add(corners, "/"), uvs)
+    if has_normals:
+        normals = np.where(geometry.face_normals >= 0, (geometry.face_normals + 1).astype(str), "")
+        corners = np.char.add(np.char.add(corners, "/"), normals)
+    return corners.tolist()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_obj(geometry: MeshGeometry, path):
+    """
+    Write a MeshGeometry into an .obj file. All the vertex data is written first, followed
+    by the faces, with the rest of statements (objects, materials...) before the face they precede
+    """
+    positions = geometry.positions
+    if not geometry.vertex_colors is None:
+        positions = np.concatenate([positions, geometry.vertex_colors], axis=1)
+    corners = _format_corners(geometry)
+    offsets = geometry.face_offsets.tolist()
+    statements = sorted(geometry.statements, key=lambda statement: statement[0])
+    with open(path, "w") as f:
+        # The statements before the first face that are not about materials or objects go first
+        n_statement = 0
+        while n_statement < len(statements) and statements[n_statement][0] == 0 \
+                and statements[n_statement][1].split(" ", 1)[0] in ("#", "mtllib"):
+            f.write(statements[n_statement][1] + "\n")
+            n_statement += 1
+        for text in _format_rows("v ", positions):
+            f.write(text)
+        for text in _format_rows("vt ", geometry.uvs):
+            f.write(text)
+        for text in _format_rows("vn ", geometry.normals):
+            f.write(text)
+        lines = list()
+        for face in range(geometry.n_faces):
+            while n_statement < len(statements) and statements[n_statement][0] == face:
+                lines.append(statements[n_statement][1])
+                n_statement += 1
+            lines.append("f " + " ".join(corners[offsets[face]:offsets[face + 1]]))
+            if len(lines) >= WRITE_CHUNK_ROWS:
+                f.write("\n".join(lines) + "\n")
+                lines = list()
+        lines.extend(statement for _, statement in statements[n_statement:])
+        if len(lines) > 0:
+            f.write("\n".join(lines) + "\n")
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_mtl(path):
+    """
+    Read a .mtl file into a dictionary {material name: {keyword: values}}, with the values
+    of each statement as a list of strings. The paths of the texture maps are made absolute
+    """
+    materials, material = dict(), None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            parts = line.strip().split(None, 1)
+            if len(parts) == 0 or parts[0].startswith("#"):
+                continue
+            keyword, values = parts[0], parts[1] if len(parts) > 1 else ""
+            if keyword == "newmtl":
+                material = materials.setdefault(values.strip(), dict())
+            elif not material is None:
+                if keyword.startswith("map_"):
+                    # The options of the map go before the file name, which is the last value
+                    material[keyword] = [os.path.join(os.path.dirname(path), values.split()[-1])]
+                else:
+                    material[keyword] = values.split()
+    return materials
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def read_material_libraries(geometry: MeshGeometry, folder):
+    """
+    Read the .mtl files of the 'mtllib' statements of a geometry read from an .obj in folder.
+    Returns the materials of all of them, the libraries that do not exist are ignored
+    """
+    materials = dict()
+    for _, line in geometry.statements:
+        if line.split(" ", 1)[0] != "mtllib":
+            continue
+        for library in line.split()[1:]:
+            library_path = os.path.join(folder, library)
+            if os.path.isfile(library_path):
+                for name, material in read_mtl(library_path).items():
+                    materials.setdefault(name, material)
+    return materials
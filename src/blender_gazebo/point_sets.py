@@ -0,0 +1,228 @@
+"""
+Compact storage of sets of vertex indices (the recorded ground and upper points of the meshes).
+Each set is a sorted array of unique uint32 indices, and the sets of a mesh are saved together
+in a .npz file, from which each of them is only read when it is first used.
+"""
+# IMPORTS
+import os
+import json
+import zipfile
+import numpy as np
+from collections.abc import MutableMapping
+# GLOBAL VARIABLES
+POINTS_TYPES = ("UPPER_POINTS", "GROUND_POINTS")
+KEY_SEPARATOR = ":"
+NPZ_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# CLASSES
+class PointSet:
+    """
+    Set of vertex indices, stored as a sorted array of unique uint32. It can be used
+    where a list of indices is expected (it can be iterated and converted to an array)
+    and supports the set operations |, &, - and ^, and complement
+    """
+    __slots__ = ("indices",)
+
+    def __init__(self, indices=(), assume_sorted=False):
+        indices = np.asarray(indices if not isinstance(indices, PointSet) else indices.indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = indices.astype(np.uint32, copy=False).ravel()
+        self.indices = indices if assume_sorted else np.unique(indices)
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {len(self)} points"
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.indices.tolist()})"
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return iter(self.indices.tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.indices if dtype is None else self.indices.astype(dtype)
+
+    def __contains__(self, index):
+        position = np.searchsorted(self.indices, index)
+        return position < len(self.indices) and self.indices[position] == index
+
+    def __eq__(self, other):
+        if isinstance(other, PointSet):
+            return np.array_equal(self.indices, other.indices)
+        return NotImplemented
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __xor__(self, other):
+        return PointSet(np.setxor1d(self.indices, PointSet(other).indices, assume_unique=True), assume_sorted=True)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def union(self, other):
+        return PointSet(np.union1d(self.indices, PointSet(other).indices), assume_sorted=True)
+
+    def intersection(self, other):
+        return PointSet(np.intersect1d(self.indices, PointSet(other).indices, assume_unique=True), assume_sorted=True)
+
+    def difference(self, other):
+        return PointSet(np.setdiff1d(self.indices, PointSet(other).indices, assume_unique=True), assume_sorted=True)
+
+    def complement(self, n_vertices):
+        """The indices in [0, n_vertices) that are not in the set"""
+        return PointSet.from_mask(~self.to_mask(n_vertices))
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def to_mask(self, n_vertices):
+        """Boolean array of n_vertices elements, True for the indices in the set"""
+        mask = np.zeros(n_vertices, dtype=bool)
+        mask[self.indices[self.indices < n_vertices]] = True
+        return mask
+
+    @classmethod
+    def from_mask(cls, mask):
+        return cls(np.flatnonzero(mask), assume_sorted=True)
+
+    def tolist(self):
+        return self.indices.tolist()
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class PointsFile:
+    """
+    Contents of a .npz points file, that is only read (all at once, closing the file
+    afterwards) the first time that it is needed
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._arrays = None
+
+    def arrays(self, points_type):
+        """Returns a dictionary {object_name: array} with the points of a type"""
+        if self._arrays is None:
+            self._arrays = {points_type: dict() for points_type in POINTS_TYPES}
+            with np.load(self.path) as npz_file:
+                for key in npz_file.files:
+                    key_type, object_name = key.split(KEY_SEPARATOR, 1)
+                    self._arrays.setdefault(key_type, dict())[object_name] = npz_file[key]
+        return self._arrays[points_type]
+
+    def check_keys(self):
+        """
+        Reads only the names of the entries of the file (not the arrays), raising if it is not a
+        zip file or if an entry is not named points_type + KEY_SEPARATOR + object_name
+        """
+        with zipfile.ZipFile(self.path) as npz_file:
+            for name in npz_file.namelist():
+                if not name.endswith(".npy") or not KEY_SEPARATOR in name:
+                    raise ValueError(f"Unexpected entry {name} in points file {self.path}")
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class LazyPointSets(MutableMapping):
+    """
+    Dictionary {object_name: PointSet} of one type of points of a .npz points file,
+    the file is not read until the dictionary is used
+    """
+
+    def __init__(self, points_file: PointsFile, points_type):
+        self._points_file = points_file
+        self._points_type = points_type
+        self._sets = None
+
+    def _load(self):
+        if self._sets is None:
+            arrays = self._points_file.arrays(self._points_type)
+            self._sets = {name: PointSet(array, assume_sorted=True) for name, array in arrays.items()}
+        return self._sets
+
+    @property
+    def is_loaded(self):
+        return not self._sets is None
+
+    def __getitem__(self, object_name):
+        return self._load()[object_name]
+
+    def __setitem__(self, object_name, indices):
+        self._load()[object_name] = PointSet(indices)
+
+    def __delitem__(self, object_name):
+        del self._load()[object_name]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._points_file.path}, {self._points_type})"
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def to_point_sets(points):
+    """Convert a dictionary {object_name: indices} into a dictionary {object_name: PointSet}"""
+    return {object_name: PointSet(indices) for object_name, indices in points.items()}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def combine_selections(selection_a, selection_b, operation="union"):
+    """
+    Combine two selections ({object_name: indices}) object by object with a set
+    operation: "union", "intersection" or "difference"
+    """
+    combined = dict()
+    for object_name in list(selection_a.keys()) + [k for k in selection_b.keys() if not k in selection_a]:
+        a = PointSet(selection_a.get(object_name, ()))
+        b = PointSet(selection_b.get(object_name, ()))
+        combined[object_name] = getattr(a, operation)(b)
+    return combined
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def load_points_file(path):
+    """
+    Read a .npz points file into a dictionary {points_type: {object_name: PointSet}},
+    the sets are read lazily (only the names of the entries are checked now)
+    """
+    points_file = PointsFile(path)
+    points_file.check_keys()
+    return {points_type: LazyPointSets(points_file, points_type) for points_type in POINTS_TYPES}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def save_points_file(path, data):
+    """Save a dictionary {points_type: {object_name: indices}} as a .npz points file"""
+    arrays = dict()
+    for points_type, points in data.items():
+        for object_name, indices in points.items():
+            arrays[points_type + KEY_SEPARATOR + object_name] = PointSet(indices).indices
+    # The file is written with a fixed date in its entries (np.savez uses the current time), so that
+    # saving the same points gives the same bytes and the writes of unchanged files can be skipped
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED) as npz_file:
+        for key, array in arrays.items():
+            with npz_file.open(zipfile.ZipInfo(key + ".npy", date_time=NPZ_DATE_TIME), "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, array, allow_pickle=False)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def load_json_points_file(path):
+    """Read an _info.json file (the old format) into a dictionary {points_type: {object_name: PointSet}}"""
+    with open(path, "r") as f:
+        data = json.load(f)
+    return {points_type: to_point_sets(data.get(points_type, {})) for points_type in POINTS_TYPES}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def points_file_path(json_path):
+    """Path of the .npz points file that replaces an _info.json file"""
+    return os.path.splitext(json_path)[0] + ".npz"
@@ -0,0 +1,120 @@
+"""
+Manifest of the work done by a batch run (variations, normalization...), so that a run that was
+interrupted can be started again and only does the work that is missing. Each completed unit of
+work (a variation of a model, the normalization of a model) is appended to a json lines file as
+soon as it finishes, with the parameters that produced it and the fingerprints (size, modification
+time and sha1) of its output files. A unit is done if it has an entry with the same parameters
+and its outputs have not changed since. The last entry of a key is the one that counts.
+"""
+# IMPORTS
+import os
+import json
+import time
+import hashlib
+from blender_gazebo.file_operations import write_bytes_atomically
+# GLOBAL VARIABLES
+MANIFEST_FILE_NAME = ".manifest.jsonl"
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def hash_file(path):
+    hasher = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 ** 2), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def fingerprint_files(paths, base_folder):
+    """{path relative to base_folder: [size, mtime_ns, sha1]} of the files"""
+    fingerprints = dict()
+    for path in paths:
+        stat = os.stat(path)
+        fingerprints[os.path.relpath(path, base_folder)] = [stat.st_size, stat.st_mtime_ns, hash_file(path)]
+    return fingerprints
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def fingerprint_folder(folder, base_folder=None):
+    """Fingerprints of all the files of a folder (hidden files excluded), relative to base_folder (the folder if None)"""
+    paths = list()
+    for subfolder, subfolders, files in os.walk(folder):
+        subfolders[:] = [name for name in subfolders if not name.startswith(".")]
+        paths.extend(os.path.join(subfolder, name) for name in files if not name.startswith("."))
+    return fingerprint_files(sorted(paths), folder if base_folder is None else base_folder)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def fingerprints_match(fingerprints, base_folder):
+    """
+    True if the files still have the recorded contents. Only the files whose size or modification
+    time changed are hashed again, so checking outputs that were not touched only needs a stat
+    """
+    for relative_path, (size, mtime_ns, sha1) in fingerprints.items():
+        path = os.path.join(base_folder, relative_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size != size:
+            return False
+        if stat.st_mtime_ns != mtime_ns and hash_file(path) != sha1:
+            return False
+    return True
+
+
+# CLASSES
+class RunManifest:
+    """
+    Completed work of a run, kept in a json lines file:
+    - is_done: if a key was completed with the same parameters and its outputs are unchanged
+    - record: add a completed key, with its parameters, its outputs and any other information
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = dict()
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line can be incomplete if the run was killed while writing it
+                        continue
+                    self.entries[entry["key"]] = entry
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.path} with {len(self.entries)} entries"
+
+    def __contains__(self, key):
+        return key in self.entries
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def get(self, key):
+        return self.entries.get(key)
+
+    def is_done(self, key, parameters, base_folder):
+        """parameters must be json serializable, the outputs are checked relative to base_folder"""
+        entry = self.entries.get(key)
+        if entry is None or entry["parameters"] != json.loads(json.dumps(parameters)):
+            return False
+        return fingerprints_match(entry["outputs"], base_folder)
+
+    def record(self, key, parameters, outputs, **information):
+        """
+        Append the entry of a completed key, outputs are fingerprints (see fingerprint_files).
+        The line is written to disk before returning, so it is kept if the run is killed afterwards
+        """
+        entry = {"key": key, "parameters": parameters, "outputs": outputs, "time": time.time()}
+        entry.update(information)
+        line = json.dumps(entry) + "\n"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[key] = json.loads(line)
+        return entry
+
+    def compact(self):
+        """Rewrite the file with only the last entry of each key"""
+        write_bytes_atomically(self.path, "".join(json.dumps(entry) + "\n" for entry in self.entries.values()).encode())
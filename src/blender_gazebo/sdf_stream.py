@@ -0,0 +1,218 @@
+"""
+Streaming access to the meshes referenced by .sdf files, and targeted edition of them.
+iter_sdf_meshes goes through the file with iterparse and only keeps in memory the
+element that is being read, instead of the whole tree. SdfTextEditor changes the mesh
+uris, scales and the model name by replacing only their text in the file, so the rest
+of the file (comments, formatting, other elements) is kept exactly as it was.
+"""
+# IMPORTS
+import re
+from xml.etree.ElementTree import iterparse, ParseError
+from xml.sax.saxutils import escape, unescape
+from blender_gazebo.file_operations import write_bytes_atomically
+# GLOBAL VARIABLES
+PARENT_TAGS = ("link", "visual", "collision")
+COMMENT_REGEX = re.compile(r"<!--.*?-->", re.DOTALL)
+MESH_REGEX = re.compile(r"<mesh\b[^>]*>(.*?)</mesh>", re.DOTALL)
+URI_REGEX = re.compile(r"<uri\b[^>]*>\s*(.*?)\s*</uri>", re.DOTALL)
+SCALE_REGEX = re.compile(r"<scale\b[^>]*>\s*(.*?)\s*</scale>", re.DOTALL)
+MODEL_NAME_REGEX = re.compile(r"""<model\b[^>]*?\bname\s*=\s*(["'])(.*?)\1""", re.DOTALL)
+# Entities that unescape does not know by default
+QUOTE_ENTITIES = {"&quot;": '"', "&apos;": "'"}
+
+# CLASSES
+class MeshReference:
+    """
+    A <mesh> element of an .sdf file: its uri, its scale (a tuple, or None if the element
+    has no scale) and the names of the link and the visual or collision that contain it
+    """
+    __slots__ = ("uri", "scale", "link", "visual", "collision")
+
+    def __init__(self, uri, scale, link=None, visual=None, collision=None):
+        self.uri = uri
+        self.scale = scale
+        self.link = link
+        self.visual = visual
+        self.collision = collision
+
+    def __str__(self):
+        return f"Mesh reference: {self.uri}"
+
+    @property
+    def kind(self):
+        """'visual', 'collision' or None"""
+        if not self.visual is None:
+            return "visual"
+        if not self.collision is None:
+            return "collision"
+        return None
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _iter_sdf_meshes(path):
+    parents = list()
+    for event, element in iterparse(path, events=("start", "end")):
+        if event == "start":
+            if element.tag in PARENT_TAGS:
+                parents.append((element.tag, element.get("name")))
+            continue
+        if element.tag == "mesh":
+            uri_element = element.find("uri")
+            scale_element = element.find("scale")
+            names = {tag: name for tag, name in parents}
+            yield MeshReference(
+                None if uri_element is None else (uri_element.text or "").strip(),
+                None if scale_element is None else tuple(float(i) for i in scale_element.text.split()),
+                names.get("link"), names.get("visual"), names.get("collision"))
+        elif element.tag in PARENT_TAGS:
+            parents.pop()
+            # Nothing inside a link, visual or collision is needed once it has been read
+            element.clear()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def iter_sdf_meshes(path):
+    """
+    Yields a MeshReference for every <mesh> element of an .sdf file, reading it
+    incrementally. If the file can not be parsed, the fixes of load_xml_file are tried
+    """
+    from blender_gazebo.gazebo_blender_model import try_to_fix_xml_file
+    n_yielded = 0
+    try:
+        for reference in _iter_sdf_meshes(path):
+            n_yielded += 1
+            yield reference
+    except ParseError:
+        if n_yielded > 0 or not try_to_fix_xml_file(path):
+            raise Exception(f"Problem reading xml file for {path} and no fix available")
+        yield from _iter_sdf_meshes(path)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _outside_comments(matches, comments):
+    """Filter out the regex matches that start inside a comment"""
+    return [m for m in matches if not any(start <= m.start() < end for start, end in comments)]
+
+
+class SdfTextEditor:
+    """
+    Edits the mesh uris, the mesh scales and the model name of an .sdf file by
+    replacing only their text. The meshes are indexed in the order of the file.
+    The file is scanned once, and the edits are applied to its text when it is saved.
+    The values are given and returned unescaped, they are escaped when written in the text
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "r", encoding="utf-8") as f:
+            self.original_text = f.read()
+        self._scan()
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.path}"
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _scan(self):
+        """
+        Find the spans of the text of the uri and the scale of every <mesh> element that
+        is not commented out (None if the element does not have them), and of the model name
+        """
+        text = self.original_text
+        comments = [m.span() for m in COMMENT_REGEX.finditer(text)]
+        self._mesh_spans = list()
+        for mesh in _outside_comments(MESH_REGEX.finditer(text), comments):
+            spans = list()
+            for regex in (URI_REGEX, SCALE_REGEX):
+                match = regex.search(text, mesh.start(1), mesh.end(1))
+                spans.append(None if match is None else match.span(1))
+            self._mesh_spans.append(tuple(spans))
+        model_names = _outside_comments(MODEL_NAME_REGEX.finditer(text), comments)
+        self._model_name_span = model_names[0].span(2) if len(model_names) > 0 else None
+        self._model_name_quote = model_names[0].group(1) if len(model_names) > 0 else None
+        self._edits = dict()
+
+    def _value(self, span):
+        """Unescaped value of a span, with the edits applied"""
+        if span is None:
+            return None
+        if span in self._edits:
+            return unescape(self._edits[span], QUOTE_ENTITIES)
+        return unescape(self.original_text[span[0]:span[1]], QUOTE_ENTITIES)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def mesh_values(self):
+        """List of (uri, scale text) of every mesh, the values are None if the mesh does not have them"""
+        return [(self._value(uri_span), self._value(scale_span)) for uri_span, scale_span in self._mesh_spans]
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _set(self, span, new_value, quote=None):
+        """
+        Replace the text of a span with new_value escaped, for an attribute delimited by quote
+        if it is given, or for the text of an element. Returns False if there is no span
+        """
+        if span is None:
+            return False
+        entities = dict() if quote is None else {quote: "&quot;" if quote == '"' else "&apos;"}
+        self._edits[span] = escape(new_value, entities)
+        return True
+
+    def set_mesh_uri(self, mesh_number, new_uri):
+        return self._set(self._mesh_spans[mesh_number][0], new_uri)
+
+    def set_mesh_scale(self, mesh_number, new_scale):
+        """The new_scale should be entered as a string of "f f f", meshes without scale are not changed"""
+        return self._set(self._mesh_spans[mesh_number][1], new_scale)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def replace_uri(self, old_uri, new_uri):
+        """Change every reference to old_uri into new_uri. Returns the number of references changed"""
+        n_changed = 0
+        for mesh_number, (uri, _) in enumerate(self.mesh_values()):
+            if uri == old_uri:
+                n_changed += self.set_mesh_uri(mesh_number, new_uri)
+        return n_changed
+
+    def replace_scale(self, uri, new_scale):
+        """Change the scale of every reference to uri. Returns the number of references changed"""
+        n_changed = 0
+        for mesh_number, (mesh_uri, _) in enumerate(self.mesh_values()):
+            if mesh_uri == uri:
+                n_changed += self.set_mesh_scale(mesh_number, new_scale)
+        return n_changed
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def set_model_name(self, new_name):
+        """Change the name attribute of the first <model> element"""
+        if not self._set(self._model_name_span, new_name, quote=self._model_name_quote):
+            raise Exception(f"No model name in {self.path}")
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @property
+    def text(self):
+        """The text of the file with the edits applied"""
+        pieces, position = list(), 0
+        for (start, end), new_value in sorted(self._edits.items()):
+            pieces.append(self.original_text[position:start])
+            pieces.append(new_value)
+            position = end
+        pieces.append(self.original_text[position:])
+        return "".join(pieces)
+
+    @property
+    def changed(self):
+        return any(self.original_text[start:end] != value for (start, end), value in self._edits.items())
+
+    def save(self, path=None):
+        """
+        Write the edited text to path (the original file if None) atomically, only if something
+        changed. Returns True if the file was written
+        """
+        if path is None:
+            path = self.path
+        if path == self.path and not self.changed:
+            return False
+        text = self.text
+        written = write_bytes_atomically(path, text.encode("utf-8"))
+        if path == self.path:
+            self.original_text = text
+            self._scan()
+        return written
@@ -0,0 +1,219 @@
+"""
+Generation of random variations of tile models without Blender.
+The mesh of the base model is read only once, and the positions of a batch of variations
+are kept in a (N, V, 3) array. The displacements of each variation come from its own seed
+so that any of them can be generated again on its own.
+The variations that are generated can be recorded in a run_manifest.RunManifest, so that
+running the generation again only generates the variations that are missing or outdated.
+"""
+# IMPORTS
+import os
+import random
+import hashlib
+import numpy as np
+from blender_gazebo.gazebo_blender_model import GazeboBlenderModel, GazeboModelMesh, copy_model_with_different_name
+from blender_gazebo.noise_deformation import NoiseDeformation
+from blender_gazebo.mesh_backends import OBJ_IMPORT_ROTATION
+from blender_gazebo.file_operations import break_hardlink
+from blender_gazebo.run_manifest import RunManifest, MANIFEST_FILE_NAME, hash_file, fingerprint_folder
+from blender_gazebo.instrumentation import count, traced
+# GLOBAL VARIABLES
+MODIFICATION_TYPES = {0: "only_upper", 1: "only_ground", 3: "all_points"}
+POINTS_OF_MODIFICATION_TYPE = {
+    "only_upper": ("UPPER_POINTS",),
+    "only_ground": ("GROUND_POINTS",),
+    "all_points": ("UPPER_POINTS", "GROUND_POINTS"),
+}
+# Maximum size in bytes of the array with the positions of a batch of variations
+BATCH_MEMORY = 1 << 28
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def variation_rng(seed, variation_number, mesh_number=0):
+    """
+    Random generator of a mesh of a single variation, only depends on the seed
+    of the run, the variation number and the mesh number
+    """
+    return np.random.default_rng([seed, variation_number, mesh_number])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def random_vertex_offsets(rng, n_vertices, magnitude, n_sequential):
+    """
+    Equivalent to applying n_sequential times bpy.ops.transform.vertex_random(offset=magnitude):
+    every time, each vertex is moved in a random direction a random distance between 0 and magnitude
+    """
+    directions = rng.normal(size=(n_sequential, n_vertices, 3))
+    directions /= np.maximum(np.linalg.norm(directions, axis=2, keepdims=True), 1e-12)
+    distances = rng.uniform(0, magnitude, size=(n_sequential, n_vertices, 1))
+    return np.sum(directions * distances, axis=0)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def generate_model_variations(model_path, destination_folder, n_variations, modification_type="only_upper",
+                              magnitude=0.5, sequential_modifications=4, seed=None, deformation=None, resume=True):
+    """
+    Generate the variations of the model in model_path with a TileVariationEngine. deformation is
+    a dictionary with the arguments of a NoiseDeformation. If resume is True, the variations are
+    recorded in the manifest of destination_folder and the ones already generated are skipped.
+    Meant to be run as a task of a worker_pool.WorkerPool, so it only takes and returns json
+    serializable values
+    """
+    model = GazeboBlenderModel(model_path)
+    engine = TileVariationEngine(model, modification_type, magnitude=magnitude,
+                                 sequential_modifications=sequential_modifications,
+                                 deformation=None if deformation is None else NoiseDeformation(**deformation))
+    seed, copied_models = engine.generate(n_variations, destination_folder, seed=seed, manifest=resume)
+    return {"model": model.name, "seed": seed, "variations": [copied_model.name for copied_model in copied_models]}
+
+
+# CLASSES
+class TileVariationEngine:
+    """
+    Generates variations of a model by moving at random the points of its meshes recorded
+    in their BlenderMeshInfo (ground points, upper points or both). By default the points are
+    moved as with bpy.ops.transform.vertex_random, if a deformation (a NoiseDeformation) is
+    given, it is used instead. The deformation is computed in the Z up frame in which Blender
+    shows the meshes (.obj files are rotated with OBJ_IMPORT_ROTATION), so its axes are the
+    same for every file type
+    """
+
+    def __init__(self, model: GazeboBlenderModel, modification_type="only_upper", magnitude=0.5,
+                 sequential_modifications=4, batch_size=None, deformation=None):
+        assert isinstance(model, GazeboBlenderModel)
+        assert modification_type in POINTS_OF_MODIFICATION_TYPE, f"unknown modification type {modification_type}"
+        self.model = model
+        self.modification_type = modification_type
+        self.magnitude = magnitude
+        self.sequential_modifications = sequential_modifications
+        self.batch_size = batch_size
+        self.deformation = deformation
+        self._source_hash = None
+        self.geometries = list()
+        self.masks = list()
+        self.rotations = list()
+        for mesh in model.meshes:
+            assert isinstance(mesh, GazeboModelMesh)
+            geometry = mesh.load_geometry()
+            self.rotations.append(OBJ_IMPORT_ROTATION if str.lower(mesh.file_type) == ".obj" else np.eye(3))
+            mask = np.zeros(geometry.n_vertices, dtype=bool)
+            for points_type in POINTS_OF_MODIFICATION_TYPE[modification_type]:
+                mask |= geometry.mask_from_selection(mesh.mesh_info.data[points_type])
+            self.geometries.append(geometry)
+            self.masks.append(mask)
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.model.name}"
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @property
+    def source_hash(self):
+        """Hash of the model.sdf, the meshes and the recorded points of the model, the variations change with them"""
+        if self._source_hash is None:
+            hasher = hashlib.sha1()
+            paths = [self.model.sdf_file_path]
+            for mesh in self.model.meshes:
+                paths += [mesh.path, mesh.mesh_info.points_file_path, mesh.mesh_info.blender_data_file_path]
+            for path in paths:
+                if os.path.isfile(path):
+                    hasher.update(f"{os.path.basename(path)}:{hash_file(path)}\n".encode())
+            self._source_hash = hasher.hexdigest()
+        return self._source_hash
+
+    def parameters(self, seed):
+        """Everything that determines the variations, as recorded in the manifests"""
+        return {"seed": seed, "modification_type": self.modification_type, "magnitude": self.magnitude,
+                "sequential_modifications": self.sequential_modifications,
+                "deformation": None if self.deformation is None else dict(self.deformation.parameters(), frame="z_up"),
+                "source": self.source_hash}
+
+    def recorded_seed(self, manifest: RunManifest):
+        """The seed of the last variation of the model recorded in the manifest, None if there is none"""
+        entries = [entry for entry in manifest.entries.values() if entry.get("model") == self.model.name]
+        return max(entries, key=lambda entry: entry["time"])["parameters"]["seed"] if len(entries) > 0 else None
+
+    def _batch_size(self, n_vertices):
+        if not self.batch_size is None:
+            return self.batch_size
+        return max(1, BATCH_MEMORY // max(1, n_vertices * 3 * 8))
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @traced()
+    def variation_positions(self, mesh_number, seed, variation_numbers):
+        """
+        Returns a (N, V, 3) array with the positions of the vertices of a mesh for
+        each of the given variations. The positions are batched, but the displacements are
+        computed one variation at a time: each one is drawn from its own random stream
+        (variation_rng) so that any variation can be generated again on its own, with the
+        same result as in a batch
+        """
+        geometry = self.geometries[mesh_number]
+        mask = self.masks[mesh_number]
+        selected = np.flatnonzero(mask)
+        positions = np.broadcast_to(geometry.positions, (len(variation_numbers),) + geometry.positions.shape).copy()
+        for n, variation_number in enumerate(variation_numbers):
+            rng = variation_rng(seed, variation_number, mesh_number)
+            if self.deformation is None:
+                positions[n, selected] += random_vertex_offsets(
+                    rng, len(selected), self.magnitude, self.sequential_modifications)
+            else:
+                # The displacement is computed in the Z up frame and rotated back to the frame of the file
+                rotation = self.rotations[mesh_number]
+                displacement = self.deformation.displacement(geometry.positions @ rotation.T, int(rng.integers(2**31)), mask)
+                positions[n] += displacement @ rotation
+        count("vertices_touched", len(selected) * len(variation_numbers))
+        return positions
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    @traced()
+    def write_variation(self, new_name, destination_folder, mesh_positions):
+        """
+        Copy the model with a new name and write the given positions (one (V, 3) array
+        per mesh) to the meshes of the copy. Returns the copied model.
+        The meshes are hardlinked instead of copied, as they are written again straight away:
+        save_geometry replaces them with a new file, and the ones whose contents do not change
+        get their own copy, so the copy never shares its meshes with the base model
+        """
+        copied_model = copy_model_with_different_name(self.model, new_name, destination_folder=destination_folder,
+                                                      link_meshes=True)
+        for mesh, geometry, positions in zip(copied_model.meshes, self.geometries, mesh_positions):
+            if not mesh.save_geometry(geometry.copy(positions=positions)):
+                break_hardlink(mesh.path)
+        return copied_model
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def generate(self, n_variations, destination_folder, seed=None, name_format="{name}_mod_{n}", manifest=None):
+        """
+        Generate n_variations copies of the model in destination_folder, each one with its
+        meshes modified. Returns the seed used (to be able to repeat the run) and the list of copies.
+        If a RunManifest is given (or True, for the manifest of destination_folder), each variation
+        is recorded in it when written, and the variations that it has with the same parameters
+        and unchanged files are not generated again (nor returned). If seed is None, the seed
+        recorded in the manifest is used, so an interrupted run continues with the same seed
+        """
+        if manifest is True:
+            manifest = RunManifest(os.path.join(destination_folder, MANIFEST_FILE_NAME))
+        elif manifest is False:
+            manifest = None
+        if seed is None and not manifest is None:
+            seed = self.recorded_seed(manifest)
+        if seed is None:
+            seed = random.randint(0, 2**31)
+        names = [name_format.format(name=self.model.name, n=n) for n in range(n_variations)]
+        pending = list(range(n_variations))
+        if not manifest is None:
+            parameters = self.parameters(seed)
+            pending = [n for n in pending if not manifest.is_done(names[n], parameters, destination_folder)]
+        n_vertices = max([g.n_vertices for g in self.geometries], default=1)
+        batch_size = self._batch_size(n_vertices)
+        copied_models = list()
+        for start in range(0, len(pending), batch_size):
+            variation_numbers = pending[start:start + batch_size]
+            batch = [self.variation_positions(m, seed, variation_numbers) for m in range(len(self.geometries))]
+            for n, variation_number in enumerate(variation_numbers):
+                copied_model = self.write_variation(
+                    names[variation_number], destination_folder, [positions[n] for positions in batch])
+                copied_models.append(copied_model)
+                if not manifest is None:
+                    manifest.record(names[variation_number], parameters,
+                                    fingerprint_folder(copied_model.base_folder, destination_folder),
+                                    model=self.model.name, variation=variation_number)
+        return seed, copied_models
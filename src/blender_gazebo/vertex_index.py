@@ -0,0 +1,155 @@
+"""
+Spatial index of the vertices of a mesh, a uniform grid of cells over their positions.
+It is used to find the nearest vertex of a mesh to any point, which allows to remap the recorded
+points of a mesh (BlenderMeshInfo) when the mesh is exported again and its vertices change of order,
+and to select vertices by region (below a height, inside a box or a sphere) without Blender.
+"""
+# IMPORTS
+import itertools
+import numpy as np
+from blender_gazebo.mesh_geometry import MeshGeometry
+# GLOBAL VARIABLES
+# Maximum number of candidate pairs compared at once by VertexGrid.nearest
+CHUNK_SIZE = 1 << 18
+
+# CLASSES
+class VertexGrid:
+    """
+    Uniform grid over a (V, 3) array of positions. The vertices are sorted by cell, and each
+    occupied cell keeps the range of its vertices, so that the vertices around a point are found
+    by looking only at the cells around it.
+    - cell_size: side of the cells, by default about two vertices per cell for a surface mesh
+    """
+
+    def __init__(self, positions, cell_size=None):
+        self.positions = np.ascontiguousarray(positions, dtype=np.float64).reshape(-1, 3)
+        n_vertices = len(self.positions)
+        if n_vertices == 0:
+            self.origin, extent = np.zeros(3), np.zeros(3)
+        else:
+            self.origin = self.positions.min(axis=0)
+            extent = self.positions.max(axis=0) - self.origin
+        if cell_size is None:
+            cell_size = 2 * extent.max() / np.sqrt(max(n_vertices, 1))
+        self.cell_size = max(float(cell_size), 1e-9)
+        cells = self.cells_of(self.positions)
+        self.shape = cells.max(axis=0) + 1 if n_vertices > 0 else np.ones(3, dtype=np.int64)
+        keys = self._keys(cells)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys, self.starts, counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.ends = self.starts + counts
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {len(self.positions)} vertices in {len(self.keys)} cells of {self.cell_size:g}"
+
+    def __len__(self):
+        return len(self.positions)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def cells_of(self, points):
+        return np.floor((np.asarray(points, dtype=np.float64).reshape(-1, 3) - self.origin) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cells):
+        return (cells[:, 0] * self.shape[1] + cells[:, 1]) * self.shape[2] + cells[:, 2]
+
+    def _cell_ranges(self, cells):
+        """(starts, ends) in self.order of the vertices of each cell, empty for the cells without vertices"""
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        keys = self._keys(np.where(inside[:, None], cells, 0))
+        positions = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        found = inside & (len(self.keys) > 0)
+        found[found] = self.keys[positions[found]] == keys[found]
+        starts = np.where(found, self.starts[positions] if len(self.keys) > 0 else 0, 0)
+        ends = np.where(found, self.ends[positions] if len(self.keys) > 0 else 0, 0)
+        return starts, ends
+
+    def _candidates(self, cells):
+        """Pairs (number of the cell in cells, vertex index) of the vertices in each of the cells"""
+        starts, ends = self._cell_ranges(cells)
+        counts = ends - starts
+        owners = np.repeat(np.arange(len(cells)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return owners, self.order[np.repeat(starts, counts) + offsets]
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def nearest(self, points, tolerance):
+        """
+        Index of the nearest vertex to each point, and its distance. The points without any vertex
+        closer than tolerance get the index -1 (and the distance inf). The search only looks at the
+        cells within tolerance, so it should be small compared to the size of the mesh
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        best_distances = np.full(len(points), np.inf)
+        best_indices = np.full(len(points), -1, dtype=np.int64)
+        reach = int(np.ceil(tolerance / self.cell_size))
+        cell_offsets = np.array(list(itertools.product(range(-reach, reach + 1), repeat=3)), dtype=np.int64)
+        points_per_chunk = max(1, CHUNK_SIZE // len(cell_offsets))
+        for start in range(0, len(points), points_per_chunk):
+            chunk = np.arange(start, min(start + points_per_chunk, len(points)))
+            cells = self.cells_of(points[chunk])
+            for cell_offset in cell_offsets:
+                owners, vertices = self._candidates(cells + cell_offset)
+                if len(vertices) == 0:
+                    continue
+                queries = chunk[owners]
+                distances = np.linalg.norm(self.positions[vertices] - points[queries], axis=1)
+                np.minimum.at(best_distances, queries, distances)
+                best = distances == best_distances[queries]
+                best_indices[queries[best]] = vertices[best]
+        too_far = best_distances > tolerance
+        best_indices[too_far] = -1
+        best_distances[too_far] = np.inf
+        return best_indices, best_distances
+
+    def in_box(self, minimum, maximum):
+        """Sorted indices of the vertices inside the box (inclusive) between the corners minimum and maximum"""
+        minimum = np.asarray(minimum, dtype=np.float64)
+        maximum = np.asarray(maximum, dtype=np.float64)
+        low = np.maximum(self.cells_of(np.maximum(minimum, self.origin))[0], 0)
+        high = np.minimum(self.cells_of(np.minimum(maximum, self.origin + self.shape * self.cell_size))[0], self.shape - 1)
+        if np.any(high < low) or len(self.positions) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if np.prod(high - low + 1) > len(self.keys):
+            # The box covers more cells than there are occupied ones, so it is faster to check every vertex
+            candidates = np.arange(len(self.positions))
+        else:
+            cells = np.stack(np.meshgrid(*[np.arange(l, h + 1) for l, h in zip(low, high)], indexing="ij"), axis=-1)
+            _, candidates = self._candidates(cells.reshape(-1, 3))
+        positions = self.positions[candidates]
+        inside = np.all((positions >= minimum) & (positions <= maximum), axis=1)
+        return np.sort(candidates[inside])
+
+    def in_sphere(self, center, radius):
+        """Sorted indices of the vertices at a distance of center of at most radius"""
+        center = np.asarray(center, dtype=np.float64)
+        candidates = self.in_box(center - radius, center + radius)
+        return candidates[np.linalg.norm(self.positions[candidates] - center, axis=1) <= radius]
+
+    def below(self, height, axis=2):
+        """Sorted indices of the vertices with the coordinate axis lower than height"""
+        return np.flatnonzero(self.positions[:, axis] < height)
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def remap_selection(old_geometry: MeshGeometry, new_geometry: MeshGeometry, selection, tolerance=1e-4,
+                    old_positions=None, default_name=None, grid=None):
+    """
+    Translate a selection ({object_name: local vertex indices}, as stored in a BlenderMeshInfo) of
+    old_geometry to new_geometry, which has (about) the same vertices in a different order.
+    Each vertex of the new geometry is selected if the nearest vertex of the old geometry is
+    selected. old_positions can give the positions of the old vertices in the coordinates of the
+    new geometry, if it was transformed. The objects of the new geometry without name get the
+    name of the only object of the selection, or default_name.
+    Returns the new selection and the number of new vertices without an old vertex within tolerance
+    """
+    old_mask = old_geometry.mask_from_selection(selection)
+    if grid is None:
+        grid = VertexGrid(old_geometry.positions if old_positions is None else old_positions)
+    nearest, _ = grid.nearest(new_geometry.positions, tolerance)
+    matched = nearest >= 0
+    new_mask = np.zeros(new_geometry.n_vertices, dtype=bool)
+    new_mask[matched] = old_mask[nearest[matched]]
+    if len(selection) == 1 and len(new_geometry.objects()) == 1:
+        default_name = next(iter(selection.keys()))
+    return new_geometry.selection_from_mask(new_mask, default_name), int(np.count_nonzero(~matched))
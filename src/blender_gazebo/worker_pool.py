@@ -0,0 +1,301 @@
+"""
+Pool of worker processes to run the batch operations of the package (normalization, variations...)
+on many models at once, one model per task. Each worker is a long lived process, started with a
+configurable command: headless Blender ("blender -b -P worker_pool.py") for the tasks that need bpy,
+or a python interpreter ("python -m blender_gazebo.worker_pool") for the rest, and for testing.
+The pool sends the tasks to the workers through their stdin and reads the results from their
+stdout, one json message per line. A task is the name of a function ("module:function") and its
+arguments, and its result must be json serializable. The tasks that raise an exception, make their
+worker die or take longer than task_timeout are retried (in a new worker if it died), and are
+reported as failed after the retries, without stopping the rest of the batch.
+"""
+# IMPORTS
+import os
+import sys
+import json
+import time
+import queue
+import importlib
+import threading
+import traceback
+import subprocess
+if __name__ == "__main__":
+    # When run as a script (blender -b -P worker_pool.py) the package may not be in the path of the interpreter
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blender_gazebo.instrumentation import span, count
+# GLOBAL VARIABLES
+# The messages of the protocol are the lines of stdout that start with the prefix, the rest of the
+# output of the workers (Blender and the tasks print to stdout) is forwarded to the stderr of the pool
+MESSAGE_PREFIX = "@blender_gazebo@ "
+WORKER_SCRIPT = os.path.abspath(__file__)
+PACKAGE_PARENT_FOLDER = os.path.dirname(os.path.dirname(WORKER_SCRIPT))
+
+# CLASSES
+class WorkerDied(Exception):
+    pass
+
+
+class TaskResult:
+    """Outcome of a task: its result if ok, or the error of the last attempt"""
+    __slots__ = ("index", "task", "args", "ok", "result", "error", "attempts", "worker", "seconds")
+
+    def __init__(self, index, task, args):
+        self.index = index
+        self.task = task
+        self.args = args
+        self.ok = False
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.worker = None
+        self.seconds = 0.0
+
+    def __str__(self):
+        state = "ok" if self.ok else f"failed after {self.attempts} attempts: {self.error}"
+        return f"{self.task}({self.args}) {state}"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class _Worker:
+    """A worker process, with a thread that reads its stdout"""
+
+    def __init__(self, number, command, env, quiet):
+        self.number = number
+        self.quiet = quiet
+        self.messages = queue.Queue()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env,
+                                        text=True, bufsize=1)
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def __str__(self):
+        return f"worker {self.number} (pid {self.process.pid})"
+
+    def _read(self):
+        for line in self.process.stdout:
+            if line.startswith(MESSAGE_PREFIX):
+                self.messages.put(json.loads(line[len(MESSAGE_PREFIX):]))
+            elif not self.quiet and line.strip():
+                print(f"[worker {self.number}] {line}", end="", file=sys.stderr)
+        self.messages.put(None)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def send(self, message):
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise WorkerDied(f"{self} exited with code {self.process.poll()}")
+
+    def receive(self, timeout=None):
+        """The next message of the worker, raises queue.Empty after timeout seconds and WorkerDied if it exits"""
+        message = self.messages.get(timeout=timeout)
+        if message is None:
+            raise WorkerDied(f"{self} exited with code {self.process.wait()}")
+        return message
+
+    def close(self, timeout=10):
+        try:
+            self.send({"command": "exit"})
+            self.process.stdin.close()
+            self.process.wait(timeout=timeout)
+        except (WorkerDied, OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+# -----------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------
+
+
+class WorkerPool:
+    """
+    Pool of persistent worker processes started with command (python_worker_command() by default,
+    see blender_worker_command):
+    - run: run a task for each item of a list of arguments, returns a TaskResult for each of them
+    - workers: number of processes, one per cpu if None. They are started when first needed and
+      kept until close is called (the pool can be used as a context manager)
+    - retries: number of times that a failed task is repeated
+    - task_timeout: seconds after which a task is considered failed and its worker is killed
+    """
+
+    def __init__(self, command=None, workers=None, retries=1, task_timeout=None, startup_timeout=300, env=None,
+                 quiet=False):
+        self.command = python_worker_command() if command is None else list(command)
+        self.n_workers = os.cpu_count() if workers is None else workers
+        self.retries = retries
+        self.task_timeout = task_timeout
+        self.startup_timeout = startup_timeout
+        self.env = worker_environment(env)
+        self.quiet = quiet
+        self._workers = [None] * self.n_workers
+
+    def __str__(self):
+        return f"{self.__class__.__name__} of {self.n_workers} workers running {' '.join(self.command)}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        for number, worker in enumerate(self._workers):
+            if not worker is None:
+                worker.close()
+                self._workers[number] = None
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def _get_worker(self, number):
+        """The worker in a slot of the pool, started if there is none or the previous one died"""
+        worker = self._workers[number]
+        if not worker is None and worker.process.poll() is None:
+            return worker
+        with span("WorkerPool.start_worker", worker=number):
+            worker = _Worker(number, self.command, self.env, self.quiet)
+            try:
+                worker.receive(timeout=self.startup_timeout)
+            except queue.Empty:
+                worker.kill()
+                raise WorkerDied(f"{worker} did not start in {self.startup_timeout} s")
+        self._workers[number] = worker
+        return worker
+
+    def _run_task(self, number, result):
+        """Run one attempt of a task in the worker of a slot, filling result"""
+        result.attempts += 1
+        result.worker = number
+        start = time.perf_counter()
+        try:
+            worker = self._get_worker(number)
+            with span("WorkerPool.task", task=result.task, worker=number):
+                worker.send({"id": result.index, "task": result.task, "args": result.args})
+                reply = worker.receive(timeout=self.task_timeout)
+            result.ok = reply["ok"]
+            result.result = reply.get("result")
+            result.error = reply.get("error")
+        except queue.Empty:
+            self._workers[number].kill()
+            result.ok, result.error = False, f"timeout after {self.task_timeout} s"
+        except (WorkerDied, OSError) as e:
+            result.ok, result.error = False, str(e)
+        result.seconds += time.perf_counter() - start
+
+    def _serve(self, number, pending, results):
+        """Take tasks from the queue until it is empty, putting back the failed ones that can be retried"""
+        while True:
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            result = results[index]
+            self._run_task(number, result)
+            if not result.ok:
+                count("tasks_failed")
+                if result.attempts <= self.retries:
+                    pending.put(index)
+
+#- - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    def run(self, task, items):
+        """
+        Run the function task ("module:function") once for each item of items, which are the
+        keyword arguments (dict) or the positional arguments (list) of each call.
+        Returns the list of TaskResult, in the order of items
+        """
+        results = [TaskResult(index, task, args) for index, args in enumerate(items)]
+        pending = queue.Queue()
+        for index in range(len(results)):
+            pending.put(index)
+        threads = [threading.Thread(target=self._serve, args=(number, pending, results), daemon=True)
+                   for number in range(min(self.n_workers, len(results)))]
+        with span("WorkerPool.run", task=task, n_tasks=len(results)):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def map(self, task, items):
+        """Like run, but returns the results of the tasks, raising an exception if any of them failed"""
+        results = self.run(task, items)
+        failed = [result for result in results if not result.ok]
+        if len(failed) > 0:
+            raise Exception(f"{len(failed)} of {len(results)} tasks failed, the first one: {failed[0]}")
+        return [result.result for result in results]
+
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def python_worker_command(python=sys.executable):
+    """Command of a worker that runs the tasks in a python interpreter"""
+    return [python, "-m", "blender_gazebo.worker_pool"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def blender_worker_command(blender="blender"):
+    """Command of a worker that runs the tasks in a headless Blender, where bpy can be used"""
+    return [blender, "-b", "--factory-startup", "--python-exit-code", "1", "-P", WORKER_SCRIPT]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def worker_environment(env=None):
+    """Environment of the workers, with the package in their PYTHONPATH"""
+    env = dict(os.environ if env is None else env)
+    python_path = env.get("PYTHONPATH", "")
+    if not PACKAGE_PARENT_FOLDER in python_path.split(os.pathsep):
+        env["PYTHONPATH"] = os.pathsep.join(path for path in (PACKAGE_PARENT_FOLDER, python_path) if path)
+    return env
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def summarize_results(results):
+    """Dictionary with the number of tasks, the failed ones (with their errors) and the total time"""
+    failed = [result for result in results if not result.ok]
+    return {"tasks": len(results), "succeeded": len(results) - len(failed),
+            "failed": [{"args": result.args, "error": result.error, "attempts": result.attempts} for result in failed],
+            "retried": sum(1 for result in results if result.attempts > 1),
+            "task_seconds": sum(result.seconds for result in results)}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def resolve_task(task):
+    """The function of a task name, "module:function" """
+    module_name, _, function_name = task.partition(":")
+    function = importlib.import_module(module_name)
+    for attribute in function_name.split("."):
+        function = getattr(function, attribute)
+    return function
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _send_message(output, message):
+    # The line starts with a new line in case the task printed something without ending it
+    output.write(f"\n{MESSAGE_PREFIX}{json.dumps(message, default=str)}\n")
+    output.flush()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def worker_main(input=sys.stdin, output=sys.stdout):
+    """Loop of a worker: read a task from each line of input, run it and write its result"""
+    _send_message(output, {"ready": True, "pid": os.getpid()})
+    for line in input:
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        if message.get("command") == "exit":
+            break
+        try:
+            function = resolve_task(message["task"])
+            args = message["args"]
+            result = function(**args) if isinstance(args, dict) else function(*args)
+            reply = {"id": message["id"], "ok": True, "result": result}
+        except Exception as e:
+            reply = {"id": message["id"], "ok": False, "error": f"{type(e).__name__}: {e}",
+                     "traceback": traceback.format_exc()}
+        _send_message(output, reply)
+
+
+if __name__ == "__main__":
+    worker_main()
@@ -0,0 +1,54 @@
+"""
+Shared fixtures of the tests. The package is imported from src, so that the tests
+run from a checkout without installing it
+"""
+# IMPORTS
+import os
+import sys
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from blender_gazebo.mesh_geometry import MeshGeometry
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def grid_geometry(n=20, size=10.0, height=0.0, quads=True):
+    """Square patch of n x n vertices on the XY plane, z = height * sin(x) * cos(y)"""
+    x, y = np.meshgrid(np.linspace(0, size, n), np.linspace(0, size, n), indexing="ij")
+    positions = np.stack([x, y, height * np.sin(x) * np.cos(y)], axis=-1).reshape(-1, 3)
+    indices = np.arange(n * n).reshape(n, n)
+    a, b, c, d = indices[:-1, :-1], indices[1:, :-1], indices[1:, 1:], indices[:-1, 1:]
+    if quads:
+        face_vertices = np.stack([a, b, c, d], axis=-1).reshape(-1)
+        face_offsets = np.arange(0, len(face_vertices) + 1, 4)
+    else:
+        face_vertices = np.stack([a, b, c, a, c, d], axis=-1).reshape(-1)
+        face_offsets = None
+    return MeshGeometry(positions, face_vertices=face_vertices, face_offsets=face_offsets, statements=[(0, "o Tile")])
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_model(folder, name, mesh_file="tile.obj", mesh_text=None, sdf_text=None, config=True):
+    """Write a gazebo model with a mesh used as visual and collision, returns its folder"""
+    model_folder = os.path.join(folder, name)
+    os.makedirs(os.path.join(model_folder, "meshes"))
+    if config:
+        with open(os.path.join(model_folder, "model.config"), "w") as f:
+            f.write(f"<?xml version='1.0'?>\n<model><name>{name}</name></model>\n")
+    uri = f"model://{name}/meshes/{mesh_file}"
+    if sdf_text is None:
+        sdf_text = (f"<?xml version='1.0'?>\n<sdf version='1.6'>\n  <model name='{name}'>\n    <link name='link'>\n"
+                    f"      <visual name='visual'><geometry><mesh><uri>{uri}</uri></mesh></geometry></visual>\n"
+                    f"      <collision name='collision'><geometry><mesh><uri>{uri}</uri></mesh></geometry></collision>\n"
+                    f"    </link>\n  </model>\n</sdf>\n")
+    with open(os.path.join(model_folder, "model.sdf"), "w") as f:
+        f.write(sdf_text)
+    if not mesh_text is None:
+        with open(os.path.join(model_folder, "meshes", mesh_file), "w") as f:
+            f.write(mesh_text)
+    return model_folder
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def obj_text():
+    return ("o Tile\nv 0 0 0\nv 1 0 0\nv 1 1 0\nv 0 1 0.5\nvt 0 0\nvt 1 0\nvt 1 1\nvn 0 0 1\n"
+            "usemtl mat\ns off\nf 1/1/1 2/2/1 3/3/1\nf 1/1/1 3/3/1 4/3/1\n")
@@ -0,0 +1,66 @@
+"""Simplification of meshes and generation of the collision meshes of the models"""
+# IMPORTS
+import os
+import numpy as np
+from blender_gazebo import dae_io, obj_io
+from blender_gazebo.decimation import border_vertices, decimate_geometry, decimate_model, hausdorff_distance
+from conftest import grid_geometry, write_model
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_borders_are_preserved():
+    geometry = grid_geometry(n=30, height=0.5)
+    decimated = decimate_geometry(geometry, target_faces=len(geometry.triangles()) // 4)
+    assert decimated.n_faces <= len(geometry.triangles()) // 4 + 10
+    border = geometry.positions[border_vertices(geometry.n_vertices, geometry.triangles())]
+    decimated_border = decimated.positions[border_vertices(decimated.n_vertices, decimated.triangles())]
+    assert {tuple(p) for p in border} == {tuple(p) for p in decimated_border}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_flat_mesh_has_no_error():
+    geometry = grid_geometry(n=20)
+    decimated = decimate_geometry(geometry, target_faces=10)
+    assert decimated.n_faces < len(geometry.triangles()) // 2
+    hausdorff, _ = hausdorff_distance(geometry, decimated)
+    assert hausdorff < 1e-9
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_max_error_bounds_hausdorff():
+    geometry = grid_geometry(n=40, height=0.5)
+    max_error = 0.02
+    decimated = decimate_geometry(geometry, target_faces=1, max_error=max_error)
+    assert decimated.n_faces < len(geometry.triangles())
+    hausdorff, _ = hausdorff_distance(geometry, decimated)
+    assert hausdorff <= max_error
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_dae_node_transforms_are_baked(tmp_path):
+    """The _collision.dae has nodes without transforms, so those of the source nodes must be in its positions"""
+    geometry = grid_geometry(n=10, quads=False)
+    model_folder = write_model(str(tmp_path), "tile", mesh_file="tile.dae")
+    mesh_path = os.path.join(model_folder, "meshes", "tile.dae")
+    dae_io.write_dae(geometry, mesh_path, meter=0.01)
+    with open(mesh_path) as f:
+        text = f.read().replace('type="NODE">', 'type="NODE"><translate>0 0 5</translate>', 1)
+    with open(mesh_path, "w") as f:
+        f.write(text)
+    report = decimate_model(model_folder, collision_ratio=0.5)
+    assert report["errors"] == []
+    collision_path = os.path.join(model_folder, "meshes", "tile_collision.dae")
+    collision, matrices = dae_io.read_dae_with_transforms(collision_path)
+    for matrix in matrices:
+        np.testing.assert_allclose(matrix, np.eye(4))
+    np.testing.assert_allclose(collision.positions[:, 2], 5.0)
+    assert dae_io.read_dae_asset(collision_path) == (0.01, "Z_UP")
+    with open(os.path.join(model_folder, "model.sdf")) as f:
+        assert "model://tile/meshes/tile_collision.dae" in f.read()
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_obj_collision_mesh(tmp_path):
+    geometry = grid_geometry(n=10, height=0.5)
+    model_folder = write_model(str(tmp_path), "tile")
+    obj_io.write_obj(geometry, os.path.join(model_folder, "meshes", "tile.obj"))
+    report = decimate_model(model_folder, collision_ratio=0.25)
+    assert report["errors"] == []
+    collision = obj_io.read_obj(os.path.join(model_folder, "meshes", "tile_collision.obj"))
+    assert collision.n_faces <= int(np.ceil(0.25 * len(geometry.triangles()))) + 10
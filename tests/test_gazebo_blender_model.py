@@ -0,0 +1,34 @@
+"""Loading of the models of a folder"""
+# IMPORTS
+import os
+from blender_gazebo.gazebo_blender_model import models_from_folder
+from conftest import write_model
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def write_library(folder, obj_text):
+    for n in range(3):
+        write_model(folder, f"tile_{n}", mesh_text=obj_text)
+    write_model(folder, "missing_mesh")
+    write_model(folder, "no_config", mesh_text=obj_text, config=False)
+    write_model(folder, "broken_sdf", mesh_text=obj_text, sdf_text="<sdf><model name='broken_sdf'><link>")
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def model_names(models):
+    return sorted(os.path.basename(model.base_folder) for model in models)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_lazy_and_eager_models_match(tmp_path, obj_text):
+    write_library(str(tmp_path), obj_text)
+    eager = models_from_folder(str(tmp_path), lazy=False)
+    lazy = models_from_folder(str(tmp_path), lazy=True)
+    assert model_names(eager) == model_names(lazy) == ["tile_0", "tile_1", "tile_2"]
+    for model in lazy:
+        assert [mesh.path for mesh in model.meshes] == [os.path.join(model.base_folder, "meshes", "tile.obj")]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_models_in_a_pool_keep_the_order(tmp_path, obj_text):
+    write_library(str(tmp_path), obj_text)
+    serial = models_from_folder(str(tmp_path), lazy=False)
+    pooled = models_from_folder(str(tmp_path), lazy=False, workers=4)
+    assert [model.base_folder for model in serial] == [model.base_folder for model in pooled]
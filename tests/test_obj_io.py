@@ -0,0 +1,41 @@
+"""Reading and writing of .obj files"""
+# IMPORTS
+import numpy as np
+from blender_gazebo import obj_io
+from blender_gazebo.mesh_geometry import MeshGeometry
+from conftest import grid_geometry
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def assert_same_geometry(a: MeshGeometry, b: MeshGeometry):
+    np.testing.assert_allclose(a.positions, b.positions)
+    np.testing.assert_allclose(a.normals, b.normals)
+    np.testing.assert_allclose(a.uvs, b.uvs)
+    for name in ("face_vertices", "face_uvs", "face_normals", "face_offsets"):
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+    assert a.statements == b.statements
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_read_obj(tmp_path, obj_text):
+    path = tmp_path / "tile.obj"
+    path.write_text(obj_text)
+    geometry = obj_io.read_obj(str(path))
+    assert (geometry.n_vertices, geometry.n_faces) == (4, 2)
+    np.testing.assert_array_equal(geometry.face_vertices, [0, 1, 2, 0, 2, 3])
+    np.testing.assert_array_equal(geometry.face_uvs, [0, 1, 2, 0, 2, 2])
+    assert [line for _, line in geometry.statements] == ["o Tile", "usemtl mat", "s off"]
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_round_trip(tmp_path, obj_text):
+    path = tmp_path / "tile.obj"
+    path.write_text(obj_text)
+    geometry = obj_io.read_obj(str(path))
+    obj_io.write_obj(geometry, str(tmp_path / "copy.obj"))
+    assert_same_geometry(geometry, obj_io.read_obj(str(tmp_path / "copy.obj")))
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_round_trip_in_chunks(tmp_path):
+    geometry = grid_geometry(n=30, height=0.5)
+    obj_io.write_obj(geometry, str(tmp_path / "grid.obj"))
+    read = obj_io.read_obj(str(tmp_path / "grid.obj"), chunk_lines=97)
+    assert_same_geometry(geometry, read)
@@ -0,0 +1,42 @@
+"""Nearest vertex search of vertex_index, compared with a brute force search"""
+# IMPORTS
+import numpy as np
+from blender_gazebo.vertex_index import VertexGrid, remap_selection
+from conftest import grid_geometry
+
+# FUNCTIONS
+#-----------------------------------------------------------------------------------------------------------------------------------
+def brute_force_nearest(positions, points, tolerance):
+    distances = np.linalg.norm(points[:, None, :] - positions[None, :, :], axis=2)
+    nearest = distances.argmin(axis=1)
+    best = distances[np.arange(len(points)), nearest]
+    return np.where(best <= tolerance, nearest, -1), best
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_nearest_matches_brute_force():
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-1, 1, (500, 3))
+    points = np.concatenate([positions + rng.normal(0, 0.01, positions.shape), rng.uniform(-1.5, 1.5, (200, 3))])
+    tolerance = 0.1
+    nearest, distances = VertexGrid(positions).nearest(points, tolerance)
+    expected, expected_distances = brute_force_nearest(positions, points, tolerance)
+    np.testing.assert_array_equal(nearest >= 0, expected >= 0)
+    found = expected >= 0
+    np.testing.assert_allclose(distances[found], expected_distances[found])
+    assert np.all(np.isinf(distances[~found]))
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def test_remap_selection_of_shuffled_vertices():
+    old_geometry = grid_geometry(n=15, height=0.5)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(old_geometry.n_vertices)
+    new_positions = old_geometry.positions[order] + rng.normal(0, 1e-6, old_geometry.positions.shape)
+    inverse = np.argsort(order)
+    new_geometry = old_geometry.copy(new_positions)
+    new_geometry.face_vertices = inverse[old_geometry.face_vertices]
+    old_mask = old_geometry.positions[:, 2] > 0.2
+    selection = old_geometry.selection_from_mask(old_mask)
+    new_selection, n_unmatched = remap_selection(old_geometry, new_geometry, selection)
+    assert n_unmatched == 0
+    expected_mask = old_mask[brute_force_nearest(old_geometry.positions, new_geometry.positions, 1e-4)[0]]
+    np.testing.assert_array_equal(new_geometry.mask_from_selection(new_selection), expected_mask)